@@ -0,0 +1,103 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+"""
+Startup benchmark for AutoCheckBJMF.
+
+Runs `python -X importtime` against the entry modules in fresh interpreters and
+checks the cumulative import time against a budget. It also fails if any of the
+lazily imported dependencies (requests, bs4, schedule) are loaded at import time,
+which would regress the cold start of the one-shot CI / container path.
+
+Usage:
+    python bench_startup.py [--budget-ms 80] [--runs 5] [--module core --module main]
+"""
+
+DEFAULT_MODULES = ["core", "main"]
+DEFAULT_BUDGET_MS = 80.0
+# 这些依赖必须延迟到真正使用时才导入
+LAZY_MODULES = {"requests", "bs4", "schedule"}
+
+
+def measure_import(module, cwd):
+    """
+    Import a module in a fresh interpreter with -X importtime.
+
+    Args:
+        module (str): The module to import.
+        cwd (str): The working directory (repository root).
+
+    Returns:
+        tuple: (cumulative_us, imported_names, rows) where rows is a list of
+               (self_us, cumulative_us, name) for every imported module.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            _, self_us, cumulative_us, name = [p.strip() for p in line.replace("import time:", "|").split("|")]
+            rows.append((int(self_us), int(cumulative_us), name))
+        except ValueError:
+            continue
+
+    cumulative = next((c for _, c, name in rows if name == module), 0)
+    imported = {name.split(".")[0] for _, _, name in rows}
+    return cumulative, imported, rows
+
+
+def main():
+    """
+    Run the startup benchmark and exit non-zero when over budget.
+    """
+    parser = argparse.ArgumentParser(description="AutoCheckBJMF startup import-time benchmark")
+    parser.add_argument("--module", action="append", dest="modules", help="Module to import (repeatable)")
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("STARTUP_BUDGET_MS", DEFAULT_BUDGET_MS)),
+                        help="Maximum median cumulative import time per module, in milliseconds")
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh interpreters per module")
+    parser.add_argument("--top", type=int, default=8, help="Show the N slowest imports (self time)")
+    args = parser.parse_args()
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    modules = args.modules or DEFAULT_MODULES
+    ok = True
+
+    for module in modules:
+        samples = []
+        imported = set()
+        rows = []
+        for _ in range(max(1, args.runs)):
+            cumulative, imported, rows = measure_import(module, cwd)
+            samples.append(cumulative / 1000.0)
+
+        median_ms = statistics.median(samples)
+        eager = sorted(LAZY_MODULES & imported)
+        status = "OK"
+        if median_ms > args.budget_ms or eager:
+            status = "FAIL"
+            ok = False
+
+        print(f"[{status}] import {module}: median {median_ms:.1f} ms (budget {args.budget_ms:.0f} ms, runs {len(samples)})")
+        if eager:
+            print(f"       eagerly imported: {', '.join(eager)}")
+        for self_us, cumulative_us, name in sorted(rows, reverse=True)[:args.top]:
+            print(f"       {self_us / 1000.0:7.2f} ms self {cumulative_us / 1000.0:8.2f} ms cumulative  {name}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
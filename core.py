@@ -4,11 +4,17 @@ import json
 import logging
 import random
 import re
+import threading
 import time
-import requests
-import schedule
-from bs4 import BeautifulSoup
-from datetime import datetime
+import zlib
+import heapq
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque, namedtuple
+from datetime import datetime, timedelta
+from enum import Enum
+
+# requests / bs4 / schedule 在首次使用时才导入 (见各函数内部)，
+# 以缩短 CI 单次运行和短生命周期容器的冷启动时间。
 
 """
 Core module for AutoCheckBJMF.
@@ -43,6 +49,61 @@ def setup_logger(debug=False):
 
 logger = setup_logger()
 
+def parse_shard_spec(spec):
+    """
+    Parse a static shard spec such as "3/8".
+
+    Args:
+        spec (str): "INDEX/TOTAL" with a 1-based INDEX (1 <= INDEX <= TOTAL).
+
+    Returns:
+        tuple: (index, total) as ints, or None if spec is empty.
+
+    Raises:
+        ValueError: If the spec is malformed or out of range.
+    """
+    if not spec:
+        return None
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', str(spec))
+    if not match:
+        raise ValueError(f"无效的分片格式: {spec!r} (应为 INDEX/TOTAL，例如 3/8)")
+    index, total = int(match.group(1)), int(match.group(2))
+    if total < 1 or not 1 <= index <= total:
+        raise ValueError(f"分片编号超出范围: {spec!r} (要求 1 <= INDEX <= TOTAL)")
+    return index, total
+
+def shard_of(key, total):
+    """
+    Map a key (account name) to a stable 1-based shard number.
+
+    Uses CRC32 rather than hash() so the result is identical across processes,
+    hosts and Python versions.
+
+    Args:
+        key (str): The partition key.
+        total (int): The number of shards.
+
+    Returns:
+        int: The shard number in [1, total].
+    """
+    return zlib.crc32(str(key).encode("utf-8")) % total + 1
+
+def shift_time_str(time_str, seconds):
+    """
+    Shift a daily "HH:MM" (or "HH:MM:SS") time by a number of seconds, wrapping around midnight.
+
+    Args:
+        time_str (str): The base time.
+        seconds (float): Offset in seconds (negative for earlier).
+
+    Returns:
+        str: The shifted time as "HH:MM:SS".
+    """
+    fmt = "%H:%M:%S" if time_str.count(":") == 2 else "%H:%M"
+    base = datetime.strptime(time_str, fmt)
+    total = (base.hour * 3600 + base.minute * 60 + base.second + int(seconds)) % 86400
+    return f"{total // 3600:02d}:{total % 3600 // 60:02d}:{total % 60:02d}"
+
 def mask_str(s, show_len=4):
     """
     Mask sensitive strings for display in logs.
@@ -58,24 +119,258 @@ def mask_str(s, show_len=4):
         return "***"
     return f"{s[:show_len]}***{s[-show_len:]}"
 
+def parse_bool(value, default=True):
+    """
+    Parse a flag that may have been hand-edited or imported as a string.
+
+    Args:
+        value: The raw value (bool, number, string or None).
+        default (bool): Returned when the value is missing.
+
+    Returns:
+        bool: False for "0", "false", "no", "off" and "n" (any case); otherwise bool(value).
+    """
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() not in ("0", "false", "no", "off", "n")
+    return bool(value)
+
 # ===========================
 # 2. 配置管理模块
 # ===========================
 
+# 数据模型: 不可变、紧凑的记录类型 (namedtuple + __slots__)，替代按字符串键访问的 dict
+# 记录类型不认识的键保存在 extra 字段中，保存时原样写回，避免手工添加的键丢失
+
+def _extra_items(data, known):
+    """
+    Args:
+        data (dict): The config.json form of a record.
+        known (iterable): Keys the record type consumes.
+
+    Returns:
+        tuple: (key, value) pairs of the remaining keys, in file order.
+    """
+    known = set(known)
+    return tuple((k, v) for k, v in data.items() if k not in known)
+
+def _record_dict(record):
+    """
+    Returns:
+        dict: The config.json form of a record, including its extra keys.
+    """
+    data = record._asdict()
+    data.update(data.pop("extra"))
+    return data
+
+
+class Account(namedtuple("Account", "name cookie class_id pwd extra", defaults=((),))):
+    """
+    A BJMF account.
+
+    Attributes:
+        name (str): Display name, unique within the configuration.
+        cookie (str): The authentication cookie.
+        class_id (str): The class to check in to, or several separated by commas.
+        pwd (str): Password for password-protected check-ins, or "".
+        extra (tuple): Unknown config keys as (key, value) pairs, written back unchanged.
+    """
+    __slots__ = ()
+
+    _CLASS_SEP = re.compile(r"[\s,，;]+")
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build an Account from its config.json form.
+
+        Args:
+            data (dict): {"name", "cookie", "class_id", "pwd"}; missing keys default to "".
+                         class_id (or class_ids) may also be a list of class IDs.
+
+        Returns:
+            Account: The record.
+        """
+        class_id = data.get("class_id") or data.get("class_ids") or ""
+        if isinstance(class_id, (list, tuple)):
+            class_id = ",".join(str(c) for c in class_id)
+        return cls(
+            str(data.get("name", "")),
+            data.get("cookie", "") or "",
+            ",".join(cls.split_class_ids(str(class_id))),
+            data.get("pwd", "") or "",
+            _extra_items(data, ("name", "cookie", "class_id", "class_ids", "pwd")),
+        )
+
+    @classmethod
+    def split_class_ids(cls, value):
+        """
+        Args:
+            value (str): One class ID or several separated by commas/whitespace.
+
+        Returns:
+            tuple: The class IDs in order, without duplicates.
+        """
+        return tuple(dict.fromkeys(c for c in cls._CLASS_SEP.split(value or "") if c))
+
+    @property
+    def class_ids(self):
+        """
+        Returns:
+            tuple: All classes of the account (one session checks them all).
+        """
+        return self.split_class_ids(self.class_id)
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: The config.json form of the record.
+        """
+        return _record_dict(self)
+
+
+class Location(namedtuple("Location", "name lat lng acc extra", defaults=((),))):
+    """
+    A named check-in position.
+
+    Attributes:
+        name (str): Display name, unique within the configuration.
+        lat (str): Latitude, as entered.
+        lng (str): Longitude, as entered.
+        acc (str): Accuracy, as entered.
+        extra (tuple): Unknown config keys as (key, value) pairs, written back unchanged.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a Location from its config.json form.
+
+        Args:
+            data (dict): {"name", "lat", "lng", "acc"}; coordinates default to "0".
+
+        Returns:
+            Location: The record.
+        """
+        return cls(
+            str(data.get("name", "")),
+            str(data.get("lat", "0")),
+            str(data.get("lng", "0")),
+            str(data.get("acc", "0")),
+            _extra_items(data, ("name", "lat", "lng", "acc")),
+        )
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: The config.json form of the record.
+        """
+        return _record_dict(self)
+
+
+class Task(namedtuple("Task", "account_name location_name enable extra", defaults=((),))):
+    """
+    A scheduled check-in: one account at one location.
+
+    Attributes:
+        account_name (str): Name of the Account.
+        location_name (str): Name of the Location.
+        enable (bool): Whether the task runs.
+        extra (tuple): Unknown config keys as (key, value) pairs, written back unchanged.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a Task from its config.json form.
+
+        Args:
+            data (dict): {"account_name", "location_name", "enable"}; enable defaults to True
+                         and may be a string such as "false" or "0".
+
+        Returns:
+            Task: The record.
+        """
+        return cls(
+            data.get("account_name", ""),
+            data.get("location_name", ""),
+            parse_bool(data.get("enable"), default=True),
+            _extra_items(data, ("account_name", "location_name", "enable")),
+        )
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: The config.json form of the record.
+        """
+        return _record_dict(self)
+
+
+class SignStatus(Enum):
+    """
+    Outcome of a sign request, parsed once from the server response.
+    """
+    SUCCESS = "success"
+    FAILED = "failed"
+    ERROR = "error"
+
+    @classmethod
+    def parse(cls, message):
+        """
+        Classify the server's response message.
+
+        Args:
+            message (str): The <h1> text of the response.
+
+        Returns:
+            SignStatus: SUCCESS if the server reported success, otherwise FAILED.
+        """
+        return cls.SUCCESS if message and "成功" in message else cls.FAILED
+
+
+class SignResult(namedtuple("SignResult", "sign_id status message")):
+    """
+    Result of one sign request.
+
+    Attributes:
+        sign_id (str): The check-in ID.
+        status (SignStatus): The parsed outcome.
+        message (str): The server message or error text.
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        """
+        Returns:
+            bool: True if the sign succeeded.
+        """
+        return self.status is SignStatus.SUCCESS
+
+
 class ConfigManager:
     """
     Manages application configuration.
 
     Loads configuration from 'config.json' and environment variables, prioritizing environment variables.
-    Handles migration from older configuration formats.
+    Handles migration from older configuration formats. The list sections are
+    held as Account / Location / Task records and written back as plain JSON objects.
     """
-    def __init__(self, config_path=None):
+    # 列表配置项对应的记录类型
+    RECORD_TYPES = {"accounts": Account, "locations": Location, "tasks": Task}
+
+    def __init__(self, config_path=None, read_only=False):
         """
         Initialize the ConfigManager.
 
         Args:
             config_path (str, optional): Path to the configuration file.
                                          If None, automatically determines path based on execution environment (frozen or script).
+            read_only (bool): Only read the configuration; never create or rewrite
+                              the file (used by query commands such as --ctl).
         """
         if config_path:
             self.config_path = config_path
@@ -89,15 +384,23 @@ class ConfigManager:
                 base_dir = os.path.dirname(os.path.abspath(__file__))
 
             config_dir = os.path.join(base_dir, "config")
-            if not os.path.exists(config_dir):
+            if not read_only and not os.path.exists(config_dir):
                 os.makedirs(config_dir)
 
             self.config_path = os.path.join(config_dir, "config.json")
 
+        # 变更监听器: callback(section, action, index)
+        self._listeners = []
+        # 上次读写时配置文件的 (mtime_ns, size)，用于检测外部修改
+        self._signature = None
+        self._reload_lock = threading.Lock()
         self.data = self._load_config()
 
         # Always save config to ensure defaults are present (e.g. scheduletime)
         # Check existence before saving for logging purposes
+        if read_only:
+            # 只读模式不回写文件，避免触发守护进程的热重载
+            return
         is_new = not os.path.exists(self.config_path)
         self.save_config(self.data)
         if is_new:
@@ -119,6 +422,7 @@ class ConfigManager:
             "accounts": [],  # List of {name, cookie, class_id, pwd}
             "tasks": [],     # List of {account_name, location_name, enable}
             "scheduletime": "08:00",
+            "workers": 1,    # >1 时按账号分片到多个进程执行
             "wecom": {
                 "corpid": "",
                 "secret": "",
@@ -154,6 +458,7 @@ class ConfigManager:
             "SearchTime": "scheduletime",
             "token": "pushplus",
             "PASSWORD": "pwd",
+            "WORKERS": "workers",
             "WECOM_CORPID": "wecom.corpid",
             "WECOM_SECRET": "wecom.secret",
             "WECOM_AGENTID": "wecom.agentid",
@@ -249,8 +554,38 @@ class ConfigManager:
                             "enable": True
                         })
 
+        # 5. 载入为记录类型
+        for section in self.RECORD_TYPES:
+            config[section] = [self._to_record(section, item) for item in config.get(section) or []]
+
         return config
 
+    def _to_record(self, section, item):
+        """
+        Convert an item of a list section to its record type.
+
+        Args:
+            section (str): "accounts", "locations" or "tasks".
+            item (dict/record): The item, as a dict or already as a record.
+
+        Returns:
+            Account/Location/Task: The record.
+        """
+        record_type = self.RECORD_TYPES[section]
+        return item if isinstance(item, record_type) else record_type.from_dict(item)
+
+    def to_dict(self):
+        """
+        Serialise the configuration to its JSON form.
+
+        Returns:
+            dict: The configuration with records converted back to plain dicts.
+        """
+        return {
+            key: [item.to_dict() for item in value] if key in self.RECORD_TYPES else value
+            for key, value in self.data.items()
+        }
+
     def _extract_username_static(self, cookie):
         """
         Static helper to extract username from a cookie string.
@@ -283,400 +618,4399 @@ class ConfigManager:
 
         Args:
             new_data (dict): A dictionary of configuration keys and values to update.
+                List sections may contain dicts or records.
         """
+        new_data = dict(new_data)
+        for section in self.RECORD_TYPES:
+            if section in new_data:
+                new_data[section] = [self._to_record(section, item) for item in new_data[section] or []]
         self.data.update(new_data)
+        self._write()
+        for key in new_data:
+            self._emit(key, "replace")
+
+    def _write(self):
+        """
+        Write the current configuration to disk.
+        """
         try:
             with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, indent=4, ensure_ascii=False)
+                json.dump(self.to_dict(), f, indent=4, ensure_ascii=False)
+            # 自己写入的变更不触发热加载
+            self._signature = self._file_signature()
         except Exception as e:
             logger.error(f"保存配置失败: {e}")
 
-# ===========================
-# 3. 核心 API 交互模块
-# ===========================
+    def _file_signature(self):
+        """
+        Returns:
+            tuple: (mtime_ns, size) of the config file, or None if it does not exist.
+        """
+        try:
+            st = os.stat(self.config_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
 
-class BJMFClient:
-    """
-    Client for interacting with the Class Cube (BJMF) server.
+    @staticmethod
+    def _record_key(section, record):
+        """
+        Returns:
+            The identity of a record for diffing: the name, or (account, location) for tasks.
+        """
+        if section == "tasks":
+            return record.account_name, record.location_name
+        return record.name
 
-    Handles HTTP requests, session management, and parsing server responses.
-    """
-    SERVER = "k8n.cn"
-    # 模拟微信内置浏览器 UA
-    UA = "Mozilla/5.0 (Linux; Android 12; PAL-AL00 Build/HUAWEIPAL-AL00; wv) AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 Chrome/116.0.0.0 Mobile Safari/537.36 XWEB/1160065 MMWEBSDK/20231202 MMWEBID/1136 MicroMessenger/8.0.47.2560(0x28002F35) WeChat/arm64 Weixin NetType/4G Language/zh_CN ABI/arm64"
+    def check_reload(self):
+        """
+        Reload the config file if it was changed by someone else, applying only the differences.
+
+        Meant to be polled (e.g. from a scheduler loop). Accounts, locations and
+        tasks are diffed by name; listeners get "update" events for the changed
+        items only, plus a "replace" event when items were added, removed or
+        reordered. Changed settings (e.g. scheduletime) get one "replace" event
+        per key. A file that cannot be parsed (e.g. half-written) is left for
+        the next poll.
 
-    def __init__(self, cookie, class_id):
+        Returns:
+            dict: The applied diff, {section: {"added", "removed", "changed"}, "settings": [keys]},
+                  or None if nothing was reloaded.
         """
-        Initialize the BJMFClient.
+        # 守护进程中轮询线程与控制接口可能同时触发
+        with self._reload_lock:
+            return self._reload_if_changed()
+
+    def _reload_if_changed(self):
+        signature = self._file_signature()
+        if signature is None or signature == self._signature:
+            return None
+        try:
+            with open(self.config_path, 'r', encoding='utf-8') as f:
+                json.load(f)
+        except Exception as e:
+            logger.warning(f"配置文件已变更但无法解析，稍后重试: {e}")
+            return None
+
+        new_data = self._load_config()
+        self._signature = signature
+        old_data = self.data
+        diff = {}
+        events = []
+
+        for section in self.RECORD_TYPES:
+            old_items = old_data.get(section, [])
+            new_items = new_data.get(section, [])
+            old_map = {self._record_key(section, r): r for r in old_items}
+            new_keys = [self._record_key(section, r) for r in new_items]
+            added = [k for k in new_keys if k not in old_map]
+            removed = [k for k in old_map if k not in set(new_keys)]
+            changed = [i for i, (k, r) in enumerate(zip(new_keys, new_items)) if k in old_map and old_map[k] != r]
+            diff[section] = {"added": added, "removed": removed, "changed": [new_keys[i] for i in changed]}
+
+            old_data[section] = new_items
+            if added or removed or [self._record_key(section, r) for r in old_items] != new_keys:
+                events.append((section, "replace", None))
+            events.extend((section, "update", i) for i in changed)
+
+        settings = sorted(
+            key for key in set(old_data) | set(new_data)
+            if key not in self.RECORD_TYPES and old_data.get(key) != new_data.get(key)
+        )
+        for key in settings:
+            if key in new_data:
+                old_data[key] = new_data[key]
+            else:
+                old_data.pop(key, None)
+            events.append((key, "replace", None))
+        diff["settings"] = settings
+
+        if not events:
+            return None
+
+        summary = "，".join(
+            f"{section} +{len(d['added'])} -{len(d['removed'])} ~{len(d['changed'])}"
+            for section, d in diff.items() if section != "settings" and any(d.values())
+        )
+        logger.info(f"配置文件已重新加载: {summary or '列表无变化'}"
+                    + (f"；设置项 {', '.join(settings)}" if settings else ""))
+        for section, action, index in events:
+            self._emit(section, action, index)
+        return diff
+
+    def subscribe(self, callback):
+        """
+        Register a listener for configuration change events.
 
         Args:
-            cookie (str): The user's authentication cookie.
-            class_id (str): The class ID to check tasks for.
+            callback (callable): Called as callback(section, action, index), where
+                action is one of "add", "update", "remove" or "replace". index is
+                the affected list position, or None for "replace".
         """
-        self.cookie = cookie
-        self.class_id = class_id
-        self.session = requests.Session()
-        self.session.headers.update(self._get_headers())
-        # 尝试提取用户名用于日志显示
-        self.username = self._extract_username(cookie)
+        if callback not in self._listeners:
+            self._listeners.append(callback)
 
-    def _extract_username(self, cookie):
+    def unsubscribe(self, callback):
         """
-        Extract the username from the cookie.
+        Remove a previously registered change listener.
 
         Args:
-            cookie (str): The cookie string.
+            callback (callable): The listener to remove.
+        """
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _emit(self, section, action, index=None):
+        """
+        Notify all listeners of a change.
+
+        Args:
+            section (str): The configuration key that changed (e.g. "tasks").
+            action (str): The kind of change.
+            index (int, optional): The affected list position.
+        """
+        for callback in list(self._listeners):
+            try:
+                callback(section, action, index)
+            except Exception as e:
+                logger.warning(f"配置变更回调异常: {e}")
+
+    def add_item(self, section, item):
+        """
+        Append an item to a list section (accounts, locations or tasks) and save.
+
+        Args:
+            section (str): The list section to append to.
+            item (dict/record): The new item.
 
         Returns:
-            str: The extracted username or "Unknown".
+            int: The index of the new item.
         """
-        match = re.search(r'username=([^;]+)', cookie)
-        return match.group(1) if match else "Unknown"
+        items = self.data.setdefault(section, [])
+        items.append(self._to_record(section, item) if section in self.RECORD_TYPES else item)
+        self._write()
+        index = len(items) - 1
+        self._emit(section, "add", index)
+        return index
 
-    def _get_headers(self):
+    def update_item(self, section, index, changes):
         """
-        Generate HTTP headers for requests.
+        Update a single item of a list section in place and save.
+
+        Args:
+            section (str): The list section containing the item.
+            index (int): The position of the item.
+            changes (dict): Keys and values to merge into the item.
 
         Returns:
-            dict: A dictionary of HTTP headers including User-Agent and Cookie.
+            bool: True if the item existed and was updated.
         """
-        return {
-            "User-Agent": self.UA,
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/wxpic,image/tpg,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-            "X-Requested-With": "com.tencent.mm",
-            "Referer": f"http://{self.SERVER}/student/course/{self.class_id}",
-            "Accept-Encoding": "gzip, deflate",
-            "Accept-Language": "zh-CN,zh-SG;q=0.9,zh;q=0.8,en-SG;q=0.7,en-US;q=0.6,en;q=0.5",
-            "Cookie": self.cookie,
-        }
+        items = self.data.get(section, [])
+        if not 0 <= index < len(items):
+            return False
+        if section in self.RECORD_TYPES:
+            # 记录不可变: 以合并后的新记录替换
+            items[index] = self._to_record(section, {**items[index].to_dict(), **changes})
+        else:
+            items[index].update(changes)
+        self._write()
+        self._emit(section, "update", index)
+        return True
 
-    def fetch_tasks(self):
+    def remove_item(self, section, index):
         """
-        Fetch all pending check-in task IDs.
+        Remove a single item from a list section and save.
 
-        Scrapes the course page to find check-in cards that are not yet marked as "Signed".
+        Args:
+            section (str): The list section containing the item.
+            index (int): The position of the item.
 
         Returns:
-            list: A list of task ID strings if successful.
-            None: If the session/cookie is invalid.
-            list: An empty list if no tasks are found or an error occurs.
+            bool: True if the item existed and was removed.
         """
-        url = f"http://{self.SERVER}/student/course/{self.class_id}/punchs"
-        try:
-            r = self.session.get(url, timeout=15)
-            # 检查 Cookie 是否有效
-            if "出错" in r.text or ("登录" in r.text and "输入密码" in r.text):
-                logger.error(f"用户 [{self.username}] Cookie 已失效或需登录")
-                return None # None 表示 Cookie 失效
+        items = self.data.get(section, [])
+        if not 0 <= index < len(items):
+            return False
+        del items[index]
+        self._write()
+        self._emit(section, "remove", index)
+        return True
 
-            soup = BeautifulSoup(r.text, "html.parser")
-            cards = soup.find_all("div", class_="card-body")
-            
-            valid_ids = []
-            for card in cards:
-                card_str = str(card)
-                # 核心逻辑：如果包含“已签”，则跳过
-                if "已签" in card_str:
-                    continue
-                
-                # 提取 ID (兼容普通签到和密码签到)
-                match = re.search(r'(punchcard|punch_pwd_frm)_(\d+)', card_str)
-                if match:
-                    valid_ids.append(match.group(2))
-            
-            return valid_ids
-        except Exception as e:
-            logger.error(f"用户 [{self.username}] 获取任务列表失败: {e}")
-            return []
+    # 批量导入: 每行的 type 列 (或 section 参数) 到配置项的映射
+    IMPORT_TYPES = {
+        "account": "accounts", "accounts": "accounts",
+        "location": "locations", "locations": "locations",
+        "task": "tasks", "tasks": "tasks",
+    }
 
-    def execute_sign(self, sign_id, lat, lng, acc, pwd=""):
+    @staticmethod
+    def _iter_import_file(path):
         """
-        Execute a single check-in request.
+        Stream rows from a CSV or JSONL import file.
 
         Args:
-            sign_id (str): The ID of the check-in task.
-            lat (str/float): Latitude for the check-in.
-            lng (str/float): Longitude for the check-in.
-            acc (str/float): Accuracy of the location.
-            pwd (str, optional): Password for password-protected check-ins. Defaults to "".
+            path (str): The file path. ".jsonl"/".ndjson" files are read as JSON lines, anything else as CSV.
+
+        Yields:
+            tuple: (line_number, row) where row is a dict, or (line_number, None) for an unparsable line.
+        """
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            with open(path, "r", encoding="utf-8-sig") as f:
+                for line_no, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        row = None
+                    yield line_no, row if isinstance(row, dict) else None
+        else:
+            import csv
+            with open(path, "r", encoding="utf-8-sig", newline="") as f:
+                reader = csv.DictReader(f)
+                for row in reader:
+                    if not any((v or "").strip() for v in row.values() if isinstance(v, str)):
+                        continue
+                    yield reader.line_num, {k.strip(): (v or "").strip() for k, v in row.items() if k}
+
+    def _validate_import_row(self, section, row):
+        """
+        Check one import row and build its record.
+
+        Args:
+            section (str): "accounts", "locations" or "tasks".
+            row (dict): The raw row.
 
         Returns:
-            str: The result message from the server (e.g., "Success", error message).
+            tuple: (record, None) if valid, otherwise (None, error message).
         """
-        url = f"http://{self.SERVER}/student/punchs/course/{self.class_id}/{sign_id}"
-        data = {
-            "id": sign_id,
-            "lat": lat,
-            "lng": lng,
-            "acc": acc,
-            "res": "",
-            "gps_addr": "",
-            "pwd": pwd
+        if section == "accounts":
+            record = Account.from_dict(row)
+            if not record.name or not record.cookie or not record.class_id:
+                return None, "账号需要 name、cookie 和 class_id"
+        elif section == "locations":
+            record = Location.from_dict(row)
+            if not record.name:
+                return None, "地点需要 name"
+            try:
+                float(record.lat)
+                float(record.lng)
+            except ValueError:
+                return None, f"经纬度不是数字: {record.lat}, {record.lng}"
+        else:
+            record = Task.from_dict(row)
+            if not record.account_name or not record.location_name:
+                return None, "任务需要 account_name 和 location_name"
+        return record, None
+
+    def bulk_import(self, path, section=None, dry_run=False):
+        """
+        Import accounts, locations and tasks from a CSV or JSONL file in one write.
+
+        Rows are streamed and validated against name indexes of the existing
+        and newly imported items: names must be unique, and tasks must refer
+        to known accounts and locations (rows of any type may come in any
+        order). Invalid rows are reported per line and skipped; all valid rows
+        are committed with a single save.
+
+        Args:
+            path (str): The import file. Each row may carry a "type" column
+                        (account / location / task); otherwise section is used.
+            section (str, optional): Default section for rows without a type.
+            dry_run (bool): Validate only, do not save.
+
+        Returns:
+            dict: {"added": {"accounts": n, "locations": n, "tasks": n},
+                   "errors": [(line_number, message), ...]}
+        """
+        default = self.IMPORT_TYPES.get(section) if section else None
+        names = {
+            "accounts": {a.name for a in self.data.get("accounts", [])},
+            "locations": {l.name for l in self.data.get("locations", [])},
         }
-        try:
-            r = self.session.post(url, data=data, timeout=15)
-            soup = BeautifulSoup(r.text, "html.parser")
-            h1 = soup.find("h1")
-            return h1.text if h1 else "未知响应"
-        except Exception as e:
-            logger.error(f"签到请求异常: {e}")
-            return str(e)
+        task_keys = {(t.account_name, t.location_name) for t in self.data.get("tasks", [])}
+        added = {"accounts": [], "locations": [], "tasks": []}
+        pending_tasks = []
+        errors = []
+
+        for line_no, row in self._iter_import_file(path):
+            if row is None:
+                errors.append((line_no, "无法解析该行"))
+                continue
+            target = self.IMPORT_TYPES.get(str(row.get("type", "")).strip().lower()) or default
+            if target is None:
+                errors.append((line_no, "缺少 type 列 (account/location/task)"))
+                continue
+
+            record, error = self._validate_import_row(target, row)
+            if error:
+                errors.append((line_no, error))
+                continue
+
+            if target == "tasks":
+                # 任务引用的账号/地点可能在文件后面出现，读完再校验
+                pending_tasks.append((line_no, record))
+            elif record.name in names[target]:
+                errors.append((line_no, f"名称重复: {record.name}"))
+            else:
+                names[target].add(record.name)
+                added[target].append(record)
+
+        for line_no, task in pending_tasks:
+            if task.account_name not in names["accounts"]:
+                errors.append((line_no, f"找不到账号: {task.account_name}"))
+            elif task.location_name not in names["locations"]:
+                errors.append((line_no, f"找不到地点: {task.location_name}"))
+            elif (task.account_name, task.location_name) in task_keys:
+                errors.append((line_no, f"任务重复: {task.account_name} @ {task.location_name}"))
+            else:
+                task_keys.add((task.account_name, task.location_name))
+                added["tasks"].append(task)
+
+        errors.sort()
+        if not dry_run and any(added.values()):
+            # 一次写盘，每个配置项只发出一次 replace 事件
+            self.save_config({
+                key: self.data.get(key, []) + records for key, records in added.items() if records
+            })
+
+        return {"added": {key: len(records) for key, records in added.items()}, "errors": errors}
 
 # ===========================
-# 4. 任务调度与执行模块
+# 3. 核心 API 交互模块
 # ===========================
 
-class CheckInManager:
+class DeadlineExceeded(Exception):
+    """
+    Raised when a run's deadline budget leaves no time for another request.
     """
-    Manages the check-in process logic.
 
-    Coordinates configuration, client execution, and notifications.
+
+class RunDeadline:
     """
-    def __init__(self, config_manager, log_callback=None):
-        """
-        Initialize the CheckInManager.
+    Time budget for a whole run.
 
+    Hands out (connect, read) timeouts capped by the remaining budget, so no
+    single request can outlive the run.
+    """
+    # 剩余时间低于此值时不再发起新请求
+    MIN_REQUEST_TIME = 1.0
+
+    def __init__(self, budget_seconds=None):
+        """
         Args:
-            config_manager (ConfigManager): The configuration manager instance.
-            log_callback (callable, optional): A callback function for logging messages (e.g., for GUI updates).
+            budget_seconds (float, optional): The run budget. None or 0 means unlimited.
         """
-        self.cfg = config_manager
-        self.log_callback = log_callback
+        self.budget = float(budget_seconds) if budget_seconds else None
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + self.budget if self.budget else None
 
-    def _get_jittered_location(self, lat, lng, acc):
+    def remaining(self):
         """
-        Get coordinates with random jitter added to simulate real GPS fluctuations.
+        Returns:
+            float: Seconds left in the budget (float("inf") when unlimited).
+        """
+        if self.expires_at is None:
+            return float("inf")
+        return max(0.0, self.expires_at - time.monotonic())
 
-        Args:
-            lat (str/float): Base latitude.
-            lng (str/float): Base longitude.
-            acc (str/float): Accuracy.
+    def expired(self):
+        """
+        Returns:
+            bool: True if there is not enough time left for another request.
+        """
+        return self.remaining() < self.MIN_REQUEST_TIME
 
+    def overrun(self):
+        """
         Returns:
-            tuple: (jittered_lat, jittered_lng, acc)
+            float: Seconds spent beyond the budget (0 if within budget).
         """
-        try:
-            base_lat = float(lat)
-            base_lng = float(lng)
-            # 随机抖动范围 (约 10-20米)
-            offset = random.uniform(-0.00015, 0.00015)
-            return base_lat + offset, base_lng + offset, acc
-        except ValueError:
-            logger.critical("坐标配置错误，请检查 lat/lng 是否为数字")
-            return 0, 0, 0
+        if self.expires_at is None:
+            return 0.0
+        return max(0.0, time.monotonic() - self.expires_at)
 
-    def _push_notify(self, content):
+    def timeout(self, connect, read):
         """
-        Send a notification via WeCom (Enterprise WeChat) or PushPlus.
+        Get request timeouts capped by the remaining budget.
 
         Args:
-            content (str): The message content to send.
+            connect (float): The default connect timeout.
+            read (float): The default read timeout.
+
+        Returns:
+            tuple: (connect_timeout, read_timeout) for requests.
+
+        Raises:
+            DeadlineExceeded: If the budget is (nearly) used up.
         """
-        wecom = self.cfg.get("wecom", {})
-        corpid = wecom.get("corpid")
-        secret = wecom.get("secret")
-        agentid = wecom.get("agentid")
+        remaining = self.remaining()
+        if remaining < self.MIN_REQUEST_TIME:
+            raise DeadlineExceeded(f"运行时限已用尽 (预算 {self.budget:.0f}s)")
+        return min(connect, remaining), min(read, remaining)
 
-        if not corpid or not secret or not agentid:
-            # 尝试回退到 pushplus (兼容旧配置)
-            token = self.cfg.get("pushplus")
-            if token:
-                self._push_pushplus(token, content)
-            return
 
-        try:
-            # 1. 获取 Access Token
-            token_url = f"https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={corpid}&corpsecret={secret}"
-            r = requests.get(token_url, timeout=10)
-            token_data = r.json()
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting the request rate to one host.
+    """
+    def __init__(self, rate, burst=None):
+        """
+        Args:
+            rate (float): Tokens added per second.
+            burst (float, optional): Bucket capacity. Defaults to max(1, rate).
+        """
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
 
-            if token_data.get("errcode") != 0:
-                logger.error(f"企业微信 AccessToken 获取失败: {token_data}")
-                return
+    def acquire(self, timeout=None):
+        """
+        Take one token, waiting for the bucket to refill if necessary.
 
-            access_token = token_data.get("access_token")
+        Args:
+            timeout (float, optional): Maximum seconds to wait. None waits indefinitely.
 
-            # 2. 发送消息
-            send_url = f"https://qyapi.weixin.qq.com/cgi-bin/message/send?access_token={access_token}"
-            payload = {
-                "touser": wecom.get("touser", "@all"),
-                "msgtype": "text",
-                "agentid": agentid,
-                "text": {
-                    "content": f"【班级魔法签到通知】\n{content}"
-                },
-                "safe": 0
-            }
+        Returns:
+            bool: True if a token was taken, False on timeout.
+        """
+        give_up = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if give_up is not None:
+                if now + wait > give_up:
+                    return False
+            time.sleep(wait)
 
-            r_send = requests.post(send_url, json=payload, timeout=10)
-            res = r_send.json()
-            if res.get("errcode") == 0:
-                logger.info("企业微信推送成功")
-            else:
-                logger.warning(f"企业微信推送失败: {res}")
+    def spend(self, count):
+        """
+        Take tokens for requests already sent, without waiting.
 
-        except Exception as e:
-            logger.warning(f"推送异常: {e}")
+        The balance may go negative, which delays later acquire() calls.
 
-    def _push_pushplus(self, token, content):
+        Args:
+            count (float): The number of tokens.
         """
-        Send a notification via PushPlus (fallback method).
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate) - count
+            self._updated = now
+
+
+class AdaptiveLimiter:
+    """
+    AIMD controller for the number of in-flight upstream requests.
 
+    The limit grows by about one per round of successful requests and is
+    halved when a request fails or is slower than the latency target (at most
+    once per latency_target, so one burst of errors counts as one signal).
+    Each request additionally takes a token from its host's bucket.
+    """
+    def __init__(self, max_limit=4, min_limit=1, initial=None, latency_target=3.0, rate=None):
+        """
         Args:
-            token (str): The PushPlus token.
-            content (str): The message content.
+            max_limit (int): Upper bound for concurrent requests.
+            min_limit (int): Lower bound for concurrent requests.
+            initial (float, optional): Starting limit. Defaults to half of max_limit.
+            latency_target (float): Seconds; slower responses count as congestion.
+            rate (float, optional): Per-host requests per second. None or 0 disables the token bucket.
         """
-        url = 'http://www.pushplus.plus/send'
-        data = {
-            "token": token,
-            "title": "班级魔法签到通知",
-            "content": content
-        }
-        try:
-            requests.post(url, json=data, timeout=5)
-            logger.info("PushPlus 推送已发送")
-        except Exception as e:
-            logger.warning(f"PushPlus 推送失败: {e}")
+        self.max_limit = max(1, int(max_limit))
+        self.min_limit = max(1, min(int(min_limit), self.max_limit))
+        self.latency_target = float(latency_target)
+        self.rate = float(rate) if rate else None
+        self._limit = float(initial or max(self.min_limit, self.max_limit / 2))
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._latency = None
+        self._error_rate = 0.0
+        self._buckets = {}
+        self._cond = threading.Condition()
 
-    def log(self, msg):
+    @property
+    def limit(self):
         """
-        Log a message to the logger and the optional callback.
+        Returns:
+            int: The current concurrency limit.
+        """
+        return max(self.min_limit, int(self._limit))
+
+    def acquire(self, host, timeout=None):
+        """
+        Wait for a concurrency slot and a token for the host.
 
         Args:
-            msg (str): The message to log.
+            host (str): The upstream host.
+            timeout (float, optional): Maximum seconds to wait. None waits indefinitely.
+
+        Returns:
+            bool: True if the request may proceed; False on timeout (no slot is held).
         """
-        logger.info(msg)
-        if self.log_callback:
-            self.log_callback(msg)
+        give_up = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._in_flight >= self.limit:
+                left = None if give_up is None else give_up - time.monotonic()
+                if left is not None and left <= 0:
+                    return False
+                self._cond.wait(left)
+            self._in_flight += 1
+            bucket = None
+            if self.rate:
+                bucket = self._buckets.get(host)
+                if bucket is None:
+                    bucket = self._buckets[host] = TokenBucket(self.rate)
 
-    def run_job(self):
+        if bucket is not None:
+            left = None if give_up is None else max(0.0, give_up - time.monotonic())
+            if not bucket.acquire(left):
+                self.release()
+                return False
+        return True
+
+    def release(self, latency=None, ok=True):
         """
-        Adapter method for job execution, equivalent to calling run_with_retries.
+        Free a slot and feed the outcome of the request into the controller.
+
+        Args:
+            latency (float, optional): Request duration in seconds. None records no sample.
+            ok (bool): False if the request failed (connection error, timeout, 5xx).
         """
-        self.run_with_retries()
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            if latency is not None:
+                self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+                self._error_rate = 0.8 * self._error_rate + (0.0 if ok else 0.2)
+                now = time.monotonic()
+                if not ok or latency > self.latency_target:
+                    # 乘性减: 同一窗口内的多次拥塞信号只减一次
+                    if now - self._last_decrease >= self.latency_target:
+                        self._limit = max(self.min_limit, self._limit / 2)
+                        self._last_decrease = now
+                else:
+                    # 加性增: 每轮成功约 +1
+                    self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            self._cond.notify_all()
 
-    def run_check_flow(self):
+    def snapshot(self):
         """
-        Execute a complete check-in flow for all enabled tasks.
+        Returns:
+            dict: {"limit", "max_limit", "in_flight", "latency", "error_rate"}.
+        """
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "max_limit": self.max_limit,
+                "in_flight": self._in_flight,
+                "latency": self._latency,
+                "error_rate": self._error_rate,
+            }
+
+
+class CircuitOpen(Exception):
+    """
+    Raised instead of sending a request while the server's circuit is open.
+    """
+
 
-        Iterates through tasks, fetches pending check-ins, performs them,
-        and sends notifications.
+class CircuitBreaker:
+    """
+    Circuit breaker for requests to the server.
+
+    Opens after failure_threshold consecutive connection failures; while open,
+    requests fail immediately with CircuitOpen. After reset_timeout seconds a
+    single probe request is let through (half-open): success closes the
+    circuit, failure opens it again. Other requests wait for the probe.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=3, reset_timeout=30, probe_wait=20):
+        """
+        Args:
+            failure_threshold (int): Consecutive connection failures that open the circuit.
+            reset_timeout (float): Seconds the circuit stays open before a probe is allowed.
+            probe_wait (float): Maximum seconds a request waits for a running probe.
+        """
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = float(reset_timeout)
+        self.probe_wait = float(probe_wait)
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._cond = threading.Condition()
 
+    def is_open(self):
+        """
         Returns:
-            bool: True if any task failed and needs retry, False otherwise.
+            bool: True while requests would be rejected without a probe.
         """
-        self.log("--- 开始执行签到任务 ---")
+        with self._cond:
+            return self.state == self.OPEN and time.monotonic() - self._opened_at < self.reset_timeout
 
-        tasks = self.cfg.get("tasks", [])
-        locations = self.cfg.get("locations", [])
-        accounts = self.cfg.get("accounts", [])
+    def before_request(self, timeout=None):
+        """
+        Check whether a request may be sent, waiting for a running probe if needed.
 
-        if not tasks:
-            self.log("任务列表为空，跳过任务")
-            return
+        Args:
+            timeout (float, optional): Maximum seconds to wait for a probe (capped by probe_wait).
 
-        push_messages = []
-        needs_retry = False
+        Raises:
+            CircuitOpen: If the circuit is open or the probe did not succeed in time.
+        """
+        wait = self.probe_wait if timeout is None else min(timeout, self.probe_wait)
+        give_up = time.monotonic() + wait
+        with self._cond:
+            while True:
+                if self.state == self.CLOSED:
+                    return
+                if self.state == self.OPEN:
+                    if time.monotonic() - self._opened_at < self.reset_timeout:
+                        raise CircuitOpen(f"服务器不可达，熔断中 (连续失败 {self._failures} 次)")
+                    self.state = self.HALF_OPEN
+                if not self._probing:
+                    self._probing = True
+                    logger.info("熔断器半开: 发送探测请求")
+                    return
+                left = give_up - time.monotonic()
+                if left <= 0:
+                    raise CircuitOpen("等待探测请求结果超时")
+                self._cond.wait(left)
 
-        # 将 list 转为 dict 方便查找
-        loc_map = {l["name"]: l for l in locations}
-        acc_map = {a["name"]: a for a in accounts}
+    def record(self, reachable):
+        """
+        Feed the outcome of a request into the breaker.
 
-        # Cache clients to avoid recreating sessions for the same account
-        # Key: (cookie, class_id) -> client instance
-        client_cache = {}
+        Args:
+            reachable (bool): True if the server answered, False on a connection
+                              failure, None if no request was actually sent.
+        """
+        with self._cond:
+            if reachable is None:
+                if self.state == self.HALF_OPEN:
+                    self._probing = False
+            elif reachable:
+                if self.state != self.CLOSED:
+                    logger.info("熔断器关闭: 服务器已恢复")
+                self.state = self.CLOSED
+                self._failures = 0
+                self._probing = False
+            else:
+                self._failures += 1
+                if self.state == self.HALF_OPEN or (
+                        self.state == self.CLOSED and self._failures >= self.failure_threshold):
+                    logger.warning(f"熔断器打开: 连续 {self._failures} 次连接失败，{self.reset_timeout:.0f}s 内快速失败")
+                    self.state = self.OPEN
+                    self._opened_at = time.monotonic()
+                    self._probing = False
+            self._cond.notify_all()
 
-        for task in tasks:
-            if not task.get("enable", True):
-                continue
+    def snapshot(self):
+        """
+        Returns:
+            dict: {"state", "failures"}.
+        """
+        with self._cond:
+            return {"state": self.state, "failures": self._failures}
 
-            acc_name = task.get("account_name")
-            loc_name = task.get("location_name")
 
-            account = acc_map.get(acc_name)
-            location = loc_map.get(loc_name)
+class PunchCard:
+    """
+    A pending check-in card parsed from the punch page.
 
-            if not account or not location:
-                self.log(f"任务无效: 找不到账号 [{acc_name}] 或 地点 [{loc_name}]")
-                continue
+    Attributes:
+        id (str): The check-in ID.
+        kind (str): GPS, QR or PWD.
+        title (str): The card title, or "" if none was found.
+        open_time (datetime): When the check-in opens, or None if not shown.
+        close_time (datetime): When the check-in closes, or None if not shown.
+        class_id (str): The class whose punch page listed the card.
+    """
+    __slots__ = ("id", "kind", "title", "open_time", "close_time", "class_id")
 
-            cookie = account.get("cookie")
-            class_id = account.get("class_id")
+    GPS = "gps"
+    QR = "qr"
+    PWD = "pwd"
 
-            if not cookie or not class_id:
-                self.log(f"账号 [{acc_name}] 配置不完整 (缺少Cookie或ClassID)，跳过")
-                continue
+    def __init__(self, card_id, kind=GPS, title="", open_time=None, close_time=None, class_id=None):
+        self.id = card_id
+        self.kind = kind
+        self.title = title
+        self.open_time = open_time
+        self.close_time = close_time
+        self.class_id = class_id
 
-            # Use cached client or create new one
-            client_key = (cookie, class_id)
-            if client_key not in client_cache:
-                client_cache[client_key] = BJMFClient(cookie, class_id)
+    def is_closed(self, now=None):
+        """
+        Returns:
+            bool: True if the card shows a close time that has passed.
+        """
+        return self.close_time is not None and self.close_time <= (now or datetime.now())
 
-            client = client_cache[client_key]
+    def is_open(self, now=None):
+        """
+        Returns:
+            bool: False if the card shows an open time that has not been reached yet.
+        """
+        return self.open_time is None or self.open_time <= (now or datetime.now())
 
-            self.log(f"正在执行任务: [{acc_name}] @ [{loc_name}]")
+    def __repr__(self):
+        return f"PunchCard({self.id!r}, {self.kind!r}, {self.title!r})"
 
-            pending_tasks = client.fetch_tasks()
-            
-            if pending_tasks is None:
-                # Avoid duplicate error messages for the same account in one run
-                msg = f"任务 {acc_name}: Cookie 失效 ❌"
-                if msg not in push_messages:
-                    push_messages.append(msg)
-                continue
-            
-            if not pending_tasks:
-                self.log(f"账号 [{acc_name}] 无需签到")
-                continue
 
-            # 开始签到
-            lat = location.get("lat", "0")
-            lng = location.get("lng", "0")
-            acc = location.get("acc", "0")
-            pwd = account.get("pwd", "")
+class PageCache:
+    """
+    Shared cache of parsed punch pages, keyed by (cookie, class ID).
 
-            r_lat, r_lng, r_acc = self._get_jittered_location(lat, lng, acc)
+    Stores the validators (ETag / Last-Modified) for conditional requests and
+    a digest of the last body together with the pending cards parsed from it,
+    so an unchanged page is neither re-downloaded (304) nor re-parsed.
+    """
+    def __init__(self, max_entries=4096):
+        """
+        Args:
+            max_entries (int): Maximum number of pages kept (least recently used are dropped).
+        """
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (etag, last_modified, digest, cards)
+        self.not_modified = 0
+        self.hash_hits = 0
+        self.misses = 0
 
-            for task_id in pending_tasks:
-                result = client.execute_sign(task_id, r_lat, r_lng, r_acc, pwd)
-                self.log(f"任务 [{acc_name}] 签到ID [{task_id}] 结果: {result}")
-                
-                status_icon = "✅" if "成功" in result else "❌"
-                push_messages.append(f"任务 {acc_name} @ {loc_name}: {result} {status_icon}")
-                
-                if "成功" not in result:
-                    needs_retry = True
+    def get(self, key):
+        """
+        Returns:
+            tuple: (etag, last_modified, digest, cards), or None if the page is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
 
-        # 发送推送
-        if push_messages:
-            self._push_notify("\n".join(push_messages))
-        
-        self.log("--- 本次任务结束 ---")
-        return needs_retry
+    def put(self, key, etag, last_modified, digest, cards):
+        """
+        Store the validators, body digest and parsed cards of a page.
+        """
+        with self._lock:
+            self._entries[key] = (etag, last_modified, digest, tuple(cards))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
 
-    def run_with_retries(self):
+    def discard(self, key):
         """
-        Run the check-in flow with a retry mechanism.
+        Drop a cached page (e.g. when the cookie turned out to be invalid).
+        """
+        with self._lock:
+            self._entries.pop(key, None)
 
-        If the initial run has failures, it will retry after 5 and 15 minutes.
+    def count(self, outcome):
         """
-        # 初次运行
-        failed = self.run_check_flow()
-        
-        # 如果有失败，进行有限次重试
-        if failed:
-            retries = [5, 15] # 分别在 5分钟 和 15分钟 后重试
-            for wait_min in retries:
-                self.log(f"检测到失败任务，将在 {wait_min} 分钟后重试...")
-                time.sleep(wait_min * 60)
-                failed = self.run_check_flow()
-                if not failed:
-                    break
-            if failed:
-                self.log("多次重试后仍有任务失败，放弃。")
+        Count one lookup outcome.
+
+        Args:
+            outcome (str): "not_modified", "hash_hits" or "misses".
+        """
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def stats(self):
+        """
+        Returns:
+            dict: {"not_modified", "hash_hits", "misses", "entries"} counters.
+        """
+        with self._lock:
+            return {
+                "not_modified": self.not_modified,
+                "hash_hits": self.hash_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
+
+
+class BJMFClient:
+    """
+    Client for interacting with the Class Cube (BJMF) server.
+
+    Handles HTTP requests, session management, and parsing server responses.
+    """
+    SERVER = "k8n.cn"
+    # 默认超时 (秒): 连接 / 读取
+    CONNECT_TIMEOUT = 5
+    READ_TIMEOUT = 15
+    # 视为服务器不可用的响应状态码
+    UNAVAILABLE_STATUS = (502, 503, 504)
+    # 模拟微信内置浏览器 UA
+    UA = "Mozilla/5.0 (Linux; Android 12; PAL-AL00 Build/HUAWEIPAL-AL00; wv) AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 Chrome/116.0.0.0 Mobile Safari/537.36 XWEB/1160065 MMWEBSDK/20231202 MMWEBID/1136 MicroMessenger/8.0.47.2560(0x28002F35) WeChat/arm64 Weixin NetType/4G Language/zh_CN ABI/arm64"
+
+    def __init__(self, cookie, class_id, pool_maxsize=None, limiter=None, breaker=None, page_cache=None):
+        """
+        Initialize the BJMFClient.
+
+        Args:
+            cookie (str): The user's authentication cookie.
+            class_id (str): The class ID to check tasks for, or several separated by commas.
+                            All classes share this client's session and connections.
+            pool_maxsize (int, optional): Keep-alive connections kept per host. Defaults to requests' default (10).
+            limiter (AdaptiveLimiter, optional): Shared controller bounding concurrent requests to the server.
+            breaker (CircuitBreaker, optional): Shared circuit breaker for the server.
+            page_cache (PageCache, optional): Shared cache enabling conditional fetches of the punch page.
+        """
+        self.cookie = cookie
+        self.class_ids = Account.split_class_ids(class_id)
+        # 第一个班级为默认班级
+        self.class_id = self.class_ids[0] if self.class_ids else ""
+        self.pool_maxsize = pool_maxsize
+        self.limiter = limiter
+        self.breaker = breaker
+        self.page_cache = page_cache
+        import requests
+        self.session = requests.Session()
+        if pool_maxsize:
+            # 只访问单一主机，因此 pool_connections=1，按需调整每主机连接数
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+        self.session.headers.update(self._get_headers())
+        # 尝试提取用户名用于日志显示
+        self.username = self._extract_username(cookie)
+
+    def warm_up(self, timeout=5):
+        """
+        Open a keep-alive connection to the server ahead of real requests.
+
+        Sends a lightweight HEAD request so DNS resolution and the TCP connect
+        happen now, leaving an idle pooled socket for the next fetch_tasks.
+
+        Args:
+            timeout (float): Request timeout in seconds.
+
+        Returns:
+            bool: True if the connection was established.
+        """
+        try:
+            self.session.head(f"http://{self.SERVER}/", timeout=timeout, allow_redirects=False)
+            return True
+        except Exception as e:
+            logger.debug(f"用户 [{self.username}] 预热连接失败: {e}")
+            return False
+
+    def close(self):
+        """
+        Close the underlying session and its pooled connections.
+        """
+        try:
+            self.session.close()
+        except Exception:
+            pass
+
+    def _extract_username(self, cookie):
+        """
+        Extract the username from the cookie.
+
+        Args:
+            cookie (str): The cookie string.
+
+        Returns:
+            str: The extracted username or "Unknown".
+        """
+        match = re.search(r'username=([^;]+)', cookie)
+        return match.group(1) if match else "Unknown"
+
+    def _get_headers(self):
+        """
+        Generate HTTP headers for requests.
+
+        Returns:
+            dict: A dictionary of HTTP headers including User-Agent and Cookie.
+        """
+        return {
+            "User-Agent": self.UA,
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/wxpic,image/tpg,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+            "X-Requested-With": "com.tencent.mm",
+            "Accept-Encoding": "gzip, deflate",
+            "Accept-Language": "zh-CN,zh-SG;q=0.9,zh;q=0.8,en-SG;q=0.7,en-US;q=0.6,en;q=0.5",
+            "Cookie": self.cookie,
+        }
+
+    def _referer(self, class_id):
+        """
+        Build the Referer for requests about one class (the class's course page).
+
+        Args:
+            class_id (str): The class ID.
+
+        Returns:
+            dict: The Referer header.
+        """
+        return {"Referer": f"http://{self.SERVER}/student/course/{class_id}"}
+
+    def _timeout(self, deadline):
+        """
+        Get the (connect, read) timeout for the next request.
+
+        Args:
+            deadline (RunDeadline, optional): The run's deadline budget.
+
+        Returns:
+            tuple: (connect_timeout, read_timeout).
+
+        Raises:
+            DeadlineExceeded: If the deadline leaves no time for a request.
+        """
+        if deadline is None:
+            return self.CONNECT_TIMEOUT, self.READ_TIMEOUT
+        return deadline.timeout(self.CONNECT_TIMEOUT, self.READ_TIMEOUT)
+
+    @staticmethod
+    def _is_connection_error(error):
+        """
+        Check whether an exception means the server could not be reached.
+
+        Args:
+            error (Exception): The exception raised by requests.
+
+        Returns:
+            bool: True for connection errors and timeouts.
+        """
+        import requests
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+    def _request(self, method, url, deadline=None, **kwargs):
+        """
+        Send a request to the server through the circuit breaker and limiter.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The request URL.
+            deadline (RunDeadline, optional): The run's deadline budget.
+            **kwargs: Passed on to requests.Session.request.
+
+        Returns:
+            requests.Response: The server response.
+
+        Raises:
+            CircuitOpen: If the server's circuit is open.
+            DeadlineExceeded: If the deadline runs out before the request is sent.
+        """
+        if self.breaker is not None:
+            self.breaker.before_request(None if deadline is None else deadline.remaining())
+        reachable = None  # None: 请求未发出
+        try:
+            r = self._send(method, url, deadline, **kwargs)
+            reachable = r.status_code not in self.UNAVAILABLE_STATUS
+            return r
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            reachable = not self._is_connection_error(e)
+            raise
+        finally:
+            if self.breaker is not None:
+                self.breaker.record(reachable)
+
+    def _send(self, method, url, deadline=None, **kwargs):
+        """
+        Send a request to the server through the shared limiter.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The request URL.
+            deadline (RunDeadline, optional): The run's deadline budget.
+            **kwargs: Passed on to requests.Session.request.
+
+        Returns:
+            requests.Response: The server response.
+
+        Raises:
+            DeadlineExceeded: If the deadline runs out before or while waiting for a slot.
+        """
+        if self.limiter is None:
+            return self.session.request(method, url, timeout=self._timeout(deadline), **kwargs)
+
+        wait = None if deadline is None else deadline.remaining()
+        if not self.limiter.acquire(self.SERVER, wait):
+            raise DeadlineExceeded("等待并发名额超时")
+        started = time.monotonic()
+        latency = None
+        ok = False
+        try:
+            timeout = self._timeout(deadline)
+            r = self.session.request(method, url, timeout=timeout, **kwargs)
+            ok = r.status_code < 500
+            latency = time.monotonic() - started
+            return r
+        except DeadlineExceeded:
+            raise
+        except Exception:
+            latency = time.monotonic() - started
+            raise
+        finally:
+            self.limiter.release(latency, ok)
+
+    # 卡片中带标签的时间, 例如 "截止时间: 2024-03-01 08:00" 或 "开始 2024-03-01 08:00:00"
+    # 未标注的时间 (如发布时间) 含义不明, 不作为开始/截止时间
+    _CARD_TIME = r"(\d{4}-\d{1,2}-\d{1,2} \d{1,2}:\d{2}(?::\d{2})?)"
+    _CARD_CLOSE_RE = re.compile(r"(?:截止|结束)[^\d]{0,8}" + _CARD_TIME)
+    _CARD_OPEN_RE = re.compile(r"(?:开始|开放)[^\d]{0,8}" + _CARD_TIME)
+
+    @staticmethod
+    def _parse_card_time(pattern, text):
+        """
+        Find the first time in the text that follows the pattern's label.
+
+        Returns:
+            datetime: The parsed time, or None if there is no labelled time.
+        """
+        match = pattern.search(text)
+        if not match:
+            return None
+        for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+            try:
+                return datetime.strptime(match.group(1), fmt)
+            except ValueError:
+                continue
+        return None
+
+    def _parse_card(self, card, match):
+        """
+        Build a PunchCard from one card-body element.
+
+        Args:
+            card (bs4.element.Tag): The card element.
+            match (re.Match): The ID match ("punchcard" or "punch_pwd_frm", ID).
+
+        Returns:
+            PunchCard: The parsed card.
+        """
+        text = card.get_text(" ", strip=True)
+        if match.group(1) == "punch_pwd_frm":
+            kind = PunchCard.PWD
+        elif "二维码" in text or "扫码" in text:
+            kind = PunchCard.QR
+        else:
+            kind = PunchCard.GPS
+
+        heading = card.find(["h1", "h2", "h3", "h4", "h5", "h6"]) or card.find(class_="card-title")
+        title = heading.get_text(" ", strip=True) if heading else ""
+
+        open_time = self._parse_card_time(self._CARD_OPEN_RE, text)
+        close_time = self._parse_card_time(self._CARD_CLOSE_RE, text)
+
+        return PunchCard(match.group(2), kind, title, open_time, close_time)
+
+    def fetch_all(self, deadline=None):
+        """
+        Fetch the pending check-in cards of all the client's classes.
+
+        With several classes the punch pages are fetched concurrently over the
+        shared session (bounded by its connection pool and the shared limiter).
+
+        Args:
+            deadline (RunDeadline, optional): Caps the request timeouts to the run's remaining budget.
+
+        Returns:
+            list: PunchCard records of all classes (each carries its class_id).
+            None: If the session/cookie is invalid.
+
+        Raises:
+            DeadlineExceeded: If the deadline leaves no time for a request.
+            CircuitOpen: If the server's circuit is open, or (with a breaker attached) the server is unreachable.
+        """
+        if len(self.class_ids) <= 1:
+            return self.fetch_tasks(deadline)
+
+        from concurrent.futures import ThreadPoolExecutor
+        workers = min(len(self.class_ids), self.pool_maxsize or 10)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pages = list(pool.map(lambda cid: self.fetch_tasks(deadline, cid), self.class_ids))
+        # Cookie 对所有班级通用，任一页面判定失效即视为失效
+        if any(page is None for page in pages):
+            return None
+        return [card for page in pages for card in page]
+
+    def fetch_tasks(self, deadline=None, class_id=None):
+        """
+        Fetch all pending check-in cards of one class.
+
+        Scrapes the course page to find check-in cards that are not yet marked as "Signed".
+
+        Args:
+            deadline (RunDeadline, optional): Caps the request timeouts to the run's remaining budget.
+            class_id (str, optional): The class to fetch. Defaults to the client's first class.
+
+        Returns:
+            list: A list of PunchCard records if successful.
+            None: If the session/cookie is invalid.
+            list: An empty list if no tasks are found or an error occurs.
+
+        Raises:
+            DeadlineExceeded: If the deadline leaves no time for the request.
+            CircuitOpen: If the server's circuit is open, or (with a breaker attached) the server is unreachable.
+        """
+        class_id = class_id or self.class_id
+        url = f"http://{self.SERVER}/student/course/{class_id}/punchs"
+        cache_key = (self.cookie, class_id)
+        cached = self.page_cache.get(cache_key) if self.page_cache is not None else None
+        headers = self._referer(class_id)
+        if cached:
+            # 条件请求: 服务器支持时未变化的页面返回 304
+            if cached[0]:
+                headers["If-None-Match"] = cached[0]
+            if cached[1]:
+                headers["If-Modified-Since"] = cached[1]
+        try:
+            r = self._request("GET", url, deadline, headers=headers)
+            if cached and r.status_code == 304:
+                self.page_cache.count("not_modified")
+                return list(cached[3])
+
+            digest = None
+            if self.page_cache is not None:
+                import hashlib
+                digest = hashlib.blake2b(r.content, digest_size=16).digest()
+                etag, last_modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+                if cached and cached[2] == digest:
+                    # 页面内容未变化，直接复用上次解析结果 (并刷新校验头)
+                    self.page_cache.count("hash_hits")
+                    if (etag, last_modified) != cached[:2]:
+                        self.page_cache.put(cache_key, etag, last_modified, digest, cached[3])
+                    return list(cached[3])
+                self.page_cache.count("misses")
+
+            # 检查 Cookie 是否有效
+            if "出错" in r.text or ("登录" in r.text and "输入密码" in r.text):
+                logger.error(f"用户 [{self.username}] Cookie 已失效或需登录")
+                if self.page_cache is not None:
+                    self.page_cache.discard(cache_key)
+                return None # None 表示 Cookie 失效
+
+            from bs4 import BeautifulSoup
+            soup = BeautifulSoup(r.text, "html.parser")
+            cards = soup.find_all("div", class_="card-body")
+            
+            pending = []
+            for card in cards:
+                card_str = str(card)
+                # 核心逻辑：如果包含“已签”，则跳过
+                if "已签" in card_str:
+                    continue
+                
+                # 提取 ID (兼容普通签到和密码签到)
+                match = re.search(r'(punchcard|punch_pwd_frm)_(\d+)', card_str)
+                if match:
+                    punch_card = self._parse_card(card, match)
+                    punch_card.class_id = class_id
+                    pending.append(punch_card)
+
+            if digest is not None:
+                self.page_cache.put(cache_key, etag, last_modified, digest, pending)
+            return pending
+        except (DeadlineExceeded, CircuitOpen):
+            raise
+        except Exception as e:
+            if self.breaker is not None and self._is_connection_error(e):
+                # 服务器不可达不等于“没有签到”，交给调用方顺延重试
+                raise CircuitOpen(f"服务器不可达: {e}") from e
+            logger.error(f"用户 [{self.username}] 获取任务列表失败: {e}")
+            return []
+
+    def execute_sign(self, sign_id, lat, lng, acc, pwd="", deadline=None, class_id=None):
+        """
+        Execute a single check-in request.
+
+        Args:
+            sign_id (str): The ID of the check-in task.
+            lat (str/float): Latitude for the check-in.
+            lng (str/float): Longitude for the check-in.
+            acc (str/float): Accuracy of the location.
+            pwd (str, optional): Password for password-protected check-ins. Defaults to "".
+            deadline (RunDeadline, optional): Caps the request timeouts to the run's remaining budget.
+            class_id (str, optional): The class the check-in belongs to. Defaults to the client's first class.
+
+        Returns:
+            SignResult: The parsed outcome with the server message (or error text).
+
+        Raises:
+            DeadlineExceeded: If the deadline leaves no time for the request.
+            CircuitOpen: If the server's circuit is open.
+        """
+        class_id = class_id or self.class_id
+        url = f"http://{self.SERVER}/student/punchs/course/{class_id}/{sign_id}"
+        data = {
+            "id": sign_id,
+            "lat": lat,
+            "lng": lng,
+            "acc": acc,
+            "res": "",
+            "gps_addr": "",
+            "pwd": pwd
+        }
+        try:
+            r = self._request("POST", url, deadline, data=data, headers=self._referer(class_id))
+            from bs4 import BeautifulSoup
+            soup = BeautifulSoup(r.text, "html.parser")
+            h1 = soup.find("h1")
+            message = h1.text if h1 else "未知响应"
+            return SignResult(sign_id, SignStatus.parse(message), message)
+        except (DeadlineExceeded, CircuitOpen):
+            raise
+        except Exception as e:
+            logger.error(f"签到请求异常: {e}")
+            return SignResult(sign_id, SignStatus.ERROR, str(e))
+
+class ClientPool:
+    """
+    LRU pool of BJMFClient instances that outlives individual runs.
+
+    Clients (and their keep-alive connections) are reused across scheduled runs
+    and retries. An entry is replaced when the account's cookie or class ID
+    changes, dropped after idle_timeout seconds without use, and the least
+    recently used entry is evicted once max_size is exceeded.
+    """
+    def __init__(self, max_size=256, idle_timeout=900, pool_maxsize=4, limiter=None, breaker=None, page_cache=None):
+        """
+        Args:
+            max_size (int): Maximum number of clients kept.
+            idle_timeout (float): Seconds after which an unused client is closed.
+            pool_maxsize (int): Keep-alive connections per host for each client's session.
+            limiter (AdaptiveLimiter, optional): Concurrency controller shared by all clients.
+            breaker (CircuitBreaker, optional): Circuit breaker shared by all clients.
+            page_cache (PageCache, optional): Punch page cache shared by all clients.
+        """
+        self.max_size = max(1, int(max_size))
+        self.idle_timeout = float(idle_timeout)
+        self.pool_maxsize = pool_maxsize
+        self.limiter = limiter
+        self.breaker = breaker
+        self.page_cache = page_cache
+        self._lock = threading.Lock()
+        self._clients = OrderedDict()  # acc_name -> [client, (cookie, class_id), last_used]
+
+    def get(self, acc_name, cookie, class_id):
+        """
+        Get the pooled client for an account, creating or replacing it as needed.
+
+        Args:
+            acc_name (str): The account name (pool key).
+            cookie (str): The account's current cookie.
+            class_id (str): The account's current class ID(s), comma-separated.
+
+        Returns:
+            BJMFClient: A client bound to the given cookie and classes.
+        """
+        now = time.time()
+        stale = []
+        with self._lock:
+            entry = self._clients.pop(acc_name, None)
+            if entry and (entry[1] != (cookie, class_id) or now - entry[2] > self.idle_timeout):
+                stale.append(entry[0])
+                entry = None
+            if entry is None:
+                client = BJMFClient(cookie, class_id, pool_maxsize=self.pool_maxsize, limiter=self.limiter,
+                                    breaker=self.breaker, page_cache=self.page_cache)
+                entry = [client, (cookie, class_id), now]
+            entry[2] = now
+            self._clients[acc_name] = entry
+            while len(self._clients) > self.max_size:
+                _, evicted = self._clients.popitem(last=False)
+                stale.append(evicted[0])
+        for client in stale:
+            client.close()
+        return entry[0]
+
+    def invalidate(self, acc_name):
+        """
+        Drop the client of one account.
+
+        Args:
+            acc_name (str): The account name.
+        """
+        with self._lock:
+            entry = self._clients.pop(acc_name, None)
+        if entry:
+            entry[0].close()
+
+    def retain(self, acc_names):
+        """
+        Drop clients of accounts that no longer exist.
+
+        Args:
+            acc_names (iterable): Names of the accounts to keep.
+        """
+        keep = set(acc_names)
+        with self._lock:
+            removed = [self._clients.pop(name) for name in list(self._clients) if name not in keep]
+        for entry in removed:
+            entry[0].close()
+
+    def evict_idle(self):
+        """
+        Close clients that have been idle longer than idle_timeout.
+
+        Returns:
+            int: The number of evicted clients.
+        """
+        cutoff = time.time() - self.idle_timeout
+        with self._lock:
+            removed = [self._clients.pop(name) for name, entry in list(self._clients.items()) if entry[2] < cutoff]
+        for entry in removed:
+            entry[0].close()
+        return len(removed)
+
+    def clear(self):
+        """
+        Close and drop all clients.
+        """
+        with self._lock:
+            removed = list(self._clients.values())
+            self._clients.clear()
+        for entry in removed:
+            entry[0].close()
+
+    def __len__(self):
+        return len(self._clients)
+
+# ===========================
+# 4. 任务调度与执行模块
+# ===========================
+
+class RunProgress:
+    """
+    Thread-safe progress model for a single check-in run.
+
+    Counts tasks as queued, in flight, done or failed and derives throughput
+    and ETA from the elapsed time. Listeners receive snapshots rather than the
+    live object so they can render without holding the lock.
+    """
+    def __init__(self, total=0):
+        """
+        Initialize the progress model.
+
+        Args:
+            total (int): The number of tasks queued for this run.
+        """
+        self._lock = threading.Lock()
+        self.total = total
+        self.queued = total
+        self.in_flight = 0
+        self.done = 0
+        self.failed = 0
+        self.at_risk = 0
+        self.started_at = time.time()
+        self.finished_at = None
+
+    def start_task(self):
+        """Move one task from queued to in flight."""
+        with self._lock:
+            self.queued = max(0, self.queued - 1)
+            self.in_flight += 1
+
+    def finish_task(self, ok=True):
+        """
+        Mark one in-flight task as finished.
+
+        Args:
+            ok (bool): False if the task failed.
+        """
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            if ok:
+                self.done += 1
+            else:
+                self.failed += 1
+
+    def mark_at_risk(self, count=1):
+        """
+        Count check-ins that are dispatched so close to their deadline that they
+        may miss it, or that were found already closed.
+
+        Args:
+            count (int): How many to add (e.g. a worker process's total).
+        """
+        with self._lock:
+            self.at_risk += count
+
+    def skip_task(self):
+        """Drop one queued task that will not be executed (e.g. invalid config)."""
+        with self._lock:
+            self.queued = max(0, self.queued - 1)
+            self.total = max(0, self.total - 1)
+
+    def finish(self):
+        """Mark the run as finished."""
+        with self._lock:
+            self.finished_at = time.time()
+
+    def snapshot(self):
+        """
+        Get an immutable view of the current progress.
+
+        Returns:
+            dict: Counters (incl. "at_risk") plus "throughput" (tasks/s), "eta" (seconds, or None
+                  while unknown) and "running".
+        """
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = max(end - self.started_at, 1e-6)
+            completed = self.done + self.failed
+            throughput = completed / elapsed
+            remaining = self.queued + self.in_flight
+            eta = remaining / throughput if throughput > 0 else None
+            return {
+                "total": self.total,
+                "queued": self.queued,
+                "in_flight": self.in_flight,
+                "done": self.done,
+                "failed": self.failed,
+                "at_risk": self.at_risk,
+                "elapsed": elapsed,
+                "throughput": throughput,
+                "eta": eta,
+                "running": self.finished_at is None,
+            }
+
+
+class TaskResult(namedtuple("TaskResult", "account location status sign_id message")):
+    """
+    Compact, picklable outcome of one task or sign attempt.
+
+    Attributes:
+        account (str): The account name.
+        location (str): The location name.
+        status (str): One of the status constants below.
+        sign_id (str): The check-in ID, or None when no sign was attempted.
+        message (str): The server message or error text, or None.
+    """
+    __slots__ = ()
+
+    OK = "ok"
+    FAILED = "failed"
+    IDLE = "idle"
+    SKIPPED = "skipped"
+    COOKIE_INVALID = "cookie_invalid"
+    ERROR = "error"
+    DEFERRED = "deferred"
+
+
+class WorkItem(namedtuple("WorkItem", "acc_name loc_name account location")):
+    """
+    One resolved, runnable task produced by CheckInManager._compile_tasks.
+
+    Attributes:
+        acc_name (str): The account name.
+        loc_name (str): The location name.
+        account (Account): The account record.
+        location (Location): The location record.
+    """
+    __slots__ = ()
+
+
+class ConfigSnapshot:
+    """
+    Read-only configuration view used inside worker processes.
+
+    Mirrors ConfigManager.get() without touching the configuration file.
+    """
+    def __init__(self, data, config_path=None):
+        """
+        Args:
+            data (dict): The configuration data to expose.
+            config_path (str, optional): Path of the originating config file; its directory
+                                         holds shared state such as the sign ledger.
+        """
+        self.data = data
+        self.config_path = config_path
+
+    def get(self, key, default=None):
+        """
+        Get a configuration value.
+
+        Args:
+            key (str): The configuration key to retrieve.
+            default (Any, optional): The default value if the key is missing.
+
+        Returns:
+            Any: The configuration value or the default.
+        """
+        return self.data.get(key, default)
+
+
+def shard_groups(groups, workers):
+    """
+    Split account groups into at most `workers` balanced shards.
+
+    Uses longest-processing-time-first assignment on the number of tasks per
+    account, which is deterministic for a given config.
+
+    Args:
+        groups (list): Account groups from CheckInManager._compile_tasks.
+        workers (int): The maximum number of shards.
+
+    Returns:
+        list: Non-empty shards, each a list of (group_index, group) tuples.
+    """
+    count = max(1, min(workers, len(groups)))
+    shards = [[] for _ in range(count)]
+    loads = [0] * count
+    order = sorted(range(len(groups)), key=lambda i: (-len(groups[i]), i))
+    for gi in order:
+        target = loads.index(min(loads))
+        shards[target].append((gi, groups[gi]))
+        loads[target] += len(groups[gi])
+    for shard in shards:
+        shard.sort(key=lambda entry: entry[0])
+    return [shard for shard in shards if shard]
+
+
+def _run_shard(config_data, config_path, shard, budget=None):
+    """
+    Worker-process entry point: execute one shard of account groups.
+
+    Args:
+        config_data (dict): Configuration data snapshot from the parent.
+        config_path (str): Path of the parent's config file.
+        shard (list): (group_index, group) tuples to execute.
+        budget (float, optional): Seconds left in the parent's run budget.
+
+    Returns:
+        tuple: ([(group_index, [TaskResult, ...]), ...], at_risk) - the results and
+               the number of at-risk or missed check-ins counted by this worker.
+    """
+    manager = CheckInManager(ConfigSnapshot(config_data, config_path))
+    manager.deadline = RunDeadline(budget)
+    results = [(gi, manager._run_group(group)) for gi, group in shard]
+    return results, manager.progress.snapshot()["at_risk"]
+
+
+class SignLedger:
+    """
+    Durable, append-only ledger of successful signs.
+
+    Each success is appended as one JSON line and fsynced, and an in-memory set
+    answers "already signed?" without touching the disk. Entries older than
+    retention_days are ignored on load and removed from the file by compact().
+    """
+    def __init__(self, path, retention_days=7):
+        """
+        Args:
+            path (str): Path of the JSONL ledger file.
+            retention_days (float): How long entries are kept.
+        """
+        self.path = path
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._index = set()
+        self._load()
+
+    def _read(self):
+        """
+        Read the unexpired entries of the ledger file.
+
+        Returns:
+            tuple: (keys, lines, dropped) - the entry keys, their raw lines and
+                   the number of expired or corrupt lines.
+        """
+        cutoff = time.time() - self.retention_days * 86400
+        keys = set()
+        kept = []
+        dropped = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                    key = (rec["account"], rec["class_id"], rec["sign_id"])
+                except (ValueError, KeyError, TypeError):
+                    # 崩溃时可能留下半行，直接丢弃
+                    dropped += 1
+                    continue
+                if rec.get("ts", 0) < cutoff:
+                    dropped += 1
+                    continue
+                keys.add(key)
+                kept.append(line if line.endswith("\n") else line + "\n")
+        return keys, kept, dropped
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            self._index, _, _ = self._read()
+        except OSError as e:
+            logger.warning(f"签到账本读取失败: {e}")
+
+    def compact(self):
+        """
+        Rewrite the ledger file without expired entries.
+
+        Must not run while other processes append to the same ledger (e.g.
+        shard workers); CheckInManager only calls it from the coordinating
+        process after a run.
+
+        Returns:
+            int: The number of dropped lines.
+        """
+        if not os.path.exists(self.path):
+            return 0
+        import tempfile
+        with self._lock:
+            try:
+                keys, kept, dropped = self._read()
+            except OSError as e:
+                logger.warning(f"签到账本读取失败: {e}")
+                return 0
+            if not dropped:
+                return 0
+            directory, name = os.path.split(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.writelines(kept)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning(f"签到账本压缩失败: {e}")
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                return 0
+            self._index = keys
+        return dropped
+
+    def _ends_with_newline(self):
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) == b"\n"
+        except OSError:
+            # 文件不存在或为空
+            return True
+
+    def contains(self, account, class_id, sign_id):
+        """
+        Check whether a sign already succeeded.
+
+        Returns:
+            bool: True if (account, class_id, sign_id) is in the ledger.
+        """
+        return (account, str(class_id), str(sign_id)) in self._index
+
+    def record(self, account, class_id, sign_id):
+        """
+        Append a successful sign to the ledger.
+
+        Args:
+            account (str): The account name.
+            class_id (str): The class ID.
+            sign_id (str): The check-in ID.
+        """
+        key = (account, str(class_id), str(sign_id))
+        with self._lock:
+            if key in self._index:
+                return
+            line = json.dumps({"account": key[0], "class_id": key[1], "sign_id": key[2], "ts": time.time()},
+                              ensure_ascii=False)
+            try:
+                # 崩溃留下的半行不能与新记录拼接在一起
+                prefix = "" if self._ends_with_newline() else "\n"
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(prefix + line + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as e:
+                logger.warning(f"签到账本写入失败: {e}")
+            self._index.add(key)
+
+
+class RunCheckpoint:
+    """
+    Crash-safe checkpoint of the accounts a run has completed.
+
+    The checkpoint is rewritten atomically (temp file + os.replace) after each
+    account. If a run with the same key is started while an unfinished and
+    recent checkpoint exists (i.e. the previous run was interrupted), the
+    completed accounts are skipped.
+    """
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Path of the JSON checkpoint file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self.run_key = None
+        self.completed = set()
+
+    def begin(self, run_key, max_age=None):
+        """
+        Start or resume a run.
+
+        Args:
+            run_key (str): Identifier of the logical run (e.g. date + schedule time).
+            max_age (float, optional): Only resume a checkpoint updated within this many seconds.
+
+        Returns:
+            set: Account names already completed by an interrupted run with the same key.
+        """
+        state = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"运行检查点读取失败: {e}")
+
+        with self._lock:
+            self.run_key = run_key
+            fresh = max_age is None or time.time() - state.get("ts", 0) <= max_age
+            if state.get("run_key") == run_key and not state.get("finished") and fresh:
+                self.completed = set(state.get("completed", []))
+            else:
+                self.completed = set()
+            self._save(finished=False)
+            return set(self.completed)
+
+    def mark_done(self, acc_name):
+        """
+        Record that an account needs no further work in this run.
+
+        Args:
+            acc_name (str): The account name.
+        """
+        with self._lock:
+            if acc_name not in self.completed:
+                self.completed.add(acc_name)
+                self._save(finished=False)
+
+    def finish(self):
+        """
+        Mark the run as finished so the next run starts from scratch.
+        """
+        with self._lock:
+            if self.run_key is not None:
+                self._save(finished=True)
+
+    def _save(self, finished):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"run_key": self.run_key, "finished": finished, "ts": time.time(),
+                           "completed": sorted(self.completed)}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"运行检查点保存失败: {e}")
+
+
+class InvalidCookieCache:
+    """
+    Persistent negative cache of cookies the server rejected.
+
+    Entries are keyed by the SHA-256 of the cookie, so editing an account's
+    cookie naturally bypasses the cache; otherwise entries expire after ttl_hours.
+    """
+    def __init__(self, path, ttl_hours=24):
+        """
+        Args:
+            path (str): Path of the JSON cache file.
+            ttl_hours (float): How long a rejected cookie is skipped.
+        """
+        self.path = path
+        self.ttl = float(ttl_hours) * 3600
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"失效 Cookie 缓存读取失败: {e}")
+
+    @staticmethod
+    def _key(cookie):
+        import hashlib
+        return hashlib.sha256(cookie.encode("utf-8")).hexdigest()
+
+    def contains(self, cookie):
+        """
+        Check whether a cookie is known to be invalid and not yet expired.
+
+        Args:
+            cookie (str): The cookie string.
+
+        Returns:
+            bool: True if the account should be skipped.
+        """
+        entry = self._entries.get(self._key(cookie or ""))
+        return bool(entry) and time.time() - entry.get("ts", 0) < self.ttl
+
+    def add(self, cookie, account):
+        """
+        Remember a rejected cookie.
+
+        Args:
+            cookie (str): The cookie string.
+            account (str): The account name (for reporting only).
+        """
+        with self._lock:
+            key = self._key(cookie)
+            # 刷新时间戳时保留“已通知”标记，同一 Cookie 只提醒一次
+            notified = self._entries.get(key, {}).get("notified", False)
+            self._entries[key] = {"account": account, "ts": time.time(), "notified": notified}
+            self._save()
+
+    def claim_notification(self, cookie):
+        """
+        Mark a cached cookie as reported, so the re-login notice is pushed once per cookie.
+
+        Args:
+            cookie (str): The cookie string.
+
+        Returns:
+            bool: True if the cookie has not been reported yet (or is not cached).
+        """
+        with self._lock:
+            entry = self._entries.get(self._key(cookie or ""))
+            if entry is None:
+                return True
+            if entry.get("notified"):
+                return False
+            entry["notified"] = True
+            self._save()
+            return True
+
+    def discard(self, cookie):
+        """
+        Forget a cookie, e.g. after it worked again.
+
+        Args:
+            cookie (str): The cookie string.
+        """
+        with self._lock:
+            if self._entries.pop(self._key(cookie or ""), None) is not None:
+                self._save()
+
+    def _save(self):
+        now = time.time()
+        self._entries = {k: v for k, v in self._entries.items() if now - v.get("ts", 0) < self.ttl}
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"失效 Cookie 缓存保存失败: {e}")
+
+
+def data_path(cfg, name):
+    """
+    Build the path of a state file stored next to the config file.
+
+    Args:
+        cfg (ConfigManager): The configuration (anything with an optional config_path).
+        name (str): The file name.
+
+    Returns:
+        str: The absolute path (in the working directory if there is no config file).
+    """
+    config_path = getattr(cfg, "config_path", None)
+    base_dir = os.path.dirname(os.path.abspath(config_path)) if config_path else os.getcwd()
+    return os.path.join(base_dir, name)
+
+
+class RunHistory:
+    """
+    Append-only history of every fetch and sign request, stored in SQLite.
+
+    One row per request with its timestamp, duration and status. Rows older
+    than retention_days are deleted by compact(). Indexes on (account, ts) and
+    (day) keep the per-account and per-day queries off full scans.
+    """
+    # 统计/查询中视为失败的状态
+    FAILURE_STATUSES = ("failed", "error", "cookie_invalid", "deferred")
+
+    def __init__(self, path, retention_days=90, read_only=False):
+        """
+        Args:
+            path (str): Path of the SQLite database file.
+            retention_days (float): How long rows are kept.
+            read_only (bool): Open an existing database for queries only; nothing is
+                              created or migrated.
+
+        Raises:
+            FileNotFoundError: If read_only is set and the database does not exist.
+        """
+        self.path = path
+        self.retention_days = retention_days
+        self.read_only = read_only
+        if read_only:
+            if not os.path.exists(self.path):
+                raise FileNotFoundError(f"运行历史不存在: {self.path}")
+            return
+        import sqlite3
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            # 必须先于任何写入 (包括切换 WAL) 设置，之后 compact() 可增量回收空间
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                " id INTEGER PRIMARY KEY, ts REAL NOT NULL, day TEXT NOT NULL, run_key TEXT,"
+                " account TEXT NOT NULL, location TEXT, kind TEXT NOT NULL, sign_id TEXT,"
+                " status TEXT NOT NULL, duration_ms REAL, message TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_events_account_ts ON events (account, ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_events_day ON events (day)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts)")
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                # 已存在的库 (auto_vacuum=NONE 时创建) 需要一次 VACUUM 才能切换
+                conn.execute("VACUUM")
+        finally:
+            conn.close()
+
+    @classmethod
+    def from_config(cls, cfg, read_only=False):
+        """
+        Open the run history stored next to the config file.
+
+        Args:
+            cfg (ConfigManager): The configuration.
+            read_only (bool): See __init__.
+
+        Returns:
+            RunHistory: The history ("run_history.db", history_retention_days).
+        """
+        return cls(data_path(cfg, "run_history.db"),
+                   retention_days=cfg.get("history_retention_days", 90), read_only=read_only)
+
+    def _connect(self):
+        import sqlite3
+        if self.read_only:
+            from urllib.request import pathname2url
+            return sqlite3.connect(f"file:{pathname2url(os.path.abspath(self.path))}?mode=ro",
+                                   uri=True, timeout=30, isolation_level=None)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def record(self, events):
+        """
+        Append events in one transaction.
+
+        Args:
+            events (list): (ts, run_key, account, location, kind, sign_id, status, duration_ms, message)
+                           tuples, where kind is "fetch" or "sign".
+        """
+        if not events:
+            return
+        rows = [(e[0], datetime.fromtimestamp(e[0]).strftime("%Y-%m-%d")) + tuple(e[1:]) for e in events]
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO events (ts, day, run_key, account, location, kind, sign_id, status, duration_ms, message)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.execute("COMMIT")
+        except Exception as e:
+            logger.warning(f"运行历史写入失败: {e}")
+        finally:
+            conn.close()
+
+    def compact(self):
+        """
+        Delete rows older than retention_days and release the freed pages.
+
+        Returns:
+            int: The number of deleted rows.
+        """
+        cutoff = time.time() - self.retention_days * 86400
+        conn = self._connect()
+        try:
+            deleted = conn.execute("DELETE FROM events WHERE ts < ?", (cutoff,)).rowcount
+            if deleted:
+                conn.execute("PRAGMA incremental_vacuum")
+            return deleted
+        finally:
+            conn.close()
+
+    def active_hours(self, days=28):
+        """
+        Learn when each account's classes hold check-ins.
+
+        Args:
+            days (float): Size of the window.
+
+        Returns:
+            dict: account -> set of (weekday, hour) in local time (weekday 0 = Sunday)
+                  with a sign request or a fetch that found pending check-ins.
+        """
+        since = time.time() - days * 86400
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT account, CAST(strftime('%w', ts, 'unixepoch', 'localtime') AS INTEGER),"
+                " CAST(strftime('%H', ts, 'unixepoch', 'localtime') AS INTEGER) FROM events"
+                " WHERE ts >= ? AND (kind = 'sign' OR (kind = 'fetch' AND status = 'ok'))"
+                " GROUP BY 1, 2, 3",
+                (since,)
+            ).fetchall()
+        finally:
+            conn.close()
+        hours = {}
+        for account, weekday, hour in rows:
+            hours.setdefault(account, set()).add((weekday, hour))
+        return hours
+
+    def account_stats(self, days=30):
+        """
+        Per-account success rate and latency over the last days.
+
+        Args:
+            days (float): Size of the window.
+
+        Returns:
+            list: Dicts {"account", "requests", "signs", "signed_ok", "success_rate",
+                  "failures", "avg_ms", "p95_ms"}, slowest p95 first.
+        """
+        since = time.time() - days * 86400
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT account, COUNT(*), SUM(kind = 'sign'), SUM(kind = 'sign' AND status = 'ok'),"
+                " SUM(status IN (%s)), AVG(duration_ms)"
+                " FROM events WHERE ts >= ? GROUP BY account" % ",".join("?" * len(self.FAILURE_STATUSES)),
+                self.FAILURE_STATUSES + (since,)
+            ).fetchall()
+            # p95: 按账号排序后取第 ceil(0.95 * n) 个
+            p95 = dict(conn.execute(
+                "SELECT account, duration_ms FROM ("
+                " SELECT account, duration_ms,"
+                " ROW_NUMBER() OVER (PARTITION BY account ORDER BY duration_ms) AS rn,"
+                " COUNT(*) OVER (PARTITION BY account) AS n"
+                " FROM events WHERE ts >= ? AND duration_ms IS NOT NULL)"
+                " WHERE rn = MAX(1, CAST(0.95 * n + 0.999999 AS INTEGER))",
+                (since,)
+            ).fetchall())
+        finally:
+            conn.close()
+
+        stats = []
+        for account, total, signs, signed_ok, failures, avg_ms in rows:
+            stats.append({
+                "account": account,
+                "requests": total,
+                "signs": signs or 0,
+                "signed_ok": signed_ok or 0,
+                "success_rate": (signed_ok or 0) / signs if signs else None,
+                "failures": failures or 0,
+                "avg_ms": avg_ms,
+                "p95_ms": p95.get(account),
+            })
+        stats.sort(key=lambda row: row["p95_ms"] or 0, reverse=True)
+        return stats
+
+    # 导出/遍历时的列顺序
+    EXPORT_COLUMNS = ("ts", "day", "run_key", "account", "location", "kind", "sign_id", "status",
+                      "duration_ms", "message")
+
+    def iter_events(self, since=None, until=None, account=None, batch_size=1000):
+        """
+        Stream events matching the filters, oldest first.
+
+        The filters are applied in SQL (on the indexed day / account columns)
+        and rows are fetched in batches, so memory use does not grow with the
+        size of the history.
+
+        Args:
+            since (str, optional): First day to include, "YYYY-MM-DD".
+            until (str, optional): Last day to include, "YYYY-MM-DD".
+            account (str, optional): Only this account.
+            batch_size (int): Rows fetched from SQLite at a time.
+
+        Yields:
+            tuple: One row in EXPORT_COLUMNS order.
+        """
+        clauses, params = [], []
+        if since:
+            clauses.append("day >= ?")
+            params.append(since)
+        if until:
+            clauses.append("day <= ?")
+            params.append(until)
+        if account:
+            clauses.append("account = ?")
+            params.append(account)
+        sql = "SELECT %s FROM events" % ", ".join(self.EXPORT_COLUMNS)
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY ts, id"
+
+        conn = self._connect()
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            conn.close()
+
+    def export(self, output, fmt="csv", since=None, until=None, account=None, batch_size=1000):
+        """
+        Stream matching events to a file in CSV, JSONL or Parquet format.
+
+        Parquet output needs the optional pyarrow package and is written one
+        row group per batch.
+
+        Args:
+            output (str/file): A path, "-" for stdout, or an open text file (CSV/JSONL only).
+            fmt (str): "csv", "jsonl" or "parquet".
+            since (str, optional): First day to include, "YYYY-MM-DD".
+            until (str, optional): Last day to include, "YYYY-MM-DD".
+            account (str, optional): Only this account.
+            batch_size (int): Rows per batch (and per Parquet row group).
+
+        Returns:
+            int: The number of exported rows.
+
+        Raises:
+            ValueError: If the format is unknown.
+            RuntimeError: If Parquet is requested but pyarrow is not installed.
+        """
+        rows = self.iter_events(since, until, account, batch_size)
+        if fmt == "parquet":
+            return self._export_parquet(rows, output, batch_size)
+        if fmt not in ("csv", "jsonl"):
+            raise ValueError(f"不支持的导出格式: {fmt}")
+
+        if output == "-":
+            return self._export_text(rows, sys.stdout, fmt)
+        if hasattr(output, "write"):
+            return self._export_text(rows, output, fmt)
+        with open(output, "w", encoding="utf-8", newline="") as f:
+            return self._export_text(rows, f, fmt)
+
+    def _export_text(self, rows, f, fmt):
+        count = 0
+        if fmt == "csv":
+            import csv
+            writer = csv.writer(f)
+            writer.writerow(self.EXPORT_COLUMNS)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        else:
+            for row in rows:
+                f.write(json.dumps(dict(zip(self.EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n")
+                count += 1
+        return count
+
+    def _export_parquet(self, rows, output, batch_size):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("导出 Parquet 需要安装 pyarrow (pip install pyarrow)")
+
+        schema = pa.schema([
+            ("ts", pa.float64()), ("day", pa.string()), ("run_key", pa.string()), ("account", pa.string()),
+            ("location", pa.string()), ("kind", pa.string()), ("sign_id", pa.string()), ("status", pa.string()),
+            ("duration_ms", pa.float64()), ("message", pa.string()),
+        ])
+        count = 0
+        batch = []
+        with pq.ParquetWriter(sys.stdout.buffer if output == "-" else output, schema) as writer:
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    writer.write_table(pa.Table.from_pylist([dict(zip(self.EXPORT_COLUMNS, r)) for r in batch], schema))
+                    count += len(batch)
+                    batch = []
+            if batch:
+                writer.write_table(pa.Table.from_pylist([dict(zip(self.EXPORT_COLUMNS, r)) for r in batch], schema))
+                count += len(batch)
+        return count
+
+    def failures_by_day(self, days=30, account=None):
+        """
+        Count failed requests per day.
+
+        Args:
+            days (float): Size of the window.
+            account (str, optional): Restrict to one account.
+
+        Returns:
+            list: (day, failures, requests) tuples, oldest first.
+        """
+        since = time.time() - days * 86400
+        sql = ("SELECT day, SUM(status IN (%s)), COUNT(*) FROM events WHERE ts >= ?"
+               % ",".join("?" * len(self.FAILURE_STATUSES)))
+        params = self.FAILURE_STATUSES + (since,)
+        if account:
+            sql += " AND account = ?"
+            params += (account,)
+        conn = self._connect()
+        try:
+            return conn.execute(sql + " GROUP BY day ORDER BY day", params).fetchall()
+        finally:
+            conn.close()
+
+
+class CheckInManager:
+    """
+    Manages the check-in process logic.
+
+    Coordinates configuration, client execution, and notifications.
+    """
+    # 运行状态
+    STATE_IDLE = "idle"
+    STATE_RUNNING = "running"
+    STATE_RETRY_WAIT = "retry_wait"
+    # 顺延原因 (TaskResult.DEFERRED 的 message)
+    DEFER_DEADLINE = "deadline"
+    DEFER_CIRCUIT = "circuit"
+    # 按卡片上的时间判定的跳过原因: 时间解析可能有误, 因此仍会重试
+    SKIP_CLOSED = "签到已截止"
+    SKIP_NOT_OPEN = "签到尚未开始"
+    TIME_SKIPS = (SKIP_CLOSED, SKIP_NOT_OPEN)
+    # 失败后的重试等待 (分钟)
+    RETRY_WAITS = (5, 15)
+
+    def __init__(self, config_manager, log_callback=None, progress_callback=None, shard=None, work_queue=None,
+                 state_callback=None):
+        """
+        Initialize the CheckInManager.
+
+        Args:
+            config_manager (ConfigManager): The configuration manager instance.
+            log_callback (callable, optional): A callback function for logging messages (e.g., for GUI updates).
+            progress_callback (callable, optional): Called with a RunProgress snapshot dict whenever progress changes.
+            shard (tuple, optional): (index, total) from parse_shard_spec. When set, only tasks whose
+                                     account hashes to this shard are executed.
+            work_queue (WorkQueue, optional): When set, accounts are claimed from this shared
+                                              lease-based queue instead of being run locally in order.
+            state_callback (callable, optional): Called with the run_state() dict whenever the run state changes.
+        """
+        self.cfg = config_manager
+        self.log_callback = log_callback
+        self.progress_callback = progress_callback
+        self.progress = RunProgress()
+        self.progress.finish()
+        self.state_callback = state_callback
+        self.shard = shard
+
+        # 单飞运行协调: 同一时间只允许一次运行，期间的请求被合并或排队一次
+        self._run_lock = threading.Lock()
+        self._state = self.STATE_IDLE
+        # 监视模式的单账号签到 (sign_now) 不占用运行状态, 完整运行在其结束后开始
+        self._signing = False
+        self._signing_done = threading.Condition(self._run_lock)
+        # 等待重试期间的运行请求通过此事件提前结束等待
+        self._retry_wake = threading.Event()
+        self._run_source = None
+        self._run_started_at = None
+        self._follow_up = False
+        self.work_queue = work_queue
+        # 队列运行标识, 为 None 时按日期/定时时间生成; 每次逻辑运行另取一个代号
+        self.queue_run_key = None
+        self._queue_run = None
+        self._attempt = 0
+        # 队列模式下上一次尝试中需要重试的账号 (重试时只重新入队这些账号)
+        self._queue_retry = set()
+        # 本次运行的时间预算, run_check_flow 开始时按 run_budget_seconds 重新创建
+        self.deadline = RunDeadline(None)
+
+        # 幂等账本与断点续跑检查点 (保存在配置文件所在目录)
+        self.ledger = SignLedger(self._data_path("sign_ledger.jsonl"))
+        checkpoint_name = f"run_checkpoint_{shard[0]}of{shard[1]}.json" if shard else "run_checkpoint.json"
+        self.checkpoint = RunCheckpoint(self._data_path(checkpoint_name))
+        self.history = RunHistory.from_config(self.cfg)
+        self.invalid_cookies = InvalidCookieCache(
+            self._data_path("invalid_cookies.json"),
+            ttl_hours=self.cfg.get("invalid_cookie_ttl_hours", 24)
+        )
+        # 自适应并发控制 (AIMD) 与每主机令牌桶, 跨运行保留学习到的并发上限
+        self.limiter = AdaptiveLimiter(
+            max_limit=self.cfg.get("max_concurrency", 4),
+            latency_target=self.cfg.get("latency_target_ms", 3000) / 1000.0,
+            rate=self.cfg.get("requests_per_second", 5)
+        )
+        # 熔断器: 服务器宕机时快速失败，剩余任务顺延到重试
+        self.breaker = CircuitBreaker(
+            failure_threshold=self.cfg.get("breaker_failures", 3),
+            reset_timeout=self.cfg.get("breaker_reset_seconds", 30)
+        )
+        # 签到页缓存: 条件请求 + 内容摘要，未变化的页面不重复下载/解析
+        self.page_cache = PageCache()
+        # 监视模式 (ClassWatcher)，启用时由入口设置
+        self.watcher = None
+        self.client_pool = ClientPool(
+            max_size=self.cfg.get("client_pool_size", 256),
+            idle_timeout=self.cfg.get("client_idle_timeout", 900),
+            pool_maxsize=self.cfg.get("connections_per_host", 4),
+            limiter=self.limiter,
+            breaker=self.breaker,
+            page_cache=self.page_cache
+        )
+        if hasattr(self.cfg, "subscribe"):
+            self.cfg.subscribe(self._on_config_change)
+
+    def _on_config_change(self, section, action, index):
+        """
+        React to ConfigManager change events.
+
+        Editing or re-adding an account clears its cookie from the negative cache,
+        so the next run tries it again even if the cookie string is unchanged.
+        Editing, removing or replacing accounts drops the affected pooled clients.
+        """
+        if section != "accounts":
+            return
+        accounts = self.cfg.get("accounts", [])
+        if action in ("add", "update") and index is not None and 0 <= index < len(accounts):
+            self.invalid_cookies.discard(accounts[index].cookie)
+            if action == "update":
+                self.client_pool.invalidate(accounts[index].name)
+        # 改名或删除后旧名称的客户端不再可达
+        self.client_pool.retain(a.name for a in accounts)
+
+    def _config_path(self):
+        """
+        Get the path of the backing config file, if any.
+
+        Returns:
+            str: The config path, or None.
+        """
+        return getattr(self.cfg, "config_path", None)
+
+    def _data_path(self, name):
+        """
+        Build the path of a state file stored next to the config file.
+
+        Args:
+            name (str): The file name.
+
+        Returns:
+            str: The absolute path.
+        """
+        return data_path(self.cfg, name)
+
+    def _get_jittered_location(self, lat, lng, acc):
+        """
+        Get coordinates with random jitter added to simulate real GPS fluctuations.
+
+        Args:
+            lat (str/float): Base latitude.
+            lng (str/float): Base longitude.
+            acc (str/float): Accuracy.
+
+        Returns:
+            tuple: (jittered_lat, jittered_lng, acc)
+        """
+        try:
+            base_lat = float(lat)
+            base_lng = float(lng)
+            # 随机抖动范围 (约 10-20米)
+            offset = random.uniform(-0.00015, 0.00015)
+            return base_lat + offset, base_lng + offset, acc
+        except ValueError:
+            logger.critical("坐标配置错误，请检查 lat/lng 是否为数字")
+            return 0, 0, 0
+
+    def _notify_timeout(self, default):
+        """
+        Get the timeout for a notification request.
+
+        Notifications are still sent after the budget runs out (the overrun
+        report must go out), but never wait longer than the budget left,
+        with a small floor.
+
+        Args:
+            default (float): The usual timeout for this request.
+
+        Returns:
+            float: The timeout in seconds.
+        """
+        return min(default, max(self.deadline.remaining(), 3))
+
+    def _push_notify(self, content):
+        """
+        Send a notification via WeCom (Enterprise WeChat) or PushPlus.
+
+        Args:
+            content (str): The message content to send.
+        """
+        wecom = self.cfg.get("wecom", {})
+        corpid = wecom.get("corpid")
+        secret = wecom.get("secret")
+        agentid = wecom.get("agentid")
+
+        if not corpid or not secret or not agentid:
+            # 尝试回退到 pushplus (兼容旧配置)
+            token = self.cfg.get("pushplus")
+            if token:
+                self._push_pushplus(token, content)
+            return
+
+        try:
+            import requests
+
+            # 1. 获取 Access Token
+            token_url = f"https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={corpid}&corpsecret={secret}"
+            r = requests.get(token_url, timeout=self._notify_timeout(10))
+            token_data = r.json()
+
+            if token_data.get("errcode") != 0:
+                logger.error(f"企业微信 AccessToken 获取失败: {token_data}")
+                return
+
+            access_token = token_data.get("access_token")
+
+            # 2. 发送消息
+            send_url = f"https://qyapi.weixin.qq.com/cgi-bin/message/send?access_token={access_token}"
+            payload = {
+                "touser": wecom.get("touser", "@all"),
+                "msgtype": "text",
+                "agentid": agentid,
+                "text": {
+                    "content": f"【班级魔法签到通知】\n{content}"
+                },
+                "safe": 0
+            }
+
+            r_send = requests.post(send_url, json=payload, timeout=self._notify_timeout(10))
+            res = r_send.json()
+            if res.get("errcode") == 0:
+                logger.info("企业微信推送成功")
+            else:
+                logger.warning(f"企业微信推送失败: {res}")
+
+        except Exception as e:
+            logger.warning(f"推送异常: {e}")
+
+    def _push_pushplus(self, token, content):
+        """
+        Send a notification via PushPlus (fallback method).
+
+        Args:
+            token (str): The PushPlus token.
+            content (str): The message content.
+        """
+        url = 'http://www.pushplus.plus/send'
+        data = {
+            "token": token,
+            "title": "班级魔法签到通知",
+            "content": content
+        }
+        try:
+            import requests
+            requests.post(url, json=data, timeout=self._notify_timeout(5))
+            logger.info("PushPlus 推送已发送")
+        except Exception as e:
+            logger.warning(f"PushPlus 推送失败: {e}")
+
+    def log(self, msg):
+        """
+        Log a message to the logger and the optional callback.
+
+        Args:
+            msg (str): The message to log.
+        """
+        logger.info(msg)
+        if self.log_callback:
+            self.log_callback(msg)
+
+    def _publish_progress(self):
+        """
+        Send the current progress snapshot to the optional callback.
+        """
+        if self.progress_callback:
+            try:
+                snapshot = self.progress.snapshot()
+                snapshot["concurrency"] = self.limiter.limit
+                self.progress_callback(snapshot)
+            except Exception as e:
+                logger.warning(f"进度回调异常: {e}")
+
+    def run_state(self):
+        """
+        Get the state of the run coordinator.
+
+        Returns:
+            dict: {"state", "source", "started_at", "follow_up"} where state is one of
+                  STATE_IDLE, STATE_RUNNING or STATE_RETRY_WAIT.
+        """
+        with self._run_lock:
+            return {
+                "state": self._state,
+                "source": self._run_source,
+                "started_at": self._run_started_at,
+                "follow_up": self._follow_up,
+            }
+
+    def status(self):
+        """
+        Get the run state together with the live progress.
+
+        Returns:
+            dict: {"run": run_state(), "progress": progress snapshot incl. "concurrency"}.
+        """
+        progress = self.progress.snapshot()
+        progress["concurrency"] = self.limiter.limit
+        return {"run": self.run_state(), "progress": progress}
+
+    def metrics(self):
+        """
+        Get the state of the long-lived shared components.
+
+        Returns:
+            dict: {"limiter", "breaker", "page_cache", "clients", "watch"}.
+        """
+        return {
+            "limiter": self.limiter.snapshot(),
+            "breaker": self.breaker.snapshot(),
+            "page_cache": self.page_cache.stats(),
+            "clients": len(self.client_pool),
+            "watch": self.watcher.stats() if self.watcher else None,
+        }
+
+    def _set_state(self, state):
+        """
+        Update the run state and notify the optional callback.
+
+        Args:
+            state (str): The new state.
+        """
+        with self._run_lock:
+            self._state = state
+        if self.state_callback:
+            try:
+                self.state_callback(self.run_state())
+            except Exception as e:
+                logger.warning(f"状态回调异常: {e}")
+
+    def run_job(self, source="manual"):
+        """
+        Single-flight entry point for running the check-in flow with retries.
+
+        Only one run executes at a time. A request that arrives while a run is
+        active is handled according to the "run_overlap" setting:
+        "merge" (default) folds it into the active run, "queue" schedules exactly
+        one follow-up run after the active one (further requests are merged into it).
+        A request that arrives while the run waits to retry also ends the wait,
+        so the retry starts right away.
+
+        Args:
+            source (str): Who requested the run (e.g. "manual", "schedule"), for logs and state.
+
+        Returns:
+            str: "completed" if this call executed the run, otherwise "merged" or "queued".
+        """
+        woke_retry = False
+        with self._run_lock:
+            if self._state != self.STATE_IDLE:
+                if self._state == self.STATE_RETRY_WAIT:
+                    # 等待重试期间收到请求: 立即开始重试
+                    self._retry_wake.set()
+                    woke_retry = True
+                if self.cfg.get("run_overlap", "merge") == "queue" and not self._follow_up:
+                    self._follow_up = True
+                    outcome = "queued"
+                else:
+                    outcome = "merged"
+            else:
+                outcome = None
+                self._state = self.STATE_RUNNING
+                self._run_source = source
+                self._run_started_at = time.time()
+                # 等待正在进行的单账号签到结束 (已占用运行状态, 不会再有新的)
+                while self._signing:
+                    self._signing_done.wait()
+
+        if outcome == "queued":
+            self.log(f"已有运行进行中 ({self._run_source})，[{source}] 请求将在其结束后执行一次")
+            self._set_state(self._state)
+            return outcome
+        if outcome == "merged":
+            if woke_retry:
+                self.log(f"[{source}] 请求已合并，提前开始等待中的重试")
+            else:
+                self.log(f"已有运行进行中 ({self._run_source})，[{source}] 请求已合并")
+            return outcome
+
+        self._set_state(self.STATE_RUNNING)
+        try:
+            while True:
+                self.run_with_retries()
+                with self._run_lock:
+                    if not self._follow_up:
+                        break
+                    self._follow_up = False
+                    self._run_started_at = time.time()
+                self.log("执行排队中的后续运行")
+                self._set_state(self.STATE_RUNNING)
+        finally:
+            with self._run_lock:
+                self._follow_up = False
+                self._run_source = None
+                self._run_started_at = None
+            self._set_state(self.STATE_IDLE)
+        return "completed"
+
+    def sign_now(self, group, source="watch"):
+        """
+        Run one account's work immediately, e.g. when watch mode sees a new check-in.
+
+        Does not take the run state: a run requested meanwhile is not merged
+        into it, but starts as soon as this sign finishes. If a run is already
+        active (or waiting to retry), nothing is done because that run covers
+        the account.
+
+        Args:
+            group (list): The account's work items (from _compile_tasks).
+            source (str): Who requested the run, for logs and state.
+
+        Returns:
+            list: The TaskResult records, or None if a run was already active.
+        """
+        with self._run_lock:
+            if self._state != self.STATE_IDLE or self._signing:
+                return None
+            self._signing = True
+
+        self.log(f"[{source}] 立即签到账号 [{group[0].acc_name}]")
+        try:
+            self.deadline = RunDeadline(self.cfg.get("run_budget_seconds", 900))
+            self.progress = RunProgress(len(group))
+            self._publish_progress()
+            results = self._run_group(group)
+            if any(r.status == TaskResult.COOKIE_INVALID for r in results):
+                self.invalid_cookies.add(group[0].account.cookie, group[0].acc_name)
+            self.progress.finish()
+            self._publish_progress()
+
+            push_messages, _ = self._merge_results(results)
+            if push_messages:
+                self._push_notify("\n".join(push_messages))
+            return results
+        finally:
+            with self._run_lock:
+                self._signing = False
+                self._signing_done.notify_all()
+
+    def _compile_tasks(self):
+        """
+        Resolve enabled tasks into executable work items grouped by account.
+
+        Invalid tasks (unknown account/location, missing cookie or class ID) are
+        logged and dropped here, so the execution stage only sees runnable work.
+
+        Returns:
+            tuple: (groups, invalid). groups is a list in config order; each group
+                   is a list of WorkItem records belonging to the same account.
+                   invalid lists the Account records skipped because their cookie
+                   is in the negative cache.
+        """
+        tasks = self.cfg.get("tasks", [])
+        locations = self.cfg.get("locations", [])
+        accounts = self.cfg.get("accounts", [])
+
+        # 将 list 转为 dict 方便查找
+        loc_map = {l.name: l for l in locations}
+        acc_map = {a.name: a for a in accounts}
+
+        groups = {}
+        skipped_by_shard = 0
+        invalid = {}
+        for task in tasks:
+            if not task.enable:
+                continue
+
+            acc_name = task.account_name
+            loc_name = task.location_name
+
+            # 静态分片: 按账号哈希只保留属于本节点的任务
+            if self.shard and shard_of(acc_name, self.shard[1]) != self.shard[0]:
+                skipped_by_shard += 1
+                continue
+
+            account = acc_map.get(acc_name)
+            location = loc_map.get(loc_name)
+
+            if not account or not location:
+                self.log(f"任务无效: 找不到账号 [{acc_name}] 或 地点 [{loc_name}]")
+                continue
+
+            if not account.cookie or not account.class_id:
+                self.log(f"账号 [{acc_name}] 配置不完整 (缺少Cookie或ClassID)，跳过")
+                continue
+
+            # 负缓存: 已知失效的 Cookie 在修改或过期前不再请求
+            if self.invalid_cookies.contains(account.cookie):
+                invalid.setdefault(acc_name, account)
+                continue
+
+            groups.setdefault(acc_name, []).append(WorkItem(acc_name, loc_name, account, location))
+
+        if invalid:
+            self.log(f"跳过 {len(invalid)} 个 Cookie 已失效的账号 (修改 Cookie 后恢复)")
+
+        if self.shard:
+            selected = sum(len(g) for g in groups.values())
+            self.log(f"分片 {self.shard[0]}/{self.shard[1]}: 选中 {selected} 个任务，跳过 {skipped_by_shard} 个")
+
+        return list(groups.values()), list(invalid.values())
+
+    def _run_group(self, group):
+        """
+        Execute all work items of one account over a single client.
+
+        Args:
+            group (list): Work items produced by _compile_tasks for one account.
+
+        Returns:
+            list: TaskResult records, one per sign attempt or per task without signs.
+        """
+        account = group[0].account
+        class_id = account.class_id
+        client = self.client_pool.get(group[0].acc_name, account.cookie, class_id)
+        results = []
+        events = []
+        try:
+            self._run_items(group, client, results, events)
+        finally:
+            # 每个账号的请求记录一次性写入运行历史
+            self.history.record(events)
+        return results
+
+    def _run_items(self, group, client, results, events):
+        """
+        Execute the work items of one account (see _run_group).
+
+        Args:
+            group (list): The account's work items.
+            client (BJMFClient): The account's pooled client.
+            results (list): Receives the TaskResult records.
+            events (list): Receives one RunHistory event per fetch/sign request.
+        """
+        run_key = self._get_run_key()
+
+        for item in group:
+            acc_name = item.acc_name
+            loc_name = item.loc_name
+            location = item.location
+
+            # 时间预算用尽或熔断中: 剩余任务顺延到重试，不再发起请求
+            if self.deadline.expired() or self.breaker.is_open():
+                reason = self.DEFER_DEADLINE if self.deadline.expired() else self.DEFER_CIRCUIT
+                results.append(TaskResult(acc_name, loc_name, TaskResult.DEFERRED, None, reason))
+                self.progress.skip_task()
+                continue
+
+            self.log(f"正在执行任务: [{acc_name}] @ [{loc_name}]")
+            self.progress.start_task()
+            self._publish_progress()
+
+            started = time.time()
+            try:
+                pending_tasks = client.fetch_all(deadline=self.deadline)
+            except (DeadlineExceeded, CircuitOpen) as e:
+                reason = self.DEFER_CIRCUIT if isinstance(e, CircuitOpen) else self.DEFER_DEADLINE
+                results.append(TaskResult(acc_name, loc_name, TaskResult.DEFERRED, None, reason))
+                events.append((started, run_key, acc_name, loc_name, "fetch", None, TaskResult.DEFERRED,
+                               (time.time() - started) * 1000, str(e)))
+                self.progress.finish_task(ok=False)
+                self._publish_progress()
+                continue
+
+            if pending_tasks is None:
+                fetch_status = TaskResult.COOKIE_INVALID
+            else:
+                fetch_status = TaskResult.OK if pending_tasks else TaskResult.IDLE
+            events.append((started, run_key, acc_name, loc_name, "fetch", None, fetch_status,
+                           (time.time() - started) * 1000, None))
+
+            if pending_tasks is None:
+                results.append(TaskResult(acc_name, loc_name, TaskResult.COOKIE_INVALID, None, None))
+                self.progress.finish_task(ok=False)
+                self._publish_progress()
+                continue
+
+            if not pending_tasks:
+                self.log(f"账号 [{acc_name}] 无需签到")
+                results.append(TaskResult(acc_name, loc_name, TaskResult.IDLE, None, None))
+                self.progress.finish_task()
+                self._publish_progress()
+                continue
+
+            # 开始签到
+            pwd = item.account.pwd
+
+            r_lat, r_lng, r_acc = self._get_jittered_location(location.lat, location.lng, location.acc)
+
+            task_ok = True
+            # 截止时间最近的签到最先提交
+            queue = [(card.close_time or datetime.max, seq, card) for seq, card in enumerate(pending_tasks)]
+            heapq.heapify(queue)
+            while queue:
+                _, _, card = heapq.heappop(queue)
+                task_id = card.id
+                # 注定失败的签到不发请求 (也不触发重试)
+                reason = self._card_skip_reason(card, pwd)
+                if reason:
+                    self.log(f"任务 [{acc_name}] 签到ID [{task_id}] {card.title} 跳过: {reason}")
+                    if reason == self.SKIP_CLOSED:
+                        # 已错过截止时间，同样计入“临近截止/错过”统计
+                        self.progress.mark_at_risk()
+                    results.append(TaskResult(acc_name, loc_name, TaskResult.SKIPPED, task_id, reason))
+                    continue
+
+                # 幂等: 账本中已成功的签到不再重复提交
+                if self.ledger.contains(acc_name, card.class_id, task_id):
+                    self.log(f"任务 [{acc_name}] 签到ID [{task_id}] 已在账本中记录为成功，跳过")
+                    results.append(TaskResult(acc_name, loc_name, TaskResult.SKIPPED, task_id, None))
+                    continue
+
+                if self._is_at_risk(card):
+                    self.progress.mark_at_risk()
+                    self.log(f"⚠️ 任务 [{acc_name}] 签到ID [{task_id}] 即将截止 ({card.close_time:%H:%M:%S})")
+
+                started = time.time()
+                try:
+                    result = client.execute_sign(task_id, r_lat, r_lng, r_acc, pwd, deadline=self.deadline,
+                                                 class_id=card.class_id)
+                except (DeadlineExceeded, CircuitOpen) as e:
+                    reason = self.DEFER_CIRCUIT if isinstance(e, CircuitOpen) else self.DEFER_DEADLINE
+                    results.append(TaskResult(acc_name, loc_name, TaskResult.DEFERRED, task_id, reason))
+                    events.append((started, run_key, acc_name, loc_name, "sign", task_id, TaskResult.DEFERRED,
+                                   (time.time() - started) * 1000, str(e)))
+                    task_ok = False
+                    continue
+                self.log(f"任务 [{acc_name}] 签到ID [{task_id}] 结果: {result.message}")
+
+                status = TaskResult.OK if result.ok else TaskResult.FAILED
+                events.append((started, run_key, acc_name, loc_name, "sign", task_id,
+                               TaskResult.ERROR if result.status is SignStatus.ERROR else status,
+                               (time.time() - started) * 1000, result.message))
+                results.append(TaskResult(acc_name, loc_name, status, task_id, result.message))
+                if status == TaskResult.OK:
+                    self.ledger.record(acc_name, card.class_id, task_id)
+                else:
+                    task_ok = False
+
+            self.progress.finish_task(ok=task_ok)
+            self._publish_progress()
+
+    def _is_at_risk(self, card, now=None):
+        """
+        Check whether a card may close before its sign request completes.
+
+        A card is at risk when its close time is less than "at_risk_seconds"
+        (default 60) or the current average request latency away.
+
+        Args:
+            card (PunchCard): The card about to be signed.
+            now (datetime, optional): The current time.
+
+        Returns:
+            bool: True if the card is at risk of missing its window.
+        """
+        if card.close_time is None:
+            return False
+        latency = self.limiter.snapshot()["latency"] or 0.0
+        margin = max(float(self.cfg.get("at_risk_seconds", 60) or 0), latency)
+        return (card.close_time - (now or datetime.now())).total_seconds() <= margin
+
+    def _group_deadline(self, group, now=None):
+        """
+        Get the nearest known close time of an account's pending check-ins.
+
+        Uses the cards parsed on the previous fetch (page cache), so it is only
+        known for accounts fetched before, e.g. on retries or in a daemon.
+
+        Args:
+            group (list): The account's work items.
+            now (datetime, optional): The current time.
+
+        Returns:
+            datetime: The nearest close time still in the future, or None if unknown.
+        """
+        now = now or datetime.now()
+        account = group[0].account
+        nearest = None
+        for class_id in account.class_ids:
+            cached = self.page_cache.get((account.cookie, class_id))
+            for card in (cached[3] if cached else ()):
+                if card.close_time is not None and card.close_time > now:
+                    nearest = card.close_time if nearest is None else min(nearest, card.close_time)
+        return nearest
+
+    def _prioritize_groups(self, groups):
+        """
+        Order account groups by the nearest known close time (priority queue).
+
+        Accounts without a known close time keep their config order after the others.
+
+        Args:
+            groups (list): Work item groups from _compile_tasks.
+
+        Returns:
+            list: The groups in dispatch order.
+        """
+        now = datetime.now()
+        heap = []
+        for seq, group in enumerate(groups):
+            heap.append((self._group_deadline(group, now) or datetime.max, seq, group))
+        heapq.heapify(heap)
+        return [heapq.heappop(heap)[2] for _ in range(len(heap))]
+
+    @classmethod
+    def _card_skip_reason(cls, card, pwd):
+        """
+        Decide whether a card can be completed before sending a request.
+
+        Skips based on the card's labelled open/close times (TIME_SKIPS) do not
+        count as done: the account is retried like after a failure.
+
+        Args:
+            card (PunchCard): The pending card.
+            pwd (str): The account's check-in password.
+
+        Returns:
+            str: Why the card is skipped, or None if it should be attempted.
+        """
+        if card.kind == PunchCard.QR:
+            return "二维码签到需扫码，无法自动完成"
+        if card.kind == PunchCard.PWD and not pwd:
+            return "密码签到，但账号未配置密码"
+        if card.is_closed():
+            return cls.SKIP_CLOSED
+        if not card.is_open():
+            return cls.SKIP_NOT_OPEN
+        return None
+
+    def _workers(self):
+        """
+        Returns:
+            int: The configured number of worker processes ("workers", at least 1).
+        """
+        try:
+            return max(1, int(self.cfg.get("workers", 1) or 1))
+        except (TypeError, ValueError):
+            return 1
+
+    def _uses_processes(self, groups):
+        """
+        Returns:
+            bool: True if a run over these groups executes in worker processes.
+        """
+        return self.work_queue is None and self._workers() > 1 and len(groups) > 1
+
+    def _run_groups_in_processes(self, groups, workers):
+        """
+        Execute account groups across a pool of worker processes.
+
+        Groups are sharded by account so that each worker owns its accounts'
+        sessions; only compact TaskResult records travel back to the parent.
+        The pool and the workers' clients live for one run only, so the
+        client pool and connection warm-up of this process do not apply here.
+
+        Args:
+            groups (list): Account groups from _compile_tasks.
+            workers (int): Number of worker processes.
+
+        Returns:
+            list: TaskResult records in group order.
+        """
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        shards = shard_groups(groups, workers)
+        self.log(f"多进程模式: {len(groups)} 个账号分配到 {len(shards)} 个进程")
+
+        results_by_group = {}
+        with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+            remaining = self.deadline.remaining()
+            budget = None if remaining == float("inf") else remaining
+            futures = {pool.submit(_run_shard, self.cfg.data, self._config_path(), shard, budget): shard for shard in shards}
+            for future in as_completed(futures):
+                shard = futures[future]
+                try:
+                    shard_results, at_risk = future.result()
+                except Exception as e:
+                    logger.error(f"工作进程异常: {e}")
+                    shard_results = [
+                        (gi, [TaskResult(item.acc_name, item.loc_name, TaskResult.ERROR, None, str(e)) for item in group])
+                        for gi, group in shard
+                    ]
+                    at_risk = 0
+                # 工作进程各自计数，汇总到本进程的进度中
+                if at_risk:
+                    self.progress.mark_at_risk(at_risk)
+
+                for gi, group_results in shard_results:
+                    results_by_group[gi] = group_results
+                    self._on_group_done(groups[gi], group_results)
+                    for item in groups[gi]:
+                        self.progress.start_task()
+                        ok = all(r.status in (TaskResult.OK, TaskResult.IDLE)
+                                 for r in group_results if r.location == item.loc_name)
+                        self.progress.finish_task(ok=ok)
+                self._publish_progress()
+
+        return [r for gi in range(len(groups)) for r in results_by_group.get(gi, [])]
+
+    def _run_groups_in_threads(self, groups):
+        """
+        Execute account groups on a thread pool sized by max_concurrency.
+
+        The number of requests actually in flight is governed by the shared
+        AdaptiveLimiter, so threads only bound the parallelism from above.
+
+        Args:
+            groups (list): Account groups from _compile_tasks.
+
+        Returns:
+            list: TaskResult records in group order.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        def run(group):
+            try:
+                group_results = self._run_group(group)
+            except Exception as e:
+                logger.error(f"账号 [{group[0].acc_name}] 执行异常: {e}")
+                group_results = [
+                    TaskResult(item.acc_name, item.loc_name, TaskResult.ERROR, None, str(e)) for item in group
+                ]
+            self._on_group_done(group, group_results)
+            return group_results
+
+        with ThreadPoolExecutor(max_workers=min(self.limiter.max_limit, len(groups))) as pool:
+            return [r for group_results in pool.map(run, groups) for r in group_results]
+
+    def warm_up(self):
+        """
+        Pre-warm pooled clients ahead of a scheduled run.
+
+        Resolves the server once and opens a keep-alive connection for every
+        account the next run will use, in parallel, so the first requests after
+        the trigger go out on hot sockets. Skipped when the run will execute in
+        worker processes, which build their own clients. At most
+        client_pool_size accounts are warmed, those dispatched first by the
+        run's priority order, so warm-up never evicts sessions it just opened.
+
+        Returns:
+            int: The number of clients warmed successfully.
+        """
+        import socket
+        from concurrent.futures import ThreadPoolExecutor
+
+        groups, _ = self._compile_tasks()
+        if not groups:
+            return 0
+        if self._uses_processes(groups):
+            self.log("多进程模式: 工作进程各自建立连接，跳过连接预热")
+            return 0
+        # 只预热最先执行的账号, 超出客户端池容量的部分会被 LRU 淘汰
+        skipped = max(0, len(groups) - self.client_pool.max_size)
+        groups = self._prioritize_groups(groups)[:self.client_pool.max_size]
+
+        try:
+            socket.getaddrinfo(BJMFClient.SERVER, 80)
+        except OSError as e:
+            logger.warning(f"预热 DNS 解析失败: {e}")
+
+        clients = [
+            self.client_pool.get(g[0].acc_name, g[0].account.cookie, g[0].account.class_id)
+            for g in groups
+        ]
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=min(16, len(clients))) as pool:
+            warmed = sum(pool.map(lambda c: c.warm_up(), clients))
+        self.log(f"连接预热完成: {warmed}/{len(clients)} 个账号，用时 {time.time() - started:.1f}s"
+                 + (f"，超出客户端池容量未预热 {skipped} 个" if skipped else ""))
+        return warmed
+
+    def _get_run_key(self):
+        """
+        Get the identifier of the logical run (shared by its retries).
+
+        Returns:
+            str: queue_run_key if set, otherwise "<date> <scheduletime>".
+        """
+        return self.queue_run_key or f"{datetime.now():%Y-%m-%d} {self.cfg.get('scheduletime') or 'manual'}"
+
+    def _get_queue_run_key(self):
+        """
+        Get the run identifier shared by all nodes draining the same queue.
+
+        Returns:
+            str: "<run key>@<generation>#<attempt>", so each logical run and each
+                 retry gets a fresh set of work items.
+        """
+        if self._queue_run is None:
+            self._queue_run = self.work_queue.begin_run(self._get_run_key())
+        return f"{self._queue_run}#{self._attempt}"
+
+    def _on_group_done(self, group, results):
+        """
+        Checkpoint an account once none of its results needs a retry.
+
+        Args:
+            group (list): The account's work items.
+            results (list): The TaskResult records produced for it.
+        """
+        if any(r.status == TaskResult.COOKIE_INVALID for r in results):
+            self.invalid_cookies.add(group[0].account.cookie, group[0].acc_name)
+
+        if self.work_queue is not None:
+            # 队列模式由队列自身记录完成状态
+            return
+        if not any(self._needs_retry(r) for r in results):
+            self.checkpoint.mark_done(group[0].acc_name)
+
+    def _run_groups_from_queue(self, groups):
+        """
+        Execute account groups by claiming them from the shared work queue.
+
+        Args:
+            groups (list): Account groups from _compile_tasks.
+
+        Returns:
+            list: TaskResult records of the groups processed by this node, in group order.
+        """
+        by_key = {group[0].acc_name: (gi, group) for gi, group in enumerate(groups)}
+        results_by_group = {}
+
+        def handle(key):
+            entry = by_key.get(key)
+            if entry is None:
+                # 由配置不同的节点写入的账号，本节点无法执行
+                logger.warning(f"队列中的账号 [{key}] 不在本节点配置中，跳过")
+                return
+            gi, group = entry
+            try:
+                results_by_group[gi] = self._run_group(group)
+            except Exception as e:
+                logger.error(f"账号 [{key}] 执行异常: {e}")
+                results_by_group[gi] = [
+                    TaskResult(item.acc_name, item.loc_name, TaskResult.ERROR, None, str(e)) for item in group
+                ]
+            self._on_group_done(group, results_by_group[gi])
+
+        run_key = self._get_queue_run_key()
+        self.log(f"队列模式: 运行标识 [{run_key}]，节点 [{self.work_queue.worker_id}]")
+        keys = list(by_key)
+        if self._attempt:
+            # 重试只重新入队上次需要重试的账号, 其他节点入队各自的失败账号
+            keys = [key for key in keys if key in self._queue_retry]
+        processed = self.work_queue.drain(run_key, keys, handle)
+        self._queue_retry = {
+            group[0].acc_name for gi, group in enumerate(groups)
+            if any(self._needs_retry(r) for r in results_by_group.get(gi, []))
+        }
+
+        # 由其他节点完成的账号不计入本节点进度
+        for gi, group in enumerate(groups):
+            if gi not in results_by_group:
+                for _ in group:
+                    self.progress.skip_task()
+        self.log(f"队列模式: 本节点处理了 {len(processed)}/{len(groups)} 个账号")
+
+        return [r for gi in range(len(groups)) for r in results_by_group.get(gi, [])]
+
+    @classmethod
+    def _needs_retry(cls, result):
+        """
+        Check whether a TaskResult keeps its account from being checkpointed as done.
+
+        Returns:
+            bool: True for failed, errored and deferred work and for time-based skips.
+        """
+        if result.status in (TaskResult.FAILED, TaskResult.ERROR, TaskResult.DEFERRED):
+            return True
+        return result.status == TaskResult.SKIPPED and result.message in cls.TIME_SKIPS
+
+    def _merge_results(self, results, cached_invalid=()):
+        """
+        Merge TaskResult records into notification lines and a retry decision.
+
+        The re-login report is logged every run, but pushed only for cookies
+        that have not been reported before.
+
+        Args:
+            results (list): TaskResult records of the whole run.
+            cached_invalid (list): Account records skipped by the invalid-cookie cache.
+
+        Returns:
+            tuple: (push_messages, needs_retry)
+        """
+        push_messages = []
+        needs_retry = False
+        relogin = [account.name for account in cached_invalid]
+        deferred = {self.DEFER_DEADLINE: 0, self.DEFER_CIRCUIT: 0}
+
+        for r in results:
+            if r.status == TaskResult.DEFERRED:
+                deferred[r.message] = deferred.get(r.message, 0) + 1
+                needs_retry = True
+            elif r.status == TaskResult.COOKIE_INVALID:
+                # 汇总为一条“需重新登录”报告，而不是逐条失败
+                if r.account not in relogin:
+                    relogin.append(r.account)
+            elif r.status == TaskResult.ERROR:
+                push_messages.append(f"任务 {r.account} @ {r.location}: 执行异常 {r.message} ❌")
+                needs_retry = True
+            elif r.status == TaskResult.SKIPPED and r.message:
+                push_messages.append(f"任务 {r.account} @ {r.location}: 签到 {r.sign_id} 已跳过 ({r.message}) ⚠️")
+                if r.message in self.TIME_SKIPS:
+                    needs_retry = True
+            elif r.status in (TaskResult.OK, TaskResult.FAILED):
+                status_icon = "✅" if r.status == TaskResult.OK else "❌"
+                push_messages.append(f"任务 {r.account} @ {r.location}: {r.message} {status_icon}")
+                if r.status != TaskResult.OK:
+                    needs_retry = True
+
+        if relogin:
+            self.log(f"需重新登录 ({len(relogin)}): {', '.join(relogin)} ❌")
+            cookies = {a.name: a.cookie for a in self.cfg.get("accounts", [])}
+            unreported = [name for name in relogin if self.invalid_cookies.claim_notification(cookies.get(name))]
+            if unreported:
+                push_messages.append(f"需重新登录 ({len(unreported)}): {', '.join(unreported)} ❌")
+
+        if deferred[self.DEFER_DEADLINE]:
+            # 超时报告: 时间预算内未能完成的任务数与实际用时
+            elapsed = time.monotonic() - self.deadline.started_at
+            report = (f"运行时间预算用尽: {deferred[self.DEFER_DEADLINE]} 个任务顺延至重试 "
+                      f"(用时 {elapsed:.0f}s / 预算 {self.deadline.budget:.0f}s) ⏱")
+            self.log(report)
+            push_messages.append(report)
+
+        if deferred[self.DEFER_CIRCUIT]:
+            report = f"服务器不可达 (已熔断): {deferred[self.DEFER_CIRCUIT]} 个任务顺延至重试 ⚡"
+            self.log(report)
+            push_messages.append(report)
+
+        return push_messages, needs_retry
+
+    def run_check_flow(self):
+        """
+        Execute a complete check-in flow for all enabled tasks.
+
+        Compiles the task list, executes it per account (in this process, or
+        sharded across worker processes when "workers" > 1), then merges the
+        results into a single notification.
+
+        Returns:
+            bool: True if any task failed and needs retry, False otherwise.
+        """
+        self.log("--- 开始执行签到任务 ---")
+
+        if not self.cfg.get("tasks", []):
+            self.log("任务列表为空，跳过任务")
+            return
+
+        self.deadline = RunDeadline(self.cfg.get("run_budget_seconds", 900))
+
+        evicted = self.client_pool.evict_idle()
+        if evicted:
+            logger.debug(f"回收了 {evicted} 个空闲客户端")
+
+        groups, cached_invalid = self._compile_tasks()
+
+        if self.work_queue is None:
+            # 只有被中断 (如进程崩溃) 且不久前更新过的检查点才续跑
+            budget = self.cfg.get("run_budget_seconds", 900) or 900
+            completed = self.checkpoint.begin(self._get_run_key(), max_age=budget + sum(self.RETRY_WAITS) * 60)
+            if completed:
+                groups = [g for g in groups if g[0].acc_name not in completed]
+                self.log(f"从检查点恢复: 跳过 {len(completed)} 个本轮已完成的账号")
+
+        groups = self._prioritize_groups(groups)
+        self.progress = RunProgress(sum(len(g) for g in groups))
+        self._publish_progress()
+
+        if self.work_queue is not None:
+            results = self._run_groups_from_queue(groups)
+        elif self._uses_processes(groups):
+            results = self._run_groups_in_processes(groups, self._workers())
+        elif self.limiter.max_limit > 1 and len(groups) > 1:
+            results = self._run_groups_in_threads(groups)
+        else:
+            results = []
+            for group in groups:
+                group_results = self._run_group(group)
+                self._on_group_done(group, group_results)
+                results.extend(group_results)
+
+        self.progress.finish()
+        self._publish_progress()
+        metrics = self.limiter.snapshot()
+        if metrics["latency"] is not None:
+            self.log(f"并发上限 {metrics['limit']}/{metrics['max_limit']}，"
+                     f"平均延迟 {metrics['latency'] * 1000:.0f}ms，错误率 {metrics['error_rate']:.0%}")
+        at_risk = self.progress.snapshot()["at_risk"]
+        if at_risk:
+            self.log(f"⚠️ 本次有 {at_risk} 个签到临近截止才提交或已错过截止")
+        cache = self.page_cache.stats()
+        if cache["not_modified"] or cache["hash_hits"]:
+            self.log(f"签到页缓存: 304 {cache['not_modified']} 次，内容未变 {cache['hash_hits']} 次，"
+                     f"重新解析 {cache['misses']} 次")
+
+        push_messages, needs_retry = self._merge_results(results, cached_invalid)
+        if not needs_retry:
+            self.checkpoint.finish()
+
+        # 账本压缩只在协调进程中进行 (分片/队列节点可能同时追加同一文件)
+        if self.shard is None and self.work_queue is None:
+            self.ledger.compact()
+
+        try:
+            compacted = self.history.compact()
+            if compacted:
+                logger.debug(f"运行历史: 清理了 {compacted} 条过期记录")
+        except Exception as e:
+            logger.warning(f"运行历史清理失败: {e}")
+
+        # 发送推送
+        if push_messages:
+            self._push_notify("\n".join(push_messages))
+        
+        self.log("--- 本次任务结束 ---")
+        return needs_retry
+
+    def run_with_retries(self):
+        """
+        Run the check-in flow with a retry mechanism.
+
+        If the initial run has failures, it will retry after 5 and 15 minutes.
+        """
+        self._run_attempts()
+        # 本次运行 (含重试) 结束后检查点失效，之后的运行从头开始;
+        # 只有中断 (崩溃/强制退出) 的运行会留下未完成的检查点
+        self.checkpoint.finish()
+
+    def _run_attempts(self):
+        """
+        Run the check-in flow, then retry it after each of RETRY_WAITS while tasks fail.
+        """
+        # 初次运行 (队列模式在首次入队时取得新的运行代号)
+        self._attempt = 0
+        self._queue_run = None
+        self._queue_retry = set()
+        failed = self.run_check_flow()
+
+        # 如果有失败，进行有限次重试
+        if failed:
+            for wait_min in self.RETRY_WAITS:
+                self.log(f"检测到失败任务，将在 {wait_min} 分钟后重试...")
+                self._retry_wake.clear()
+                self._set_state(self.STATE_RETRY_WAIT)
+                self._retry_wake.wait(wait_min * 60)
+                self._set_state(self.STATE_RUNNING)
+                self._retry_wake.clear()
+                self._attempt += 1
+                failed = self.run_check_flow()
+                if not failed:
+                    break
+            if failed:
+                self.log("多次重试后仍有任务失败，放弃。")
+
+
+class WatchTarget:
+    """
+    Polling state of one (account, class) pair in watch mode.
+
+    Attributes:
+        acc_name (str): The account name.
+        class_id (str): The watched class.
+        group (list): The account's work items (used to sign).
+        interval (float): The current polling interval in seconds.
+        due (float): When the next poll is due (time.monotonic()).
+        seen (set): IDs of the pending cards already handled, or None before the first poll.
+        failed (set): IDs whose last sign attempt needs a retry (failed, deferred, or skipped
+                      because of the card's open/close time); they are retried on the next poll.
+    """
+    __slots__ = ("acc_name", "class_id", "group", "interval", "due", "seen", "failed")
+
+    def __init__(self, acc_name, class_id, group, interval, due):
+        self.acc_name = acc_name
+        self.class_id = class_id
+        self.group = group
+        self.interval = interval
+        self.due = due
+        self.seen = None
+        self.failed = set()
+
+
+class ClassWatcher:
+    """
+    Adaptive watch mode: polls every class's punch page and signs new check-ins right away.
+
+    Each (account, class) pair has its own polling interval. It starts at
+    min_interval and doubles after every poll without new cards. During the
+    class hours learned from the run history (weekday and hour with check-ins)
+    it is capped at active_max_interval, otherwise at max_interval. A new
+    unsigned card signs the account at once and resets the interval.
+    Polls go through the shared page cache (conditional requests and body
+    digest), so unchanged pages cost almost nothing. All requests of the
+    watcher share one token bucket of requests_per_hour.
+    """
+    # 无可监视目标时的等待时间 / 最长睡眠 (秒), 以便及时响应配置变更
+    IDLE_WAIT = 30
+    MAX_SLEEP = 5
+    RELOAD_CHECK_INTERVAL = 10
+    # 学习到的上课时段缓存时间 (秒)
+    ACTIVE_HOURS_TTL = 3600
+
+    def __init__(self, manager, min_interval=30, active_max_interval=120, max_interval=900,
+                 requests_per_hour=600, history_days=28):
+        """
+        Args:
+            manager (CheckInManager): Provides the clients, page cache, history and signing.
+            min_interval (float): Polling interval right after a change, in seconds.
+            active_max_interval (float): Longest interval during learned class hours.
+            max_interval (float): Longest interval outside class hours.
+            requests_per_hour (float): Global request budget of the watcher.
+            history_days (float): How much run history is used to learn class hours.
+        """
+        self.manager = manager
+        self.min_interval = max(1.0, float(min_interval))
+        self.active_max_interval = max(self.min_interval, float(active_max_interval))
+        self.max_interval = max(self.active_max_interval, float(max_interval))
+        self.requests_per_hour = max(1.0, float(requests_per_hour))
+        self.history_days = history_days
+        # 每小时请求预算, 最多允许一分钟的突发
+        self.budget = TokenBucket(self.requests_per_hour / 3600.0, burst=max(1.0, self.requests_per_hour / 60))
+        self._targets = {}  # (acc_name, class_id) -> WatchTarget
+        self._heap = []     # (due, seq, key)
+        self._seq = 0
+        self._dirty = True
+        self._stop = threading.Event()
+        self._active_hours = {}
+        self._active_loaded_at = 0.0
+        self.polls = 0
+        self.hits = 0
+        self.budget_waits = 0
+        if hasattr(manager.cfg, "subscribe"):
+            manager.cfg.subscribe(self._on_config_change)
+
+    @classmethod
+    def from_config(cls, manager):
+        """
+        Build a watcher from the watch_* settings.
+
+        Args:
+            manager (CheckInManager): The manager.
+
+        Returns:
+            ClassWatcher: The watcher.
+        """
+        cfg = manager.cfg
+        return cls(
+            manager,
+            min_interval=cfg.get("watch_min_interval", 30),
+            active_max_interval=cfg.get("watch_active_max_interval", 120),
+            max_interval=cfg.get("watch_max_interval", 900),
+            requests_per_hour=cfg.get("watch_requests_per_hour", 600),
+            history_days=cfg.get("watch_history_days", 28)
+        )
+
+    def _on_config_change(self, section, action, index):
+        if section in ("accounts", "locations", "tasks"):
+            self._dirty = True
+
+    def _push(self, target):
+        self._seq += 1
+        heapq.heappush(self._heap, (target.due, self._seq, (target.acc_name, target.class_id)))
+
+    def _rebuild(self):
+        """
+        Rebuild the watch targets from the enabled tasks, keeping the state of unchanged pairs.
+        """
+        self._dirty = False
+        now = time.monotonic()
+        targets = {}
+        for group in self.manager._compile_tasks()[0]:
+            for class_id in group[0].account.class_ids:
+                key = (group[0].acc_name, class_id)
+                target = self._targets.get(key)
+                if target is None:
+                    target = WatchTarget(key[0], class_id, group, self.min_interval, now)
+                target.group = group
+                targets[key] = target
+        self._targets = targets
+        self._heap = []
+        for target in targets.values():
+            self._push(target)
+        self.manager.log(f"监视目标: {len(targets)} 个班级页面")
+
+    def _active(self, acc_name, when):
+        """
+        Check whether a time falls into the account's learned class hours.
+
+        Args:
+            acc_name (str): The account name.
+            when (datetime): The time to check.
+
+        Returns:
+            bool: True if check-ins were seen at this weekday and hour before.
+        """
+        if time.monotonic() - self._active_loaded_at > self.ACTIVE_HOURS_TTL:
+            try:
+                self._active_hours = self.manager.history.active_hours(self.history_days)
+            except Exception as e:
+                logger.warning(f"读取运行历史失败，无法学习上课时段: {e}")
+            self._active_loaded_at = time.monotonic()
+        return (int(when.strftime("%w")), when.hour) in self._active_hours.get(acc_name, ())
+
+    def _schedule(self, target, changed, due_by=None):
+        """
+        Compute the target's next interval and due time, then queue it.
+
+        Args:
+            target (WatchTarget): The target just polled.
+            changed (bool): True if the poll found new cards.
+            due_by (float, optional): Poll again no later than this (time.monotonic()),
+                                      e.g. when a pending card opens.
+        """
+        now_wall = datetime.now()
+        active = self._active(target.acc_name, now_wall)
+        cap = self.active_max_interval if active else self.max_interval
+        if changed:
+            target.interval = self.min_interval
+        else:
+            # 无变化: 指数退避
+            target.interval = min(target.interval * 2, cap)
+        delay = target.interval
+        if not active:
+            # 退避期间进入上课时段时, 在时段开始时立即轮询
+            next_hour = now_wall.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            until_next_hour = (next_hour - now_wall).total_seconds()
+            if until_next_hour < delay and self._active(target.acc_name, next_hour):
+                target.interval = self.min_interval
+                delay = until_next_hour
+        if due_by is not None:
+            delay = min(delay, max(1.0, due_by - time.monotonic()))
+        target.due = time.monotonic() + delay
+        self._push(target)
+
+    def _poll(self, target):
+        """
+        Fetch one class's punch page and sign the account if a new card appeared.
+
+        Args:
+            target (WatchTarget): The target to poll.
+        """
+        if not self.budget.acquire(timeout=0):
+            # 超出每小时预算: 等到有新的请求额度
+            self.budget_waits += 1
+            target.due = time.monotonic() + 3600.0 / self.requests_per_hour
+            self._push(target)
+            return
+
+        account = target.group[0].account
+        client = self.manager.client_pool.get(target.acc_name, account.cookie, account.class_id)
+        self.polls += 1
+        try:
+            cards = client.fetch_tasks(class_id=target.class_id)
+        except (DeadlineExceeded, CircuitOpen) as e:
+            logger.debug(f"监视 [{target.acc_name}] 班级 [{target.class_id}] 暂停: {e}")
+            self._schedule(target, changed=False)
+            return
+
+        if cards is None:
+            # Cookie 失效: 停止监视该账号, 修改 Cookie 后重新加入
+            self.manager.invalid_cookies.add(account.cookie, target.acc_name)
+            self.manager.log(f"监视 [{target.acc_name}] Cookie 已失效，停止监视该账号")
+            self._dirty = True
+            return
+
+        pending = {card.id for card in cards}
+        new = pending - (target.seen or set())
+        target.seen = pending
+        if not new:
+            self._schedule(target, changed=False)
+            return
+
+        # 仅为重试失败的签到时不重置间隔, 持续失败的签到按退避节奏重试
+        changed = bool(new - target.failed)
+        self.hits += 1
+        self.manager.log(f"监视 [{target.acc_name}] 班级 [{target.class_id}] 发现新签到: {', '.join(sorted(new))}")
+        results = self.manager.sign_now(target.group, source="watch")
+        if results is None:
+            # 已有运行进行中: 下次轮询再处理
+            target.seen = pending - new
+            self._schedule(target, changed=changed)
+            return
+
+        # 签到的抓取 (每个任务项抓取一次账号的全部班级) 与提交同样计入预算
+        fetches = len(target.group) * len(account.class_ids)
+        signs = sum(1 for r in results if r.status in (TaskResult.OK, TaskResult.FAILED, TaskResult.ERROR))
+        self.budget.spend(fetches + signs)
+        # 需要重试的签到 (失败/异常/顺延/尚未开始等) 不标记为已处理, 下次轮询重试
+        target.failed = {r.sign_id for r in results if r.sign_id and self.manager._needs_retry(r)}
+        target.seen = pending - target.failed
+        # 尚未开始的签到在开放时立即轮询, 不等退避间隔
+        opens = [card.open_time for card in cards if card.id in target.failed and not card.is_open()]
+        due_by = None
+        if opens:
+            due_by = time.monotonic() + (min(opens) - datetime.now()).total_seconds()
+        self._schedule(target, changed=changed, due_by=due_by)
+
+    def run(self):
+        """
+        Poll until stop() is called.
+        """
+        self.manager.log("--- 监视模式启动 ---")
+        last_reload_check = time.monotonic()
+        while not self._stop.is_set():
+            if time.monotonic() - last_reload_check >= self.RELOAD_CHECK_INTERVAL:
+                last_reload_check = time.monotonic()
+                if hasattr(self.manager.cfg, "check_reload"):
+                    self.manager.cfg.check_reload()
+            if self._dirty:
+                self._rebuild()
+            if not self._heap:
+                self._stop.wait(self.IDLE_WAIT)
+                continue
+            due, _, key = self._heap[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                self._stop.wait(min(delay, self.MAX_SLEEP))
+                continue
+            heapq.heappop(self._heap)
+            target = self._targets.get(key)
+            if target is None or target.due != due:
+                continue  # 目标已移除或已重新排期
+            try:
+                self._poll(target)
+            except Exception as e:
+                logger.error(f"监视 [{target.acc_name}] 轮询异常: {e}")
+                self._schedule(target, changed=False)
+        self.manager.log("--- 监视模式结束 ---")
+
+    def stop(self):
+        """
+        Ask run() to return.
+        """
+        self._stop.set()
+
+    def stats(self):
+        """
+        Returns:
+            dict: {"targets", "polls", "hits", "budget_waits", "intervals"}.
+        """
+        return {
+            "targets": len(self._targets),
+            "polls": self.polls,
+            "hits": self.hits,
+            "budget_waits": self.budget_waits,
+            "intervals": {f"{t.acc_name}/{t.class_id}": t.interval for t in list(self._targets.values())},
+        }
+
+# ===========================
+# 5. 分布式工作队列 (租约)
+# ===========================
+
+class QueueBackend(ABC):
+    """
+    Storage interface for the lease-based work queue.
+
+    A backend keeps one row per (run_key, item_key) with a state of "pending",
+    "leased" or "done", plus the generations started for each base run key.
+    Implementations must make begin_run() and claim() atomic across all
+    workers sharing the store. Subclasses must implement every method; an
+    incomplete backend fails when it is constructed.
+    """
+    @abstractmethod
+    def begin_run(self, base_key, join_window):
+        """
+        Pick the generation of a new logical run (not a retry).
+
+        The latest generation of base_key is joined if it started less than
+        join_window seconds ago or still has pending or live-leased items
+        (their run keys start with "<base_key>@<generation>#"). Otherwise the
+        next generation is opened, so a later run on the same day does not
+        find its items already done.
+
+        Args:
+            base_key (str): Identifier shared by all nodes (e.g. "<date> <scheduletime>").
+            join_window (float): Seconds during which other nodes join the same run.
+
+        Returns:
+            int: The generation to use.
+        """
+
+    @abstractmethod
+    def seed(self, run_key, item_keys):
+        """
+        Insert work items for a run, ignoring items that already exist.
+
+        Args:
+            run_key (str): Identifier shared by all nodes for this run.
+            item_keys (list): Item keys (account names) to enqueue.
+        """
+
+    @abstractmethod
+    def claim(self, run_key, worker_id, lease_seconds, max_attempts):
+        """
+        Atomically lease one pending or expired item.
+
+        Args:
+            run_key (str): The run identifier.
+            worker_id (str): The claiming worker.
+            lease_seconds (float): Lease duration.
+            max_attempts (int): Items leased this many times are no longer handed out.
+
+        Returns:
+            str: The claimed item key, or None if nothing is claimable.
+        """
+
+    @abstractmethod
+    def heartbeat(self, run_key, item_key, worker_id, lease_seconds):
+        """
+        Extend a lease held by worker_id.
+
+        Returns:
+            bool: False if the lease was lost (expired and reclaimed).
+        """
+
+    @abstractmethod
+    def complete(self, run_key, item_key, worker_id):
+        """
+        Mark a leased item as done.
+
+        Returns:
+            bool: False if worker_id no longer holds the lease.
+        """
+
+    @abstractmethod
+    def outstanding(self, run_key, max_attempts):
+        """
+        Count items that are not done and may still be processed.
+
+        Returns:
+            int: Items below max_attempts, plus items whose current lease is still live.
+        """
+
+
+class MemoryQueueBackend(QueueBackend):
+    """
+    In-process queue backend.
+
+    Behaves like a shared key-value store (a Redis stand-in) for threads of a
+    single process, which makes it suitable for tests and local experiments.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = {}  # (run_key, item_key) -> [state, owner, lease_until, attempts]
+        self._runs = {}   # base_key -> (generation, started_at)
+
+    def begin_run(self, base_key, join_window):
+        now = time.time()
+        with self._lock:
+            latest = self._runs.get(base_key)
+            if latest is not None:
+                prefix = f"{base_key}@{latest[0]}#"
+                active = any(
+                    rk.startswith(prefix) and (row[0] == "pending" or (row[0] == "leased" and row[2] >= now))
+                    for (rk, _), row in self._items.items()
+                )
+                if active or now - latest[1] <= join_window:
+                    return latest[0]
+            generation = latest[0] + 1 if latest is not None else 0
+            self._runs[base_key] = (generation, now)
+            return generation
+
+    def seed(self, run_key, item_keys):
+        with self._lock:
+            for key in item_keys:
+                self._items.setdefault((run_key, key), ["pending", None, 0.0, 0])
+
+    def claim(self, run_key, worker_id, lease_seconds, max_attempts):
+        now = time.time()
+        with self._lock:
+            candidates = [
+                (row[3], key) for (rk, key), row in self._items.items()
+                if rk == run_key and row[3] < max_attempts
+                and (row[0] == "pending" or (row[0] == "leased" and row[2] < now))
+            ]
+            if not candidates:
+                return None
+            _, key = min(candidates, key=lambda c: c[0])
+            row = self._items[(run_key, key)]
+            row[0], row[1], row[2], row[3] = "leased", worker_id, now + lease_seconds, row[3] + 1
+            return key
+
+    def heartbeat(self, run_key, item_key, worker_id, lease_seconds):
+        with self._lock:
+            row = self._items.get((run_key, item_key))
+            if not row or row[0] != "leased" or row[1] != worker_id:
+                return False
+            row[2] = time.time() + lease_seconds
+            return True
+
+    def complete(self, run_key, item_key, worker_id):
+        with self._lock:
+            row = self._items.get((run_key, item_key))
+            if not row or row[0] != "leased" or row[1] != worker_id:
+                return False
+            row[0] = "done"
+            return True
+
+    def outstanding(self, run_key, max_attempts):
+        now = time.time()
+        with self._lock:
+            return sum(
+                1 for (rk, _), row in self._items.items()
+                if rk == run_key and row[0] != "done"
+                and (row[3] < max_attempts or row[2] >= now)
+            )
+
+
+class SQLiteQueueBackend(QueueBackend):
+    """
+    Queue backend stored in a local SQLite file.
+
+    Several processes (or hosts sharing a local volume) can use the same file;
+    claims run inside BEGIN IMMEDIATE transactions, so SQLite's file lock
+    serialises them.
+    """
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Path of the SQLite database file.
+        """
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS work_items ("
+                " run_key TEXT NOT NULL, item_key TEXT NOT NULL,"
+                " state TEXT NOT NULL DEFAULT 'pending', owner TEXT,"
+                " lease_until REAL NOT NULL DEFAULT 0, attempts INTEGER NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (run_key, item_key))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " base_key TEXT NOT NULL, generation INTEGER NOT NULL, started_at REAL NOT NULL,"
+                " PRIMARY KEY (base_key, generation))"
+            )
+        finally:
+            conn.close()
+
+    def _connect(self):
+        import sqlite3
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def begin_run(self, base_key, join_window):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            latest = conn.execute(
+                "SELECT generation, started_at FROM runs WHERE base_key = ? ORDER BY generation DESC LIMIT 1",
+                (base_key,)
+            ).fetchone()
+            if latest is not None:
+                prefix = f"{base_key}@{latest[0]}#"
+                active = conn.execute(
+                    "SELECT 1 FROM work_items WHERE substr(run_key, 1, ?) = ?"
+                    " AND (state = 'pending' OR (state = 'leased' AND lease_until >= ?)) LIMIT 1",
+                    (len(prefix), prefix, now)
+                ).fetchone()
+                if active or now - latest[1] <= join_window:
+                    conn.execute("COMMIT")
+                    return latest[0]
+            generation = latest[0] + 1 if latest is not None else 0
+            conn.execute("INSERT INTO runs (base_key, generation, started_at) VALUES (?, ?, ?)",
+                         (base_key, generation, now))
+            conn.execute("COMMIT")
+            return generation
+        finally:
+            conn.close()
+
+    def seed(self, run_key, item_keys):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT OR IGNORE INTO work_items (run_key, item_key) VALUES (?, ?)",
+                [(run_key, key) for key in item_keys]
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def claim(self, run_key, worker_id, lease_seconds, max_attempts):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT item_key FROM work_items WHERE run_key = ? AND attempts < ?"
+                " AND (state = 'pending' OR (state = 'leased' AND lease_until < ?))"
+                " ORDER BY attempts, rowid LIMIT 1",
+                (run_key, max_attempts, now)
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE work_items SET state = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1"
+                    " WHERE run_key = ? AND item_key = ?",
+                    (worker_id, now + lease_seconds, run_key, row[0])
+                )
+            conn.execute("COMMIT")
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+    def heartbeat(self, run_key, item_key, worker_id, lease_seconds):
+        conn = self._connect()
+        try:
+            cur = conn.execute(
+                "UPDATE work_items SET lease_until = ? WHERE run_key = ? AND item_key = ?"
+                " AND state = 'leased' AND owner = ?",
+                (time.time() + lease_seconds, run_key, item_key, worker_id)
+            )
+            return cur.rowcount == 1
+        finally:
+            conn.close()
+
+    def complete(self, run_key, item_key, worker_id):
+        conn = self._connect()
+        try:
+            cur = conn.execute(
+                "UPDATE work_items SET state = 'done' WHERE run_key = ? AND item_key = ?"
+                " AND state = 'leased' AND owner = ?",
+                (run_key, item_key, worker_id)
+            )
+            return cur.rowcount == 1
+        finally:
+            conn.close()
+
+    def outstanding(self, run_key, max_attempts):
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT COUNT(*) FROM work_items WHERE run_key = ? AND state != 'done'"
+                " AND (attempts < ? OR lease_until >= ?)",
+                (run_key, max_attempts, time.time())
+            ).fetchone()[0]
+        finally:
+            conn.close()
+
+
+class WorkQueue:
+    """
+    Lease-based work queue shared by CheckInManager instances on several nodes.
+
+    Each node claims one item (account) at a time, keeps its lease alive with a
+    heartbeat thread while working on it, and marks it done afterwards. Leases
+    of crashed nodes expire and are reclaimed by whoever is still draining, and
+    fast nodes simply claim more items, which balances slow accounts.
+
+    Every logical run gets its own generation of the shared base key (see
+    begin_run), so a second run on the same day starts from scratch instead
+    of finding every item already done.
+    """
+    def __init__(self, backend, worker_id=None, lease_seconds=60, poll_interval=2.0, max_attempts=3,
+                 join_window=120):
+        """
+        Args:
+            backend (QueueBackend): The shared store.
+            worker_id (str, optional): Unique worker name. Defaults to "host:pid".
+            lease_seconds (float): Lease duration; heartbeats renew it every third of that.
+            poll_interval (float): Wait between claims while other nodes hold leases.
+            max_attempts (int): Maximum number of leases per item (guards against poison items).
+            join_window (float): Nodes starting within this many seconds of each other join one run.
+        """
+        import socket
+        self.backend = backend
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.join_window = join_window
+
+    def begin_run(self, base_key):
+        """
+        Start or join a logical run.
+
+        Args:
+            base_key (str): Identifier shared by all nodes for this run.
+
+        Returns:
+            str: "<base_key>@<generation>", the prefix of this run's queue keys.
+        """
+        return f"{base_key}@{self.backend.begin_run(base_key, self.join_window)}"
+
+    def _heartbeat_loop(self, run_key, item_key, stop):
+        interval = max(self.lease_seconds / 3.0, 0.1)
+        while not stop.wait(interval):
+            if not self.backend.heartbeat(run_key, item_key, self.worker_id, self.lease_seconds):
+                logger.warning(f"工作项 [{item_key}] 的租约已丢失")
+                return
+
+    def drain(self, run_key, item_keys, handler):
+        """
+        Seed the run and process items until no work is outstanding.
+
+        Args:
+            run_key (str): Identifier shared by all nodes for this run.
+            item_keys (list): All item keys of the run (seeding is idempotent).
+            handler (callable): handler(item_key) executed for each claimed item.
+
+        Returns:
+            list: The item keys processed by this worker, in claim order.
+        """
+        self.backend.seed(run_key, item_keys)
+        processed = []
+
+        while True:
+            key = self.backend.claim(run_key, self.worker_id, self.lease_seconds, self.max_attempts)
+            if key is None:
+                # 其他节点仍持有租约时等待: 若其崩溃，租约过期后由本节点接手
+                if self.backend.outstanding(run_key, self.max_attempts) == 0:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+
+            stop = threading.Event()
+            beat = threading.Thread(target=self._heartbeat_loop, args=(run_key, key, stop), daemon=True)
+            beat.start()
+            try:
+                handler(key)
+            finally:
+                stop.set()
+                beat.join()
+            if not self.backend.complete(run_key, key, self.worker_id):
+                logger.warning(f"工作项 [{key}] 完成时租约已被其他节点接管")
+            processed.append(key)
+
+        return processed
+
+
+# ===========================
+# 6. 本地控制接口 (守护进程)
+# ===========================
+
+class ControlServer:
+    """
+    Local HTTP control API around a long-lived CheckInManager (daemon mode).
+
+    All responses are JSON:
+        GET  /status         run state, live progress and the next scheduled run
+        GET  /metrics        limiter, circuit breaker, page cache and client pool
+        GET  /logs?after=N   log lines with a sequence number greater than N
+        POST /run            start a run in the background ("started", "merged" or "queued")
+        POST /reload         re-read config.json now and return the applied diff
+
+    Binds to 127.0.0.1 by default. Requests carrying an Origin or Referer header
+    are refused so a web page open in a local browser cannot drive the daemon.
+    Without a token, the Host header must also be a loopback name or the bound
+    address; with a token, every request must send it in X-Control-Token.
+    """
+    LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+    LOG_BUFFER = 500
+
+    def __init__(self, manager, host="127.0.0.1", port=8765, token=None, next_run=None):
+        """
+        Args:
+            manager (CheckInManager): The manager to control.
+            host (str): The address to bind to.
+            port (int): The port to bind to (0 picks a free port).
+            token (str, optional): Shared secret required in the X-Control-Token header.
+            next_run (callable, optional): Returns the next scheduled run as a datetime, or None.
+        """
+        self.manager = manager
+        self.host = host
+        self.port = int(port)
+        self.token = token or None
+        self.next_run = next_run
+        self._httpd = None
+        self._logs = deque(maxlen=self.LOG_BUFFER)
+        self._log_seq = 0
+        self._log_lock = threading.Lock()
+
+    def append_log(self, msg):
+        """
+        Keep a log line for GET /logs. Use as the manager's log_callback.
+
+        Args:
+            msg (str): The message.
+        """
+        with self._log_lock:
+            self._log_seq += 1
+            self._logs.append((self._log_seq, msg))
+
+    def logs(self, after=0):
+        """
+        Args:
+            after (int): Return only lines with a larger sequence number.
+
+        Returns:
+            dict: {"seq": latest sequence number, "lines": [[seq, msg], ...]}.
+        """
+        with self._log_lock:
+            return {"seq": self._log_seq, "lines": [[n, m] for n, m in self._logs if n > after]}
+
+    def status(self):
+        """
+        Returns:
+            dict: The manager status plus "next_run" (ISO time or None).
+        """
+        status = self.manager.status()
+        next_run = self.next_run() if self.next_run else None
+        status["next_run"] = next_run.isoformat(timespec="seconds") if next_run else None
+        return status
+
+    def trigger_run(self, source="api"):
+        """
+        Start a run in a background thread without waiting for it to finish.
+
+        Args:
+            source (str): Who requested the run.
+
+        Returns:
+            str: "started", or the immediate outcome of run_job ("merged", "queued", "completed").
+        """
+        done = threading.Event()
+        outcome = {}
+
+        def target():
+            try:
+                outcome["value"] = self.manager.run_job(source=source)
+            except Exception as e:
+                logger.error(f"控制接口触发的运行异常: {e}")
+                outcome["value"] = "error"
+            finally:
+                done.set()
+
+        threading.Thread(target=target, daemon=True).start()
+        # 合并/排队会立即返回; 否则运行已开始
+        if done.wait(0.2):
+            return outcome["value"]
+        return "started"
+
+    def reload(self):
+        """
+        Returns:
+            dict: {"reloaded": bool, "diff": the applied diff or None}.
+        """
+        diff = self.manager.cfg.check_reload() if hasattr(self.manager.cfg, "check_reload") else None
+        return {"reloaded": diff is not None, "diff": diff}
+
+    def _local_request(self, headers):
+        """
+        Returns:
+            bool: False for browser (cross-origin) requests or a foreign Host header.
+        """
+        if headers.get("Origin") is not None or headers.get("Referer") is not None:
+            return False
+        host = (headers.get("Host") or "").strip().lower()
+        if not host or self.token:
+            # 设置了令牌时由令牌把关，允许通过其他地址访问
+            return True
+        if host.startswith("["):
+            # IPv6 形式: [::1]:8765
+            host = host[1:].split("]", 1)[0]
+        elif host.count(":") == 1:
+            host = host.split(":", 1)[0]
+        return host in self.LOCAL_HOSTS or host == str(self.host).lower()
+
+    def _authorized(self, headers):
+        if not self.token:
+            return True
+        import hmac
+        return hmac.compare_digest(headers.get("X-Control-Token", ""), self.token)
+
+    def _route(self, method, path, query):
+        """
+        Dispatch one request.
+
+        Returns:
+            tuple: (HTTP status, JSON-serialisable body).
+        """
+        if method == "GET" and path == "/status":
+            return 200, self.status()
+        if method == "GET" and path == "/metrics":
+            return 200, self.manager.metrics()
+        if method == "GET" and path == "/logs":
+            try:
+                after = int(query.get("after", ["0"])[0])
+            except ValueError:
+                return 400, {"error": "after must be an integer"}
+            return 200, self.logs(after)
+        if method == "POST" and path == "/run":
+            return 202, {"outcome": self.trigger_run(query.get("source", ["api"])[0])}
+        if method == "POST" and path == "/reload":
+            return 200, self.reload()
+        return 404, {"error": f"unknown endpoint {method} {path}"}
+
+    def start(self):
+        """
+        Start serving in a background thread.
+
+        Returns:
+            int: The bound port.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import urlsplit, parse_qs
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self, method):
+                if not server._local_request(self.headers):
+                    code, body = 403, {"error": "cross-origin or non-local requests are not allowed"}
+                elif not server._authorized(self.headers):
+                    code, body = 401, {"error": "invalid control token"}
+                else:
+                    url = urlsplit(self.path)
+                    try:
+                        code, body = server._route(method, url.path.rstrip("/") or "/", parse_qs(url.query))
+                    except Exception as e:
+                        logger.error(f"控制接口请求处理失败: {e}")
+                        code, body = 500, {"error": str(e)}
+                payload = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def log_message(self, format, *args):
+                logger.debug("控制接口: " + format % args)
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        logger.info(f"控制接口已启动: http://{self.host}:{self.port}")
+        return self.port
+
+    def stop(self):
+        """
+        Stop serving.
+        """
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+
+class ControlClient:
+    """
+    Thin client for a ControlServer, used by the CLI and the GUI to attach to a daemon.
+
+    Network errors surface as OSError (urllib's URLError is a subclass).
+    """
+    def __init__(self, url="http://127.0.0.1:8765", token=None, timeout=3):
+        """
+        Args:
+            url (str): Base URL of the daemon.
+            token (str, optional): The daemon's control token.
+            timeout (float): Seconds to wait for each call.
+        """
+        self.url = url.rstrip("/")
+        self.token = token or None
+        self.timeout = timeout
+
+    @classmethod
+    def from_config(cls, cfg, timeout=3):
+        """
+        Build a client from the control_host/control_port/control_token settings.
+
+        Args:
+            cfg (ConfigManager): The configuration manager.
+            timeout (float): Seconds to wait for each call.
+
+        Returns:
+            ControlClient: The client.
+        """
+        host = cfg.get("control_host", "127.0.0.1")
+        port = cfg.get("control_port", 8765)
+        return cls(f"http://{host}:{port}", token=cfg.get("control_token"), timeout=timeout)
+
+    def _call(self, method, path):
+        import urllib.request
+        import urllib.error
+        req = urllib.request.Request(self.url + path, data=b"" if method == "POST" else None, method=method)
+        if self.token:
+            req.add_header("X-Control-Token", self.token)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return json.loads(resp.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            try:
+                detail = json.loads(e.read().decode("utf-8")).get("error", e.reason)
+            except ValueError:
+                detail = e.reason
+            raise OSError(f"控制接口返回 {e.code}: {detail}") from e
+
+    def status(self):
+        """
+        Returns:
+            dict: Run state, progress and next scheduled run.
+        """
+        return self._call("GET", "/status")
+
+    def metrics(self):
+        """
+        Returns:
+            dict: Metrics of the daemon's shared components.
+        """
+        return self._call("GET", "/metrics")
+
+    def logs(self, after=0):
+        """
+        Returns:
+            dict: {"seq", "lines"} with log lines newer than after.
+        """
+        return self._call("GET", f"/logs?after={int(after)}")
+
+    def run(self, source="api"):
+        """
+        Returns:
+            str: "started", "merged" or "queued".
+        """
+        from urllib.parse import quote
+        return self._call("POST", f"/run?source={quote(source)}")["outcome"]
+
+    def reload(self):
+        """
+        Returns:
+            dict: {"reloaded", "diff"}.
+        """
+        return self._call("POST", "/reload")
+
 
 # ===========================
-# 5. 程序入口
+# 7. 程序入口
 # ===========================
 
 if __name__ == "__main__":
@@ -689,7 +5023,7 @@ if __name__ == "__main__":
     
     if is_ci:
         logger.info("检测到 CI 环境，运行一次后退出")
-        manager.run_with_retries()
+        manager.run_job(source="ci")
     else:
         schedule_time = config.get("scheduletime", "08:00")
         logger.info(f"本地模式启动，定时任务已设定为: {schedule_time}")
@@ -697,7 +5031,11 @@ if __name__ == "__main__":
         # 立即运行一次测试
         # manager.run_with_retries()
         
-        schedule.every().day.at(schedule_time).do(manager.run_with_retries)
+        import schedule
+        schedule.every().day.at(schedule_time).do(manager.run_job, source="schedule")
+        warmup = int(config.get("warmup_seconds", 20) or 0)
+        if warmup > 0:
+            schedule.every().day.at(shift_time_str(schedule_time, -warmup)).do(manager.warm_up)
         
         while True:
             schedule.run_pending()
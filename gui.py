@@ -5,10 +5,10 @@ import logging
 import traceback
 import sys
 import os
-import schedule
 from datetime import datetime, timedelta
 
-from core import ConfigManager, CheckInManager
+from core import (ConfigManager, CheckInManager, ControlClient, Account, Location, shift_time_str,
+                  InvalidCookieCache, RunProgress, data_path)
 
 """
 Modern GUI module for AutoCheckBJMF using Flet.
@@ -47,6 +47,7 @@ TRANSLATIONS = {
         "edit": "Edit",
         "name": "Name",
         "class_id": "Class ID",
+        "class_id_hint": "Several classes: separate the IDs with commas",
         "cookie": "Cookie",
         "password": "Password (Optional, for pwd check-in)",
         "save": "Save",
@@ -103,6 +104,30 @@ TRANSLATIONS = {
         "lat_lng_error": "Latitude and Longitude must be numbers.",
         "missing_fields": "Name, Class ID and Cookie are required.",
         "guide": "Guide",
+        "search": "Search",
+        "page_of": "Page {page} / {pages} ({count} items)",
+        "run_progress": "Run Progress",
+        "progress_idle": "No run in progress.",
+        "progress_counts": "Done {done} · Failed {failed} · In flight {in_flight} · Queued {queued}",
+        "progress_rate": "{rate:.2f} tasks/s · ETA {eta}",
+        "progress_concurrency": " · Concurrency {limit}",
+        "progress_at_risk": " · At risk/missed {at_risk}",
+        "state_idle": "Idle",
+        "state_running": "Running ({source})",
+        "state_retry_wait": "Waiting to retry ({source})",
+        "state_follow_up": " · 1 follow-up queued",
+        "run_merged": "A run is already in progress; this request was merged into it.",
+        "run_queued": "A run is already in progress; one follow-up run is queued.",
+        "needs_relogin": "Cookie expired - please log in again and update it",
+        "import": "Import from CSV/JSONL",
+        "import_done": "Imported {accounts} accounts, {locations} locations, {tasks} tasks",
+        "import_errors": "Rejected rows ({count})",
+        "import_line": "Line {line}: {error}",
+        "import_more": "... and {count} more",
+        "import_failed": "Import failed: {error}",
+        "daemon_attached": "Attached to the daemon at {url}; runs and scheduling happen there.",
+        "daemon_lost": "Lost connection to the daemon: {error}",
+        "daemon_back": "Reconnected to the daemon.",
     },
     "zh": {
         "title": "班级魔方自动签到 - AutoCheckBJMF",
@@ -133,6 +158,7 @@ TRANSLATIONS = {
         "edit": "编辑",
         "name": "名称",
         "class_id": "班级ID (Class ID)",
+        "class_id_hint": "多个班级用逗号分隔",
         "cookie": "Cookie",
         "password": "密码 (选填，用于密码签到)",
         "save": "保存",
@@ -188,10 +214,173 @@ TRANSLATIONS = {
         "invalid_time": "时间格式无效。请使用 HH:MM。",
         "lat_lng_error": "经纬度必须是数字。",
         "missing_fields": "名称、班级ID 和 Cookie 必填。",
+        "search": "搜索",
+        "page_of": "第 {page} / {pages} 页 (共 {count} 项)",
+        "run_progress": "运行进度",
+        "progress_idle": "当前没有运行中的任务。",
+        "progress_counts": "完成 {done} · 失败 {failed} · 进行中 {in_flight} · 排队 {queued}",
+        "progress_rate": "{rate:.2f} 任务/秒 · 预计剩余 {eta}",
+        "progress_concurrency": " · 并发 {limit}",
+        "progress_at_risk": " · 临近截止/错过 {at_risk}",
+        "state_idle": "空闲",
+        "state_running": "运行中 ({source})",
+        "state_retry_wait": "等待重试 ({source})",
+        "state_follow_up": " · 已排队 1 次后续运行",
+        "run_merged": "已有运行进行中，本次请求已合并。",
+        "run_queued": "已有运行进行中，已排队一次后续运行。",
+        "needs_relogin": "Cookie 已失效，请重新登录并更新",
+        "import": "从 CSV/JSONL 导入",
+        "import_done": "已导入 {accounts} 个账号、{locations} 个地点、{tasks} 个任务",
+        "import_errors": "未导入的行 ({count})",
+        "import_line": "第 {line} 行: {error}",
+        "import_more": "... 另有 {count} 行",
+        "import_failed": "导入失败: {error}",
+        "daemon_attached": "已连接到守护进程 {url}，运行与定时任务由守护进程执行。",
+        "daemon_lost": "与守护进程的连接中断: {error}",
+        "daemon_back": "已重新连接到守护进程。",
     }
 }
 
+class PagedList:
+    """
+    Paginated, filterable view over one list section of the configuration.
+
+    Only the rows of the current page are built. A lowercase search key is kept
+    per item and patched on ConfigManager change events, so edits, toggles and
+    deletes only rebuild the affected row (or the current page when indexes shift).
+    """
+    PAGE_SIZE = 50
+
+    def __init__(self, app, section, build_row, search_key, empty_text):
+        """
+        Args:
+            app (AutoCheckApp): The owning application.
+            section (str): The config list section ("tasks", "accounts", "locations").
+            build_row (callable): build_row(index, item) -> ft.Control.
+            search_key (callable): search_key(item) -> str used for filtering.
+            empty_text (str): Text shown when the section has no items.
+        """
+        self.app = app
+        self.cfg = app.config_manager
+        self.section = section
+        self.build_row = build_row
+        self.search_key = search_key
+        self.empty_text = empty_text
+
+        self.page_no = 0
+        self.query = ""
+        self.keys = [self.search_key(item).lower() for item in self._items()]
+        self.matches = []
+        self.visible = {}  # config index -> position in list_view.controls
+
+        self.list_view = ft.ListView(expand=True, spacing=10)
+        self.search_field = ft.TextField(
+            hint_text=app.t("search"),
+            prefix_icon=ft.Icons.SEARCH,
+            dense=True,
+            on_change=self._on_search,
+        )
+        self.lbl_page = ft.Text("")
+        self.btn_prev = ft.IconButton(ft.Icons.CHEVRON_LEFT, on_click=lambda _: self.goto(self.page_no - 1))
+        self.btn_next = ft.IconButton(ft.Icons.CHEVRON_RIGHT, on_click=lambda _: self.goto(self.page_no + 1))
+        self.pager = ft.Row([self.btn_prev, self.lbl_page, self.btn_next], alignment=ft.MainAxisAlignment.CENTER)
+
+        self._filter()
+        self._render()
+        self.cfg.subscribe(self.on_config_change)
+
+    def controls(self):
+        """Controls to place on the page, in order."""
+        return [self.search_field, self.list_view, self.pager]
+
+    def dispose(self):
+        """Stop listening to config changes once the view is discarded."""
+        self.cfg.unsubscribe(self.on_config_change)
+
+    def _items(self):
+        return self.cfg.get(self.section, [])
+
+    def _pages(self):
+        return max(1, (len(self.matches) + self.PAGE_SIZE - 1) // self.PAGE_SIZE)
+
+    def _filter(self):
+        q = self.query
+        if q:
+            self.matches = [i for i, key in enumerate(self.keys) if q in key]
+        else:
+            self.matches = list(range(len(self.keys)))
+        self.page_no = min(self.page_no, self._pages() - 1)
+
+    def _render(self):
+        items = self._items()
+        self.list_view.controls.clear()
+        self.visible = {}
+
+        if not items:
+            self.list_view.controls.append(ft.Text(self.empty_text, italic=True))
+
+        start = self.page_no * self.PAGE_SIZE
+        for pos, idx in enumerate(self.matches[start:start + self.PAGE_SIZE]):
+            self.list_view.controls.append(self.build_row(idx, items[idx]))
+            self.visible[idx] = pos
+
+        pages = self._pages()
+        self.lbl_page.value = self.app.t("page_of").format(page=self.page_no + 1, pages=pages, count=len(self.matches))
+        self.btn_prev.disabled = self.page_no == 0
+        self.btn_next.disabled = self.page_no >= pages - 1
+        self.pager.visible = pages > 1
+
+    def _refresh(self):
+        self._render()
+        if self.list_view.page is not None:
+            self.list_view.update()
+            self.pager.update()
+
+    def goto(self, page_no):
+        if 0 <= page_no < self._pages():
+            self.page_no = page_no
+            self._refresh()
+
+    def _on_search(self, e):
+        self.query = (self.search_field.value or "").strip().lower()
+        self.page_no = 0
+        self._filter()
+        self._refresh()
+
+    def on_config_change(self, section, action, index):
+        """Apply a ConfigManager change event to the index and the rendered rows."""
+        if section != self.section:
+            return
+        items = self._items()
+
+        if action == "update" and index is not None and 0 <= index < len(self.keys):
+            self.keys[index] = self.search_key(items[index]).lower()
+            matched = not self.query or self.query in self.keys[index]
+            if index in self.visible and matched:
+                # 仅替换受影响的一行
+                row = self.build_row(index, items[index])
+                self.list_view.controls[self.visible[index]] = row
+                if self.list_view.page is not None:
+                    self.list_view.update()
+                return
+            if (index in self.visible) == matched:
+                return
+        elif action == "add" and index == len(self.keys):
+            self.keys.append(self.search_key(items[index]).lower())
+        elif action == "remove" and index is not None and 0 <= index < len(self.keys):
+            del self.keys[index]
+        else:
+            self.keys = [self.search_key(item).lower() for item in items]
+
+        self._filter()
+        self._refresh()
+
 class AutoCheckApp:
+    # 进度面板最短刷新间隔 (秒)
+    PROGRESS_MIN_INTERVAL = 0.5
+    # 检查 config.json 外部修改的间隔 (秒)
+    CONFIG_RELOAD_INTERVAL = 5
+
     def __init__(self, page: ft.Page):
         self.page = page
         self.config_manager = ConfigManager()
@@ -214,10 +403,32 @@ class AutoCheckApp:
         font_family = "ZCOOL KuaiLe" if self.current_lang == "zh" else "Comfortaa"
         self.page.theme = ft.Theme(color_scheme_seed=self.theme_color, font_family=font_family)
 
-        # Initialize CheckInManager with a thread-safe log callback
-        self.checkin_manager = CheckInManager(self.config_manager, log_callback=self.log_callback)
+        # Progress snapshots are coalesced and rendered at most every PROGRESS_MIN_INTERVAL
+        self._progress_lock = threading.Lock()
+        self._progress_pending = None
+        self._progress_last_render = 0.0
+
+        # 本机有守护进程 (main.py --daemon) 时作为瘦客户端接入，不再自建运行引擎、定时任务与会话
+        self.remote = self._attach_daemon()
+        self._remote_status = None
+        self._reload_pending = False
+
+        if self.remote:
+            # 运行引擎 (客户端池、历史、账本等) 只存在于守护进程中
+            self.checkin_manager = None
+            self.invalid_cookies = self._load_invalid_cookies()
+        else:
+            # Initialize CheckInManager with a thread-safe log callback
+            self.checkin_manager = CheckInManager(
+                self.config_manager,
+                log_callback=self.log_callback,
+                progress_callback=self.on_progress,
+                state_callback=self.on_run_state
+            )
+            self.invalid_cookies = self.checkin_manager.invalid_cookies
 
         self.log_lines = []
+        self.active_list = None
         self.log_list_view = ft.ListView(
             expand=True,
             spacing=10,
@@ -226,6 +437,11 @@ class AutoCheckApp:
             divider_thickness=1
         )
 
+        # 批量导入文件选择器 (按当前页面决定无 type 列时的默认类型)
+        self.import_picker = ft.FilePicker(on_result=self._on_import_picked)
+        self.page.overlay.append(self.import_picker)
+        self._import_section = None
+
         self.setup_ui()
         self.start_scheduler()
 
@@ -307,6 +523,7 @@ class AutoCheckApp:
     def on_nav_change(self, e):
         idx = e.control.selected_index
         self.content_area.controls.clear()
+        self._mount_list(None)
 
         if idx == 0:
             self.build_dashboard()
@@ -327,6 +544,7 @@ class AutoCheckApp:
 
     def reload_ui(self):
         """Rebuilds the entire UI, useful for language changes."""
+        self._mount_list(None)
         self.page.clean()
         self.page.title = self.t("title")
         self.setup_ui()
@@ -368,13 +586,119 @@ class AutoCheckApp:
             )
         )
 
+        # Run Progress Card
+        self.pb_progress = ft.ProgressBar(value=0, width=360)
+        self.lbl_progress_counts = ft.Text(self.t("progress_idle"))
+        self.lbl_progress_rate = ft.Text("", italic=True)
+        self.lbl_run_state = ft.Text("", weight=ft.FontWeight.W_500, color=ft.Colors.PRIMARY)
+        self.progress_card = ft.Card(
+            content=ft.Container(
+                content=ft.Column(
+                    [
+                        ft.Row([
+                            ft.Text(self.t("run_progress"), size=16, weight=ft.FontWeight.W_500),
+                            self.lbl_run_state
+                        ], spacing=20),
+                        self.pb_progress,
+                        self.lbl_progress_counts,
+                        self.lbl_progress_rate
+                    ]
+                ),
+                padding=20
+            )
+        )
+        self._apply_progress(self._progress_snapshot())
+        self._apply_run_state(self._run_state())
+
         self.content_area.controls.extend([
             ft.Text(self.t("dashboard"), size=30, weight=ft.FontWeight.BOLD),
             ft.Divider(),
             ft.Row([status_card, actions_card], alignment=ft.MainAxisAlignment.START, wrap=True),
+            self.progress_card,
         ])
         self.page.update()
 
+    def on_progress(self, snapshot):
+        """Receive a progress snapshot from CheckInManager (any thread) and render it rate-limited."""
+        with self._progress_lock:
+            self._progress_pending = snapshot
+            due = time.monotonic() - self._progress_last_render >= self.PROGRESS_MIN_INTERVAL
+        if due or not snapshot["running"]:
+            self._flush_progress()
+
+    def _flush_progress(self):
+        """Render the latest pending snapshot, if any, touching only the progress card."""
+        with self._progress_lock:
+            snapshot = self._progress_pending
+            self._progress_pending = None
+            if snapshot is None:
+                return
+            self._progress_last_render = time.monotonic()
+
+        if not hasattr(self, 'progress_card') or self.progress_card.page is None:
+            return
+        self._apply_progress(snapshot)
+        self.progress_card.update()
+
+    def on_run_state(self, state):
+        """Receive run coordinator state changes from CheckInManager (any thread)."""
+        if not hasattr(self, 'lbl_run_state') or self.lbl_run_state.page is None:
+            return
+        self._apply_run_state(state)
+        self.lbl_run_state.update()
+
+    def _progress_snapshot(self):
+        """Current progress: the local run's, or the daemon's last reported one."""
+        if self.checkin_manager:
+            return self.checkin_manager.progress.snapshot()
+        if self._remote_status:
+            return self._remote_status["progress"]
+        idle = RunProgress()
+        idle.finish()
+        return idle.snapshot()
+
+    def _run_state(self):
+        """Current run state: the local coordinator's, or the daemon's last reported one."""
+        if self.checkin_manager:
+            return self.checkin_manager.run_state()
+        if self._remote_status:
+            return self._remote_status["run"]
+        return {"state": CheckInManager.STATE_IDLE, "source": None, "started_at": None, "follow_up": False}
+
+    def _apply_run_state(self, state):
+        text = self.t(f"state_{state['state']}").format(source=state.get("source") or "-")
+        if state.get("follow_up"):
+            text += self.t("state_follow_up")
+        self.lbl_run_state.value = text
+
+    def _apply_progress(self, snapshot):
+        total = snapshot["total"]
+        finished = snapshot["done"] + snapshot["failed"]
+
+        if total == 0 and not snapshot["running"]:
+            self.pb_progress.value = 0
+            self.lbl_progress_counts.value = self.t("progress_idle")
+            self.lbl_progress_rate.value = ""
+            return
+
+        self.pb_progress.value = finished / total if total else None
+        self.pb_progress.color = ft.Colors.RED if snapshot["failed"] else None
+        self.lbl_progress_counts.value = self.t("progress_counts").format(**snapshot)
+        eta = snapshot["eta"]
+        eta_text = str(timedelta(seconds=int(eta))) if eta is not None and snapshot["running"] else "-"
+        self.lbl_progress_rate.value = self.t("progress_rate").format(rate=snapshot["throughput"], eta=eta_text)
+        if snapshot.get("concurrency"):
+            self.lbl_progress_rate.value += self.t("progress_concurrency").format(limit=snapshot["concurrency"])
+        if snapshot.get("at_risk"):
+            self.lbl_progress_rate.value += self.t("progress_at_risk").format(at_risk=snapshot["at_risk"])
+
+    def _mount_list(self, paged_list):
+        """Replace the active PagedList, detaching the previous one from config events."""
+        if self.active_list is not None:
+            self.active_list.dispose()
+        self.active_list = paged_list
+        return paged_list
+
     def rail_select(self, index):
         self.rail.selected_index = index
         self.on_nav_change(ft.ControlEvent(control=self.rail, target="", name="", data=""))
@@ -382,44 +706,41 @@ class AutoCheckApp:
 
     # --- Tasks ---
     def build_tasks(self):
-        self.tasks_list = ft.ListView(expand=True, spacing=10)
-        self.refresh_tasks_list()
+        self.tasks_list = self._mount_list(PagedList(
+            self, "tasks", self._task_row,
+            search_key=lambda t: f"{t.account_name} {t.location_name}",
+            empty_text=self.t("no_tasks"),
+        ))
 
         self.content_area.controls.extend([
             ft.Row([
                 ft.Text(self.t("tasks"), size=30, weight=ft.FontWeight.BOLD),
-                ft.IconButton(ft.Icons.ADD, on_click=self.open_add_task_dialog, tooltip=self.t("add_task"))
+                ft.Row([
+                    self._import_button("tasks"),
+                    ft.IconButton(ft.Icons.ADD, on_click=self.open_add_task_dialog, tooltip=self.t("add_task"))
+                ])
             ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
             ft.Divider(),
-            self.tasks_list
+            *self.tasks_list.controls()
         ])
         self.page.update()
 
-    def refresh_tasks_list(self):
-        self.tasks_list.controls.clear()
-        tasks = self.config_manager.get("tasks", [])
-
-        if not tasks:
-            self.tasks_list.controls.append(ft.Text(self.t("no_tasks"), italic=True))
-
-        for i, task in enumerate(tasks):
-            is_enabled = task.get("enable", True)
-
-            card = ft.Card(
-                content=ft.ListTile(
-                    leading=ft.Icon(ft.Icons.TASK_ALT if is_enabled else ft.Icons.DO_NOT_DISTURB_ON, color=ft.Colors.GREEN if is_enabled else ft.Colors.GREY),
-                    title=ft.Text(f"{task.get('account_name', '?')} @ {task.get('location_name', '?')}"),
-                    subtitle=ft.Text(self.t("active") if is_enabled else self.t("disabled")),
-                    trailing=ft.PopupMenuButton(
-                        icon=ft.Icons.MORE_VERT,
-                        items=[
-                            ft.PopupMenuItem(text=self.t("enable") if not is_enabled else self.t("disable"), icon=ft.Icons.POWER_SETTINGS_NEW, on_click=lambda e, idx=i: self.toggle_task(idx)),
-                            ft.PopupMenuItem(text=self.t("delete"), icon=ft.Icons.DELETE, on_click=lambda e, idx=i: self.delete_task(idx)),
-                        ]
-                    ),
-                )
+    def _task_row(self, i, task):
+        is_enabled = task.enable
+        return ft.Card(
+            content=ft.ListTile(
+                leading=ft.Icon(ft.Icons.TASK_ALT if is_enabled else ft.Icons.DO_NOT_DISTURB_ON, color=ft.Colors.GREEN if is_enabled else ft.Colors.GREY),
+                title=ft.Text(f"{task.account_name or '?'} @ {task.location_name or '?'}"),
+                subtitle=ft.Text(self.t("active") if is_enabled else self.t("disabled")),
+                trailing=ft.PopupMenuButton(
+                    icon=ft.Icons.MORE_VERT,
+                    items=[
+                        ft.PopupMenuItem(text=self.t("enable") if not is_enabled else self.t("disable"), icon=ft.Icons.POWER_SETTINGS_NEW, on_click=lambda e, idx=i: self.toggle_task(idx)),
+                        ft.PopupMenuItem(text=self.t("delete"), icon=ft.Icons.DELETE, on_click=lambda e, idx=i: self.delete_task(idx)),
+                    ]
+                ),
             )
-            self.tasks_list.controls.append(card)
+        )
 
     def open_add_task_dialog(self, e):
         accs = self.config_manager.get("accounts", [])
@@ -429,8 +750,8 @@ class AutoCheckApp:
             self.show_snack(self.t("acc_loc_missing"), color=ft.Colors.RED)
             return
 
-        acc_options = [ft.dropdown.Option(a.get("name")) for a in accs]
-        loc_options = [ft.dropdown.Option(l.get("name")) for l in locs]
+        acc_options = [ft.dropdown.Option(a.name) for a in accs]
+        loc_options = [ft.dropdown.Option(l.name) for l in locs]
 
         dd_acc = ft.Dropdown(label=self.t("accounts"), options=acc_options, expand=True)
         dd_loc = ft.Dropdown(label=self.t("locations"), options=loc_options, expand=True)
@@ -440,14 +761,11 @@ class AutoCheckApp:
                 self.show_snack(self.t("select_fields"), color=ft.Colors.RED)
                 return
 
-            tasks = self.config_manager.get("tasks", [])
-            tasks.append({
+            self.config_manager.add_item("tasks", {
                 "account_name": dd_acc.value,
                 "location_name": dd_loc.value,
                 "enable": True
             })
-            self.config_manager.save_config({"tasks": tasks})
-            self.refresh_tasks_list()
             dlg.open = False
             self.page.update()
             self.show_snack(self.t("task_added"), color=ft.Colors.GREEN)
@@ -467,18 +785,11 @@ class AutoCheckApp:
     def toggle_task(self, idx):
         tasks = self.config_manager.get("tasks", [])
         if 0 <= idx < len(tasks):
-            tasks[idx]["enable"] = not tasks[idx].get("enable", True)
-            self.config_manager.save_config({"tasks": tasks})
-            self.refresh_tasks_list()
-            self.page.update()
+            self.config_manager.update_item("tasks", idx, {"enable": not tasks[idx].enable})
 
     def delete_task(self, idx):
         def confirm(e):
-            tasks = self.config_manager.get("tasks", [])
-            if 0 <= idx < len(tasks):
-                del tasks[idx]
-                self.config_manager.save_config({"tasks": tasks})
-                self.refresh_tasks_list()
+            if self.config_manager.remove_item("tasks", idx):
                 dlg.open = False
                 self.page.update()
                 self.show_snack(self.t("deleted"))
@@ -497,75 +808,76 @@ class AutoCheckApp:
 
     # --- Accounts ---
     def build_accounts(self):
-        self.accounts_list = ft.ListView(expand=True, spacing=10)
-        self.refresh_accounts_list()
+        if self.remote:
+            # 失效 Cookie 由守护进程记录，每次打开账号页时重新读取
+            self.invalid_cookies = self._load_invalid_cookies()
+        self.accounts_list = self._mount_list(PagedList(
+            self, "accounts", self._account_row,
+            search_key=lambda a: f"{a.name} {a.class_id}",
+            empty_text=self.t("no_accounts"),
+        ))
 
         self.content_area.controls.extend([
             ft.Row([
                 ft.Text(self.t("accounts"), size=30, weight=ft.FontWeight.BOLD),
                 ft.Row([
                     ft.TextButton(self.t("how_to_cookie"), icon=ft.Icons.HELP_OUTLINE, on_click=lambda _: self.show_cookie_help()),
+                    self._import_button("accounts"),
                     ft.IconButton(ft.Icons.ADD, on_click=lambda _: self.open_account_dialog(-1), tooltip=self.t("add_account"))
                 ])
             ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
             ft.Divider(),
-            self.accounts_list
+            *self.accounts_list.controls()
         ])
         self.page.update()
 
-    def refresh_accounts_list(self):
-        self.accounts_list.controls.clear()
-        accounts = self.config_manager.get("accounts", [])
-
-        if not accounts:
-            self.accounts_list.controls.append(ft.Text(self.t("no_accounts"), italic=True))
-
-        for i, acc in enumerate(accounts):
-            card = ft.Card(
-                content=ft.ListTile(
-                    leading=ft.Icon(ft.Icons.ACCOUNT_CIRCLE, size=30),
-                    title=ft.Text(acc.get("name", "Unnamed")),
-                    subtitle=ft.Text(f"{self.t('class_id')}: {acc.get('class_id', '?')}"),
-                    trailing=ft.PopupMenuButton(
-                        icon=ft.Icons.MORE_VERT,
-                        items=[
-                            ft.PopupMenuItem(text=self.t("edit"), icon=ft.Icons.EDIT, on_click=lambda e, idx=i: self.open_account_dialog(idx)),
-                            ft.PopupMenuItem(text=self.t("delete"), icon=ft.Icons.DELETE, on_click=lambda e, idx=i: self.delete_account(idx)),
-                        ]
-                    ),
-                )
+    def _account_row(self, i, acc):
+        needs_relogin = self.invalid_cookies.contains(acc.cookie)
+        subtitle = f"{self.t('class_id')}: {acc.class_id or '?'}"
+        if needs_relogin:
+            subtitle += f" · ⚠️ {self.t('needs_relogin')}"
+        return ft.Card(
+            content=ft.ListTile(
+                leading=ft.Icon(ft.Icons.ACCOUNT_CIRCLE, size=30, color=ft.Colors.ORANGE if needs_relogin else None),
+                title=ft.Text(acc.name or "Unnamed"),
+                subtitle=ft.Text(subtitle),
+                trailing=ft.PopupMenuButton(
+                    icon=ft.Icons.MORE_VERT,
+                    items=[
+                        ft.PopupMenuItem(text=self.t("edit"), icon=ft.Icons.EDIT, on_click=lambda e, idx=i: self.open_account_dialog(idx)),
+                        ft.PopupMenuItem(text=self.t("delete"), icon=ft.Icons.DELETE, on_click=lambda e, idx=i: self.delete_account(idx)),
+                    ]
+                ),
             )
-            self.accounts_list.controls.append(card)
+        )
 
     def open_account_dialog(self, idx):
         accounts = self.config_manager.get("accounts", [])
         is_edit = idx >= 0
-        data = accounts[idx] if is_edit else {}
+        data = accounts[idx] if is_edit else Account.from_dict({})
 
-        tf_name = ft.TextField(label=self.t("name"), value=data.get("name", ""))
-        tf_class = ft.TextField(label=self.t("class_id"), value=data.get("class_id", ""))
-        tf_cookie = ft.TextField(label=self.t("cookie"), value=data.get("cookie", ""), multiline=True, min_lines=3, max_lines=5)
-        tf_pwd = ft.TextField(label=self.t("password"), value=data.get("pwd", ""), password=True, can_reveal_password=True)
+        tf_name = ft.TextField(label=self.t("name"), value=data.name)
+        tf_class = ft.TextField(label=self.t("class_id"), value=data.class_id, helper_text=self.t("class_id_hint"))
+        tf_cookie = ft.TextField(label=self.t("cookie"), value=data.cookie, multiline=True, min_lines=3, max_lines=5)
+        tf_pwd = ft.TextField(label=self.t("password"), value=data.pwd, password=True, can_reveal_password=True)
 
         def save(e):
             if not tf_name.value or not tf_class.value or not tf_cookie.value:
                 self.show_snack(self.t("missing_fields"), color=ft.Colors.RED)
                 return
 
-            new_acc = {
-                "name": tf_name.value.strip(),
-                "class_id": tf_class.value.strip(),
-                "cookie": tf_cookie.value.strip(),
-                "pwd": tf_pwd.value.strip()
-            }
+            new_acc = data._replace(
+                name=tf_name.value.strip(),
+                class_id=tf_class.value.strip(),
+                cookie=tf_cookie.value.strip(),
+                pwd=tf_pwd.value.strip()
+            )
 
             if is_edit:
-                accounts[idx] = new_acc
+                self.config_manager.update_item("accounts", idx, new_acc.to_dict())
             else:
-                accounts.append(new_acc)
+                self.config_manager.add_item("accounts", new_acc)
 
-            self.config_manager.save_config({"accounts": accounts})
-            self.refresh_accounts_list()
             dlg.open = False
             self.page.update()
             self.show_snack(self.t("saved"), color=ft.Colors.GREEN)
@@ -585,11 +897,7 @@ class AutoCheckApp:
 
     def delete_account(self, idx):
         def confirm(e):
-            accounts = self.config_manager.get("accounts", [])
-            if 0 <= idx < len(accounts):
-                del accounts[idx]
-                self.config_manager.save_config({"accounts": accounts})
-                self.refresh_accounts_list()
+            if self.config_manager.remove_item("accounts", idx):
                 dlg.open = False
                 self.page.update()
                 self.show_snack(self.t("deleted"))
@@ -623,52 +931,50 @@ class AutoCheckApp:
 
     # --- Locations ---
     def build_locations(self):
-        self.locations_list = ft.ListView(expand=True, spacing=10)
-        self.refresh_locations_list()
+        self.locations_list = self._mount_list(PagedList(
+            self, "locations", self._location_row,
+            search_key=lambda l: l.name,
+            empty_text=self.t("no_locations"),
+        ))
 
         self.content_area.controls.extend([
             ft.Row([
                 ft.Text(self.t("locations"), size=30, weight=ft.FontWeight.BOLD),
-                ft.IconButton(ft.Icons.ADD, on_click=lambda _: self.open_location_dialog(-1), tooltip=self.t("add_location"))
+                ft.Row([
+                    self._import_button("locations"),
+                    ft.IconButton(ft.Icons.ADD, on_click=lambda _: self.open_location_dialog(-1), tooltip=self.t("add_location"))
+                ])
             ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
             ft.Divider(),
-            self.locations_list
+            *self.locations_list.controls()
         ])
         self.page.update()
 
-    def refresh_locations_list(self):
-        self.locations_list.controls.clear()
-        locations = self.config_manager.get("locations", [])
-
-        if not locations:
-            self.locations_list.controls.append(ft.Text(self.t("no_locations"), italic=True))
-
-        for i, loc in enumerate(locations):
-            card = ft.Card(
-                content=ft.ListTile(
-                    leading=ft.Icon(ft.Icons.MAP, size=30),
-                    title=ft.Text(loc.get("name", "Unnamed")),
-                    subtitle=ft.Text(f"Lat: {loc.get('lat')}, Lng: {loc.get('lng')}"),
-                    trailing=ft.PopupMenuButton(
-                        icon=ft.Icons.MORE_VERT,
-                        items=[
-                            ft.PopupMenuItem(text=self.t("edit"), icon=ft.Icons.EDIT, on_click=lambda e, idx=i: self.open_location_dialog(idx)),
-                            ft.PopupMenuItem(text=self.t("delete"), icon=ft.Icons.DELETE, on_click=lambda e, idx=i: self.delete_location(idx)),
-                        ]
-                    ),
-                )
+    def _location_row(self, i, loc):
+        return ft.Card(
+            content=ft.ListTile(
+                leading=ft.Icon(ft.Icons.MAP, size=30),
+                title=ft.Text(loc.name or "Unnamed"),
+                subtitle=ft.Text(f"Lat: {loc.lat}, Lng: {loc.lng}"),
+                trailing=ft.PopupMenuButton(
+                    icon=ft.Icons.MORE_VERT,
+                    items=[
+                        ft.PopupMenuItem(text=self.t("edit"), icon=ft.Icons.EDIT, on_click=lambda e, idx=i: self.open_location_dialog(idx)),
+                        ft.PopupMenuItem(text=self.t("delete"), icon=ft.Icons.DELETE, on_click=lambda e, idx=i: self.delete_location(idx)),
+                    ]
+                ),
             )
-            self.locations_list.controls.append(card)
+        )
 
     def open_location_dialog(self, idx):
         locations = self.config_manager.get("locations", [])
         is_edit = idx >= 0
-        data = locations[idx] if is_edit else {}
+        data = locations[idx] if is_edit else Location("", "", "", "0.0")
 
-        tf_name = ft.TextField(label=self.t("name"), value=data.get("name", ""))
-        tf_lat = ft.TextField(label=self.t("latitude"), value=data.get("lat", ""))
-        tf_lng = ft.TextField(label=self.t("longitude"), value=data.get("lng", ""))
-        tf_acc = ft.TextField(label=self.t("accuracy"), value=data.get("acc", "0.0"))
+        tf_name = ft.TextField(label=self.t("name"), value=data.name)
+        tf_lat = ft.TextField(label=self.t("latitude"), value=data.lat)
+        tf_lng = ft.TextField(label=self.t("longitude"), value=data.lng)
+        tf_acc = ft.TextField(label=self.t("accuracy"), value=data.acc)
 
         def save(e):
             try:
@@ -678,20 +984,18 @@ class AutoCheckApp:
                 self.show_snack(self.t("lat_lng_error"), color=ft.Colors.RED)
                 return
 
-            new_loc = {
-                "name": tf_name.value,
-                "lat": tf_lat.value,
-                "lng": tf_lng.value,
-                "acc": tf_acc.value
-            }
+            new_loc = data._replace(
+                name=tf_name.value,
+                lat=tf_lat.value,
+                lng=tf_lng.value,
+                acc=tf_acc.value
+            )
 
             if is_edit:
-                locations[idx] = new_loc
+                self.config_manager.update_item("locations", idx, new_loc.to_dict())
             else:
-                locations.append(new_loc)
+                self.config_manager.add_item("locations", new_loc)
 
-            self.config_manager.save_config({"locations": locations})
-            self.refresh_locations_list()
             dlg.open = False
             self.page.update()
             self.show_snack(self.t("saved"), color=ft.Colors.GREEN)
@@ -710,11 +1014,7 @@ class AutoCheckApp:
 
     def delete_location(self, idx):
         def confirm(e):
-            locations = self.config_manager.get("locations", [])
-            if 0 <= idx < len(locations):
-                del locations[idx]
-                self.config_manager.save_config({"locations": locations})
-                self.refresh_locations_list()
+            if self.config_manager.remove_item("locations", idx):
                 dlg.open = False
                 self.page.update()
                 self.show_snack(self.t("deleted"))
@@ -885,6 +1185,48 @@ class AutoCheckApp:
         ])
         self.page.update()
 
+    # --- Bulk Import ---
+    def _import_button(self, section):
+        return ft.IconButton(ft.Icons.UPLOAD_FILE, on_click=lambda _: self.open_import(section), tooltip=self.t("import"))
+
+    def open_import(self, section):
+        self._import_section = section
+        self.import_picker.pick_files(allowed_extensions=["csv", "jsonl", "ndjson"])
+
+    def _on_import_picked(self, e):
+        if not e.files:
+            return
+        path = e.files[0].path
+        section = self._import_section
+        # 大文件的解析与校验放到后台线程，完成后一次写盘
+        threading.Thread(target=self._import_thread, args=(path, section), daemon=True).start()
+
+    def _import_thread(self, path, section):
+        try:
+            report = self.config_manager.bulk_import(path, section=section)
+        except Exception as e:
+            self.show_snack(self.t("import_failed").format(error=e), color=ft.Colors.RED)
+            return
+
+        self.show_snack(self.t("import_done").format(**report["added"]),
+                        color=ft.Colors.ORANGE if report["errors"] else ft.Colors.GREEN)
+        if report["errors"]:
+            self.show_import_errors(report["errors"])
+
+    def show_import_errors(self, errors, limit=200):
+        lines = [ft.Text(self.t("import_line").format(line=line, error=error), selectable=True)
+                 for line, error in errors[:limit]]
+        if len(errors) > limit:
+            lines.append(ft.Text(self.t("import_more").format(count=len(errors) - limit), italic=True))
+        dlg = ft.AlertDialog(
+            title=ft.Text(self.t("import_errors").format(count=len(errors))),
+            content=ft.Container(content=ft.ListView(lines, spacing=4), width=600, height=400),
+            actions=[ft.TextButton("Close", on_click=lambda e: setattr(dlg, 'open', False) or self.page.update())]
+        )
+        self.page.dialog = dlg
+        dlg.open = True
+        self.page.update()
+
     # --- Actions & Helpers ---
     def show_snack(self, msg, color=ft.Colors.ON_SURFACE):
         self.page.snack_bar = ft.SnackBar(ft.Text(msg), bgcolor=color)
@@ -893,13 +1235,25 @@ class AutoCheckApp:
 
     def run_manual_checkin(self, e):
         self.show_snack(self.t("manual_started"), color=ft.Colors.BLUE)
-        threading.Thread(target=self._run_checkin_thread, daemon=True).start()
+        target = self._run_remote_thread if self.remote else self._run_checkin_thread
+        threading.Thread(target=target, daemon=True).start()
+
+    def _run_remote_thread(self):
+        try:
+            outcome = self.remote.run(source="gui")
+            if outcome in ("merged", "queued"):
+                self.show_snack(self.t(f"run_{outcome}"), color=ft.Colors.ORANGE)
+        except OSError as e:
+            self.show_snack(self.t("daemon_lost").format(error=e), color=ft.Colors.RED)
 
     def _run_checkin_thread(self):
         self.log_callback(f"[{datetime.now().strftime('%H:%M:%S')}] Manual run started...")
         try:
-            self.checkin_manager.run_job()
-            self.log_callback(f"[{datetime.now().strftime('%H:%M:%S')}] Manual run completed.")
+            outcome = self.checkin_manager.run_job(source="manual")
+            if outcome == "completed":
+                self.log_callback(f"[{datetime.now().strftime('%H:%M:%S')}] Manual run completed.")
+            else:
+                self.show_snack(self.t(f"run_{outcome}"), color=ft.Colors.ORANGE)
         except Exception as e:
             err_msg = f"Error: {e}"
             self.log_callback(err_msg)
@@ -907,15 +1261,29 @@ class AutoCheckApp:
 
     # --- Scheduler ---
     def start_scheduler(self):
+        if self.remote:
+            self.config_manager.subscribe(self._on_config_saved)
+            threading.Thread(target=self._remote_loop, daemon=True).start()
+            return
         self.update_scheduler_job()
+        self.config_manager.subscribe(self._on_schedule_change)
         threading.Thread(target=self._scheduler_loop, daemon=True).start()
 
+    def _on_schedule_change(self, section, action, index):
+        # 定时设置被修改 (如热加载了外部编辑的 config.json) 时重建定时任务
+        if section in ("scheduletime", "warmup_seconds"):
+            self.update_scheduler_job()
+
     def update_scheduler_job(self):
+        import schedule
         schedule.clear()
         time_str = self.config_manager.get("scheduletime", "08:00")
         try:
             datetime.strptime(time_str, "%H:%M")
             schedule.every().day.at(time_str).do(self._scheduled_job)
+            warmup = int(self.config_manager.get("warmup_seconds", 20) or 0)
+            if warmup > 0:
+                schedule.every().day.at(shift_time_str(time_str, -warmup)).do(self._scheduled_warm_up)
             if hasattr(self, 'lbl_schedule_info'):
                 self.lbl_schedule_info.value = f"Scheduled daily at {time_str}"
                 self.page.update()
@@ -927,19 +1295,89 @@ class AutoCheckApp:
     def _scheduled_job(self):
         threading.Thread(target=self._run_job_thread, daemon=True).start()
 
+    def _scheduled_warm_up(self):
+        threading.Thread(target=self.checkin_manager.warm_up, daemon=True).start()
+
     def _run_job_thread(self):
         self.log_callback(f"[{datetime.now().strftime('%H:%M:%S')}] Starting scheduled check-in...")
         try:
-            self.checkin_manager.run_job()
-            self.log_callback(f"[{datetime.now().strftime('%H:%M:%S')}] Scheduled check-in finished.")
+            if self.checkin_manager.run_job(source="schedule") == "completed":
+                self.log_callback(f"[{datetime.now().strftime('%H:%M:%S')}] Scheduled check-in finished.")
         except Exception as e:
             self.log_callback(f"Error during scheduled job: {e}")
             logger.error(traceback.format_exc())
 
     def _scheduler_loop(self):
+        import schedule
+        last_reload_check = time.monotonic()
         while True:
+            if time.monotonic() - last_reload_check >= self.CONFIG_RELOAD_INTERVAL:
+                last_reload_check = time.monotonic()
+                self.config_manager.check_reload()
             schedule.run_pending()
             self._update_countdown()
+            self._flush_progress()
+            time.sleep(1)
+
+    # --- Daemon (thin client) ---
+    def _attach_daemon(self):
+        """Return a ControlClient if a daemon answers on the configured control port, else None."""
+        client = ControlClient.from_config(self.config_manager, timeout=1)
+        try:
+            client.status()
+        except (OSError, ValueError):
+            return None
+        client.timeout = 3
+        return client
+
+    def _load_invalid_cookies(self):
+        """Read the daemon's invalid-cookie cache (stored next to config.json)."""
+        return InvalidCookieCache(
+            data_path(self.config_manager, "invalid_cookies.json"),
+            ttl_hours=self.config_manager.get("invalid_cookie_ttl_hours", 24)
+        )
+
+    def _on_config_saved(self, section, action, index):
+        # 一次保存可能产生多个变更事件 (如批量导入)，合并为 _remote_loop 中的一次重新加载
+        self._reload_pending = True
+
+    def _remote_reload(self):
+        """Ask the daemon to load the saved config now instead of at its next poll."""
+        self._reload_pending = False
+        try:
+            self.remote.reload()
+        except OSError as e:
+            logger.warning(f"通知守护进程重新加载配置失败: {e}")
+
+    def _remote_loop(self):
+        """Mirror the daemon's run state, progress and log lines into the UI."""
+        self.log_callback(self.t("daemon_attached").format(url=self.remote.url))
+        log_seq = 0
+        connected = True
+        while True:
+            if self._reload_pending:
+                self._remote_reload()
+            try:
+                status = self.remote.status()
+                logs = self.remote.logs(after=log_seq)
+                if not connected:
+                    connected = True
+                    self.log_callback(self.t("daemon_back"))
+                if logs["seq"] < log_seq:
+                    # 守护进程已重启，序号从头开始
+                    logs = self.remote.logs(after=0)
+                log_seq = logs["seq"]
+                for _, line in logs["lines"]:
+                    self.log_callback(line)
+                self._remote_status = status
+                self.on_run_state(status["run"])
+                self.on_progress(status["progress"])
+            except (OSError, ValueError, KeyError) as e:
+                if connected:
+                    connected = False
+                    self.log_callback(self.t("daemon_lost").format(error=e))
+            self._update_countdown()
+            self._flush_progress()
             time.sleep(1)
 
     def _update_countdown(self):
@@ -1,5 +1,9 @@
-from core import ConfigManager, CheckInManager, setup_logger
-import schedule
+from core import (ConfigManager, CheckInManager, setup_logger, parse_shard_spec, shift_time_str,
+                  WorkQueue, SQLiteQueueBackend, ControlServer, ControlClient, ClassWatcher, RunHistory)
+import argparse
+import json
+import multiprocessing
+import threading
 import time
 import os
 
@@ -10,7 +14,151 @@ This module provides a command-line interface for running the check-in process.
 It handles initial configuration for new users and executes the scheduled or manual check-in tasks.
 """
 
-def main():
+def parse_args(argv=None):
+    """
+    Parse command-line arguments.
+
+    Args:
+        argv (list, optional): Argument list; defaults to sys.argv[1:].
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="AutoCheckBJMF 命令行签到")
+    parser.add_argument(
+        "--shard",
+        default=None,
+        help="静态分片 INDEX/TOTAL (例如 3/8)，只执行按账号哈希落在该分片的任务。"
+             "也可通过环境变量 SHARD 或 SHARD_INDEX + SHARD_TOTAL 设置"
+    )
+    parser.add_argument(
+        "--queue",
+        default=os.environ.get("QUEUE_PATH"),
+        metavar="PATH",
+        help="动态队列模式: 多个节点通过同一个 SQLite 文件按账号领取任务 (租约 + 心跳)。环境变量 QUEUE_PATH"
+    )
+    parser.add_argument("--lease", type=float, default=60.0, help="队列租约时长 (秒)，默认 60")
+    parser.add_argument("--run-key", default=None, help="队列运行标识，所有节点需一致；默认按日期和定时时间生成")
+    parser.add_argument(
+        "--stats",
+        type=float,
+        nargs="?",
+        const=30.0,
+        default=None,
+        metavar="DAYS",
+        help="输出最近 DAYS 天 (默认 30) 的运行历史统计 (各账号成功率、p95 延迟、每日失败数) 后退出"
+    )
+    parser.add_argument(
+        "--export",
+        choices=("csv", "jsonl", "parquet"),
+        default=None,
+        help="流式导出运行历史后退出 (parquet 需要 pyarrow)"
+    )
+    parser.add_argument("--output", default="-", metavar="PATH", help="导出文件路径，默认 - (标准输出)")
+    parser.add_argument("--since", default=None, metavar="YYYY-MM-DD", help="导出起始日期 (含)")
+    parser.add_argument("--until", default=None, metavar="YYYY-MM-DD", help="导出结束日期 (含)")
+    parser.add_argument("--account", default=None, help="只导出该账号的记录")
+    parser.add_argument(
+        "--import",
+        dest="import_path",
+        default=None,
+        metavar="PATH",
+        help="从 CSV/JSONL 批量导入账号/地点/任务后退出 (每行 type 列为 account/location/task)"
+    )
+    parser.add_argument(
+        "--section",
+        choices=("accounts", "locations", "tasks"),
+        default=None,
+        help="导入文件没有 type 列时，所有行的类型"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="导入时只校验，不写入配置")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="守护进程模式: 常驻运行定时任务，并在本机开放控制接口 (触发运行、状态/进度、重新加载配置、指标)"
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="监视模式: 按自适应间隔轮询各班级签到页，发现新签到立即签到 (可与定时/守护模式同时使用)"
+    )
+    parser.add_argument("--port", type=int, default=None, help="控制接口端口，默认取配置 control_port (8765)")
+    parser.add_argument(
+        "--ctl",
+        choices=("status", "run", "reload", "metrics", "logs"),
+        default=None,
+        help="向正在运行的守护进程发送命令，以 JSON 输出结果后退出"
+    )
+    return parser.parse_args(argv)
+
+def print_history_stats(history, days):
+    """
+    Print per-account statistics and failures by day from the run history.
+
+    Args:
+        history (RunHistory): The run history store.
+        days (float): Size of the window in days.
+    """
+    stats = history.account_stats(days)
+    print(f"----------最近 {days:g} 天运行统计----------")
+    if not stats:
+        print("暂无运行记录")
+        return
+
+    print(f"{'账号':<20}{'请求':>8}{'签到':>8}{'成功率':>10}{'平均(ms)':>10}{'p95(ms)':>10}")
+    for row in stats:
+        rate = f"{row['success_rate']:.0%}" if row["success_rate"] is not None else "-"
+        avg = f"{row['avg_ms']:.0f}" if row["avg_ms"] is not None else "-"
+        p95 = f"{row['p95_ms']:.0f}" if row["p95_ms"] is not None else "-"
+        print(f"{row['account']:<20}{row['requests']:>8}{row['signs']:>8}{rate:>10}{avg:>10}{p95:>10}")
+
+    print("----------每日失败----------")
+    for day, failures, total in history.failures_by_day(days):
+        print(f"{day}  失败 {failures}/{total}")
+
+def resolve_shard(cli_value):
+    """
+    Determine the shard spec from the CLI flag or environment variables.
+
+    Precedence: --shard, then SHARD, then SHARD_INDEX/SHARD_TOTAL.
+
+    Args:
+        cli_value (str): The --shard value, or None.
+
+    Returns:
+        tuple: (index, total), or None when sharding is not configured.
+    """
+    spec = cli_value or os.environ.get("SHARD")
+    if not spec and os.environ.get("SHARD_INDEX") and os.environ.get("SHARD_TOTAL"):
+        spec = f"{os.environ['SHARD_INDEX']}/{os.environ['SHARD_TOTAL']}"
+    return parse_shard_spec(spec)
+
+def schedule_jobs(schedule, manager, config):
+    """
+    (Re)create the daily check-in and warm-up jobs from the current config.
+
+    Args:
+        schedule: The schedule module.
+        manager (CheckInManager): The manager running the jobs.
+        config (ConfigManager): The configuration manager.
+    """
+    schedule.clear()
+    scheduletime = config.get("scheduletime")
+    if not scheduletime:
+        print("定时签到时间已清空，暂停定时任务")
+        return
+    try:
+        schedule.every().day.at(scheduletime).do(manager.run_job, source="schedule").tag("checkin")
+    except schedule.ScheduleValueError:
+        print(f"定时签到时间格式错误: {scheduletime}")
+        return
+    # 提前预热连接，使触发时刻的首批请求直接复用已建立的连接
+    warmup = int(config.get("warmup_seconds", 20) or 0)
+    if warmup > 0:
+        schedule.every().day.at(shift_time_str(scheduletime, -warmup)).do(manager.warm_up)
+
+
+def main(argv=None):
     """
     Main entry point for the CLI application.
 
@@ -18,7 +166,41 @@ def main():
     it prompts the user for initial setup (single account, single location).
     Then it initializes the CheckInManager and either runs a one-time check-in
     or starts the scheduler based on the configuration.
+
+    Args:
+        argv (list, optional): Command-line arguments; defaults to sys.argv[1:].
     """
+    args = parse_args(argv)
+    try:
+        shard = resolve_shard(args.shard)
+    except ValueError as e:
+        raise SystemExit(f"参数错误: {e}")
+
+    if args.export:
+        # 导出内容可能写到标准输出，因此不打印任何提示信息
+        try:
+            history = RunHistory.from_config(ConfigManager(read_only=True), read_only=True)
+            count = history.export(args.output, args.export, since=args.since, until=args.until,
+                                   account=args.account)
+        except (ValueError, RuntimeError, OSError) as e:
+            raise SystemExit(f"导出失败: {e}")
+        if args.output != "-":
+            print(f"已导出 {count} 条记录到 {args.output}")
+        return
+
+    if args.ctl:
+        config = ConfigManager(read_only=True)
+        client = ControlClient.from_config(config)
+        if args.port:
+            client = ControlClient(f"http://{config.get('control_host', '127.0.0.1')}:{args.port}",
+                                   token=config.get("control_token"))
+        try:
+            result = getattr(client, args.ctl)()
+        except OSError as e:
+            raise SystemExit(f"无法连接守护进程 ({client.url}): {e}")
+        print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+        return
+
     print("----------提醒----------")
     print("项目地址：https://github.com/JasonYANG170/AutoCheckBJMF")
     print("请查看教程以获取Cookie和班级ID")
@@ -26,6 +208,29 @@ def main():
     config = ConfigManager()
     print("config.json文件位置：", config.config_path)
 
+    if args.stats is not None:
+        # 只读打开运行历史, 不初始化签到引擎
+        try:
+            history = RunHistory.from_config(config, read_only=True)
+        except FileNotFoundError:
+            print("暂无运行历史")
+            return
+        print_history_stats(history, args.stats)
+        return
+
+    if args.import_path:
+        try:
+            report = config.bulk_import(args.import_path, section=args.section, dry_run=args.dry_run)
+        except OSError as e:
+            raise SystemExit(f"导入失败: {e}")
+        for line_no, error in report["errors"]:
+            print(f"第 {line_no} 行: {error}")
+        added = report["added"]
+        prefix = "校验通过 (未写入)" if args.dry_run else "已导入"
+        print(f"{prefix}: 账号 {added['accounts']}，地点 {added['locations']}，任务 {added['tasks']}；"
+              f"错误 {len(report['errors'])} 行")
+        return
+
     # CLI setup if not locked and no tasks configured
     if not config.get("configLock") and not config.get("tasks"):
         print("----------首次运行配置初始化----------")
@@ -98,6 +303,8 @@ def main():
     print(f"账号数量: {len(config.get('accounts', []))}")
     print(f"地点数量: {len(config.get('locations', []))}")
     print(f"任务数量: {len(config.get('tasks', []))}")
+    if shard:
+        print(f"分片: {shard[0]}/{shard[1]}")
     wecom = config.get("wecom", {})
     if wecom.get("corpid"):
         print("通知方式: 企业微信 (已配置)")
@@ -106,19 +313,61 @@ def main():
     print("---------------------")
 
     setup_logger(config.get("debug"))
-    manager = CheckInManager(config)
+    work_queue = None
+    if args.queue:
+        work_queue = WorkQueue(SQLiteQueueBackend(args.queue), lease_seconds=args.lease)
+        print(f"队列模式: {args.queue} (节点 {work_queue.worker_id})")
+
+    manager = CheckInManager(config, shard=shard, work_queue=work_queue)
+    manager.queue_run_key = args.run_key
+
+    watcher = None
+    if args.watch:
+        watcher = ClassWatcher.from_config(manager)
+        manager.watcher = watcher
+        print(f"监视模式: 间隔 {watcher.min_interval:.0f}s 起，每小时最多 {watcher.requests_per_hour:.0f} 次请求")
 
     scheduletime = config.get("scheduletime")
-    if scheduletime:
-        print("☆等待设定时间 " + scheduletime + " 到达☆")
-        schedule.every().day.at(scheduletime).do(manager.run_job)
+    if scheduletime or args.daemon:
+        # 仅定时/守护模式需要 schedule，一次性运行 (如 CI) 不必加载
+        import schedule
+        if args.daemon:
+            server = ControlServer(
+                manager,
+                host=config.get("control_host", "127.0.0.1"),
+                port=args.port or config.get("control_port", 8765),
+                token=config.get("control_token"),
+                next_run=lambda: min((job.next_run for job in schedule.get_jobs("checkin")), default=None)
+            )
+            manager.log_callback = server.append_log
+            try:
+                port = server.start()
+            except OSError as e:
+                raise SystemExit(f"控制接口启动失败: {e}")
+            print(f"守护进程模式: 控制接口 http://{server.host}:{port}")
+        if scheduletime:
+            print("☆等待设定时间 " + scheduletime + " 到达☆")
+            schedule_jobs(schedule, manager, config)
+
+        def on_schedule_change(section, action, index):
+            # 热加载修改了定时设置时重建定时任务
+            if section in ("scheduletime", "warmup_seconds"):
+                schedule_jobs(schedule, manager, config)
 
+        config.subscribe(on_schedule_change)
+        if watcher:
+            threading.Thread(target=watcher.run, daemon=True).start()
         while True:
+            config.check_reload()
             schedule.run_pending()
             time.sleep(10)
+    elif watcher:
+        watcher.run()
     else:
-        manager.run_job()
+        manager.run_job(source="cli")
         input("手动签到已结束，敲击回车关闭窗口☆~")
 
 if __name__ == "__main__":
+    # 多进程模式 (workers > 1) 在 PyInstaller 打包后的 Windows 程序中需要
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+import core
+
+
+class FakeServer:
+    """
+    Stand-in for the BJMF site shared by every stubbed client of a test.
+
+    cards maps a class ID to its pending PunchCards; a successful sign removes
+    the card, like the real punch page does. Sign IDs in failing are rejected,
+    and while unreachable is set every request fails to connect.
+    """
+    def __init__(self):
+        self.cards = {}
+        self.fetches = []
+        self.signs = []
+        self.failing = set()
+        self.unreachable = False
+
+    def add_card(self, class_id, card_id, **kwargs):
+        self.cards.setdefault(class_id, []).append(core.PunchCard(card_id, class_id=class_id, **kwargs))
+
+
+class FakeClient:
+    """BJMFClient replacement that talks to a FakeServer instead of the network."""
+    SERVER = core.BJMFClient.SERVER
+    server = None
+
+    def __init__(self, cookie, class_id, pool_maxsize=None, limiter=None, breaker=None, page_cache=None):
+        self.cookie = cookie
+        self.class_ids = core.Account.split_class_ids(class_id)
+        self.class_id = self.class_ids[0] if self.class_ids else ""
+        self.breaker = breaker
+        self.closed = False
+        self.warmed = False
+
+    def _check_breaker(self):
+        if self.breaker is not None:
+            self.breaker.before_request(timeout=0)
+        if self.server.unreachable:
+            # 与 BJMFClient 相同: 连接失败计入熔断器并以 CircuitOpen 抛出
+            if self.breaker is not None:
+                self.breaker.record(False)
+            raise core.CircuitOpen("连接失败")
+
+    def fetch_tasks(self, deadline=None, class_id=None):
+        self._check_breaker()
+        class_id = class_id or self.class_id
+        self.server.fetches.append((self.cookie, class_id))
+        return list(self.server.cards.get(class_id, []))
+
+    def fetch_all(self, deadline=None):
+        return [card for cid in self.class_ids for card in self.fetch_tasks(deadline, cid)]
+
+    def execute_sign(self, sign_id, lat, lng, acc, pwd="", deadline=None, class_id=None):
+        self._check_breaker()
+        class_id = class_id or self.class_id
+        self.server.signs.append((self.cookie, class_id, sign_id))
+        if sign_id in self.server.failing:
+            return core.SignResult(sign_id, core.SignStatus.FAILED, "签到失败")
+        cards = self.server.cards.get(class_id, [])
+        self.server.cards[class_id] = [c for c in cards if c.id != sign_id]
+        return core.SignResult(sign_id, core.SignStatus.SUCCESS, "签到成功")
+
+    def warm_up(self, timeout=5):
+        self.warmed = True
+        return True
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def server(monkeypatch):
+    fake = FakeServer()
+    client_cls = type("BoundFakeClient", (FakeClient,), {"server": fake})
+    monkeypatch.setattr(core, "BJMFClient", client_cls)
+    return fake
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    """A config.json with two accounts, one location and a task per account."""
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({
+        "accounts": [
+            {"name": "alice", "cookie": "cookie-a", "class_id": "101", "pwd": ""},
+            {"name": "bob", "cookie": "cookie-b", "class_id": "202", "pwd": ""},
+        ],
+        "locations": [{"name": "campus", "lat": "30.0", "lng": "120.0", "acc": "10"}],
+        "tasks": [
+            {"account_name": "alice", "location_name": "campus", "enable": True},
+            {"account_name": "bob", "location_name": "campus", "enable": True},
+        ],
+        "max_concurrency": 1,
+    }), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def make_manager(config_path, server):
+    def make(**kwargs):
+        return core.CheckInManager(core.ConfigManager(config_path), **kwargs)
+    return make
@@ -0,0 +1,57 @@
+import json
+
+import core
+
+
+def _rewrite(path, change):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    change(data)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def test_check_reload_emits_only_the_differences(config_path):
+    config = core.ConfigManager(config_path)
+    events = []
+    config.subscribe(lambda section, action, index: events.append((section, action, index)))
+
+    def change(data):
+        data["accounts"][1]["cookie"] = "cookie-b2"
+        data["locations"].append({"name": "library", "lat": "31", "lng": "121", "acc": "5"})
+        data["scheduletime"] = "07:30"
+    _rewrite(config_path, change)
+
+    diff = config.check_reload()
+
+    assert diff["accounts"] == {"added": [], "removed": [], "changed": ["bob"]}
+    assert diff["locations"]["added"] == ["library"]
+    assert diff["settings"] == ["scheduletime"]
+    assert ("accounts", "update", 1) in events
+    assert ("accounts", "replace", None) not in events
+    assert ("locations", "replace", None) in events
+    assert ("scheduletime", "replace", None) in events
+    assert config.get("accounts")[1].cookie == "cookie-b2"
+    # 未再修改时不重复加载
+    assert config.check_reload() is None
+
+
+def test_check_reload_keeps_state_of_an_unparsable_file(config_path):
+    config = core.ConfigManager(config_path)
+    with open(config_path, "a", encoding="utf-8") as f:
+        f.write("{")
+    assert config.check_reload() is None
+    assert [a.name for a in config.get("accounts")] == ["alice", "bob"]
+
+
+def test_string_enable_flags_and_unknown_keys_survive_a_save(config_path):
+    def change(data):
+        data["tasks"][0]["enable"] = "false"
+        data["tasks"][0]["note"] = "manual"
+    _rewrite(config_path, change)
+
+    config = core.ConfigManager(config_path)
+
+    assert config.get("tasks")[0].enable is False
+    with open(config_path, encoding="utf-8") as f:
+        assert json.load(f)["tasks"][0]["note"] == "manual"
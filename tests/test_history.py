@@ -0,0 +1,28 @@
+import io
+import os
+
+import pytest
+
+import core
+
+
+def test_read_only_history_does_not_create_the_database(config_path):
+    config = core.ConfigManager(config_path)
+    with pytest.raises(FileNotFoundError):
+        core.RunHistory.from_config(config, read_only=True)
+    assert not os.path.exists(core.data_path(config, "run_history.db"))
+
+
+def test_read_only_history_reads_what_a_run_recorded(make_manager, server):
+    server.add_card("101", "a1")
+    manager = make_manager()
+    manager.run_job(source="schedule")
+    path = manager.history.path
+    before = os.stat(path).st_mtime_ns
+
+    history = core.RunHistory.from_config(manager.cfg, read_only=True)
+    assert history.path == path
+    assert {row["account"] for row in history.account_stats(days=1)} == {"alice", "bob"}
+    out = io.StringIO()
+    assert history.export(out, "jsonl") == 3
+    assert os.stat(path).st_mtime_ns == before
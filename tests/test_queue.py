@@ -0,0 +1,78 @@
+
+import core
+
+
+def _queue(**kwargs):
+    kwargs.setdefault("poll_interval", 0.01)
+    return core.WorkQueue(core.MemoryQueueBackend(), worker_id="node-a", **kwargs)
+
+
+def test_expired_lease_is_reclaimed_by_another_worker():
+    backend = core.MemoryQueueBackend()
+    crashed = core.WorkQueue(backend, worker_id="crashed", lease_seconds=0.05)
+    backend.seed("run@0#0", ["alice"])
+    assert backend.claim("run@0#0", crashed.worker_id, 0.05, 3) == "alice"
+
+    survivor = core.WorkQueue(backend, worker_id="survivor", lease_seconds=5, poll_interval=0.01)
+    handled = []
+    processed = survivor.drain("run@0#0", ["alice"], handled.append)
+
+    assert processed == ["alice"] and handled == ["alice"]
+    # 原持有者的租约已被接管, 不能再标记完成
+    assert not backend.complete("run@0#0", "alice", crashed.worker_id)
+    assert backend.outstanding("run@0#0", 3) == 0
+
+
+def test_live_lease_is_not_claimed_twice():
+    backend = core.MemoryQueueBackend()
+    backend.seed("run@0#0", ["alice"])
+    assert backend.claim("run@0#0", "a", 60, 3) == "alice"
+    assert backend.claim("run@0#0", "b", 60, 3) is None
+    assert backend.outstanding("run@0#0", 3) == 1
+
+
+def test_nodes_starting_together_share_one_run():
+    backend = core.MemoryQueueBackend()
+    first = core.WorkQueue(backend, worker_id="a", join_window=60)
+    second = core.WorkQueue(backend, worker_id="b", join_window=60)
+    assert first.begin_run("2026-10-19 08:00") == second.begin_run("2026-10-19 08:00")
+
+
+def test_second_run_on_the_same_day_runs_again(make_manager, server):
+    server.add_card("101", "a1")
+    server.add_card("202", "b1")
+    manager = make_manager(work_queue=_queue(join_window=0))
+
+    assert manager.run_job(source="schedule") == "completed"
+    first_fetches = len(server.fetches)
+    assert first_fetches == 2 and len(server.signs) == 2
+
+    assert manager.run_job(source="manual") == "completed"
+    assert len(server.fetches) == 2 * first_fetches
+
+
+def test_node_joining_a_finished_run_within_the_window_does_nothing(make_manager, server):
+    backend = core.MemoryQueueBackend()
+    first = make_manager(work_queue=core.WorkQueue(backend, worker_id="a", join_window=60, poll_interval=0.01))
+    second = make_manager(work_queue=core.WorkQueue(backend, worker_id="b", join_window=60, poll_interval=0.01))
+
+    first.run_job(source="schedule")
+    fetches = len(server.fetches)
+    second.run_job(source="schedule")
+
+    assert len(server.fetches) == fetches
+
+
+def test_retry_requeues_only_accounts_that_need_it(make_manager, server):
+    server.add_card("101", "a1")
+    server.add_card("202", "b1")
+    server.failing.add("a1")
+    manager = make_manager(work_queue=_queue())
+
+    assert manager.run_check_flow() is True
+    server.failing.clear()
+    server.fetches.clear()
+
+    manager._attempt = 1
+    assert manager.run_check_flow() is False
+    assert server.fetches == [("cookie-a", "101")]
@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+
+import core
+
+
+def _run_all(manager):
+    groups, _ = manager._compile_tasks()
+    return [r for group in groups for r in manager._run_group(group)]
+
+
+def test_ledger_skips_signs_already_made_by_an_earlier_run(make_manager, server):
+    server.add_card("101", "a1")
+    assert make_manager().run_job(source="schedule") == "completed"
+    assert server.signs == [("cookie-a", "101", "a1")]
+
+    # 页面仍列出已成功的签到 (例如服务器延迟刷新); 新进程从账本文件恢复
+    server.add_card("101", "a1")
+    manager = make_manager()
+    results = _run_all(manager)
+
+    assert server.signs == [("cookie-a", "101", "a1")]
+    assert [(r.status, r.sign_id) for r in results if r.account == "alice"] == [(core.TaskResult.SKIPPED, "a1")]
+
+
+def test_open_breaker_defers_remaining_work(make_manager, server):
+    server.add_card("101", "a1")
+    server.add_card("202", "b1")
+    manager = make_manager()
+    manager.breaker.failure_threshold = 1
+    server.unreachable = True
+
+    results = _run_all(manager)
+
+    assert [r.status for r in results] == [core.TaskResult.DEFERRED] * 2
+    assert {r.message for r in results} == {core.CheckInManager.DEFER_CIRCUIT}
+    # 熔断后第二个账号不再发起请求
+    assert len(server.fetches) == 0 and server.signs == []
+    assert manager.breaker.snapshot()["state"] == core.CircuitBreaker.OPEN
+    assert all(manager._needs_retry(r) for r in results)
+
+
+def test_warm_up_is_skipped_in_process_mode(make_manager, server, monkeypatch):
+    manager = make_manager()
+    monkeypatch.setitem(manager.cfg.data, "workers", 2)
+    assert manager.warm_up() == 0
+    assert len(manager.client_pool) == 0
+
+
+def test_warm_up_is_capped_at_the_pool_size(make_manager, server, monkeypatch):
+    monkeypatch.setattr("socket.getaddrinfo", lambda *args, **kwargs: [])
+    manager = make_manager()
+    manager.client_pool.max_size = 1
+    # bob 的签到最先截止, 应优先预热
+    soon = core.PunchCard("b1", class_id="202", close_time=datetime.now() + timedelta(minutes=5))
+    manager.page_cache.put(("cookie-b", "202"), None, None, "digest", [soon])
+
+    assert manager.warm_up() == 1
+    assert len(manager.client_pool) == 1
+    client = manager.client_pool.get("bob", "cookie-b", "202")
+    assert client.warmed and not client.closed
@@ -0,0 +1,58 @@
+import time
+from datetime import datetime, timedelta
+
+import core
+
+
+def _target(watcher, acc_name):
+    watcher._rebuild()
+    return next(t for t in watcher._targets.values() if t.acc_name == acc_name)
+
+
+def test_new_card_is_signed_once(make_manager, server):
+    manager = make_manager()
+    watcher = core.ClassWatcher(manager, min_interval=1)
+    target = _target(watcher, "alice")
+
+    server.add_card("101", "s1")
+    watcher._poll(target)
+    watcher._poll(target)
+
+    assert server.signs == [("cookie-a", "101", "s1")]
+    assert watcher.hits == 1
+
+
+def test_card_not_yet_open_is_signed_after_it_opens(make_manager, server):
+    manager = make_manager()
+    watcher = core.ClassWatcher(manager, min_interval=1, active_max_interval=600, max_interval=600)
+    target = _target(watcher, "alice")
+
+    opens_at = datetime.now() + timedelta(seconds=30)
+    server.add_card("101", "s1", open_time=opens_at)
+    watcher._poll(target)
+
+    assert server.signs == []
+    assert "s1" in target.failed
+    # 下次轮询不晚于签到开放时间, 不受退避间隔影响
+    assert target.due <= time.monotonic() + 31
+
+    server.cards["101"][0].open_time = datetime.now() - timedelta(seconds=1)
+    watcher._poll(target)
+
+    assert server.signs == [("cookie-a", "101", "s1")]
+    assert target.failed == set()
+
+
+def test_failed_sign_is_retried_on_next_poll(make_manager, server):
+    manager = make_manager()
+    watcher = core.ClassWatcher(manager, min_interval=1)
+    target = _target(watcher, "alice")
+
+    server.add_card("101", "s1")
+    server.failing.add("s1")
+    watcher._poll(target)
+    server.failing.clear()
+    watcher._poll(target)
+
+    assert [s[2] for s in server.signs] == ["s1", "s1"]
+    assert target.failed == set()